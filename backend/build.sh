@@ -9,6 +9,15 @@ pip install -r requirements.txt
 # Run migrations
 python manage.py migrate --noinput
 
+# Create the shared cache table (request coalescing across workers)
+python manage.py createcachetable
+
+# Build the ML feature store for existing projects (kept up to date by signals afterwards)
+python manage.py refresh_project_features
+
+# Export ML models to the memory-mapped artifact format (shared by all workers)
+python manage.py export_models --verify
+
 # Collect static files
 python manage.py collectstatic --noinput --clear
 
@@ -30,6 +30,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Carte d'identité par requête pour les mises à jour en cascade (lot -> chantier -> projet)
+    'projects.identity_map.IdentityMapMiddleware',
 ]
 
 ROOT_URLCONF = 'buildflow_api.urls'
@@ -90,8 +92,9 @@ if not DEBUG:
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
-    # Désactiver l'authentification automatique DRF pour éviter les 500 liés au modèle User par défaut
-    'DEFAULT_AUTHENTICATION_CLASSES': (),
+    # Authentification par jeton JWT uniquement, sans le modèle User par défaut : request.user est
+    # construit depuis les claims du jeton, sans requête en base (projects.authentication)
+    'DEFAULT_AUTHENTICATION_CLASSES': ('projects.authentication.JWTPrincipalAuthentication',),
     'COERCE_DECIMAL_TO_STRING': True,  # Convertir DecimalField en string pour JSON
 }
 
@@ -127,6 +130,61 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',  # Claim personnalisé pour user_id
 }
 
+# Modèles ML : pickle d'entraînement et artefacts versionnés exportés par `manage.py export_models`
+ML_MODELS_PATH = BASE_DIR / 'buildflow_models.pkl'
+ML_ARTIFACTS_DIR = Path(os.environ.get('ML_ARTIFACTS_DIR', BASE_DIR / 'ml_artifacts'))
+# Intervalle (secondes) de vérification d'une nouvelle version publiée ; 0 désactive le rechargement à chaud
+ML_RELOAD_INTERVAL = float(os.environ.get('ML_RELOAD_INTERVAL', 30))
+# Variantes de modèles par IA.modele : {modele: répertoire d'artefacts ou .pkl (relatif à ML_ARTIFACTS_DIR)}
+# ; à défaut ML_ARTIFACTS_DIR/<modele>/ est utilisé s'il contient un artefact publié
+ML_MODEL_REGISTRY = {}
+# Nombre maximal de variantes gardées en mémoire par worker
+ML_MODEL_REGISTRY_SIZE = int(os.environ.get('ML_MODEL_REGISTRY_SIZE', 4))
+# Serveur d'inférence local avec micro-batching (`manage.py run_inference_server`) ; vide = scoring en process
+ML_INFERENCE_SOCKET = os.environ.get('ML_INFERENCE_SOCKET', '')
+ML_INFERENCE_TIMEOUT = float(os.environ.get('ML_INFERENCE_TIMEOUT', 0.5))
+# Lots de plus de N lignes : forêt scikit-learn d'origine (pickle) ou découpage (artefact) ;
+# point de bascule mesuré par `manage.py benchmark_forest`
+ML_FOREST_BATCH_THRESHOLD = int(os.environ.get('ML_FOREST_BATCH_THRESHOLD', 500))
+
+# Caches : 'default' local au worker ; 'shared' commun à tous les workers (single-flight des analyses IA)
+# Table créée par `python manage.py createcachetable`
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'buildflow_shared_cache',
+    },
+}
+# Attente maximale (secondes) d'un calcul identique en cours avant de calculer soi-même
+SINGLEFLIGHT_TIMEOUT = 30
+# Prédictions avec latency_budget_ms : durée de vie des résultats ML en cache et threads de calcul en arrière-plan
+ML_PREDICTION_CACHE_TTL = 300
+ML_BACKGROUND_WORKERS = 2
+# Recommandations historiques : nombre de projets terminés similaires et intervalle (secondes)
+# de resynchronisation de l'index avec les modifications faites par les autres workers
+ML_SIMILARITY_K = 5
+ML_SIMILARITY_SYNC_INTERVAL = 60
+# Jeton de l'endpoint interne GET /api/ia/metrics/ (en-tête X-Metrics-Token) ; vide = accessible seulement en DEBUG
+ML_METRICS_TOKEN = os.environ.get('ML_METRICS_TOKEN', '')
+# Analyses asynchrones (full_analysis avec async) : threads de calcul par worker, durée de conservation
+# d'un résultat et durée maximale d'un job en attente ou en cours (secondes)
+ANALYSIS_JOB_WORKERS = 1
+ANALYSIS_JOB_TTL = 3600
+ANALYSIS_JOB_TIMEOUT = 600
+# Chemin critique : nombre de projets dont l'ordonnancement est gardé en mémoire par worker
+SCHEDULING_CACHE_SIZE = 32
+# Authentification : durée (secondes) du cache de l'Utilisateur complet chargé depuis le jeton JWT
+AUTH_USER_CACHE_TTL = 60
+# Connexion : échecs autorisés par adresse IP et par compte sur une fenêtre de LOGIN_THROTTLE_WINDOW
+# secondes (au-delà : 429), et nombre de proxys de confiance devant l'application (X-Forwarded-For)
+LOGIN_THROTTLE_WINDOW = 300
+LOGIN_THROTTLE_IP_FAILURES = 20
+LOGIN_THROTTLE_ACCOUNT_FAILURES = 5
+LOGIN_PROXY_COUNT = int(os.environ.get('LOGIN_PROXY_COUNT', 0))
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -1,10 +1,10 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from .models import (
-    Projet, Chantier, Lot, Tache,
+    Projet, Chantier, Lot, Tache, TacheDependance,
     Utilisateur, IA, Alerte, Budget, Rapport,
     Ressource, RessourceHumaine, RessourceMaterielle, Fournisseur,
-    ContactMessage
+    ContactMessage, RiskSnapshot, ProjetFeatures, AnalysisJob
 )
 
 
@@ -348,3 +348,43 @@ class ContactMessageAdmin(admin.ModelAdmin):
 admin.site.site_header = "Yoonu-Tabax Administration"
 admin.site.site_title = "Yoonu-Tabax Admin"
 admin.site.index_title = "Gestion de la plateforme Yoonu-Tabax"
+
+
+# ===== INSTANTANÉ DE RISQUE =====
+@admin.register(RiskSnapshot)
+class RiskSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('projet', 'date', 'risk_level', 'risk_score', 'delay_score', 'budget_score', 'days_delay', 'model_version')
+    list_filter = ('risk_level', 'date', 'model_version')
+    search_fields = ('projet__name',)
+    readonly_fields = ('created_at',)
+    raw_id_fields = ('projet',)
+    date_hierarchy = 'date'
+
+
+# ===== FEATURE STORE ML =====
+@admin.register(ProjetFeatures)
+class ProjetFeaturesAdmin(admin.ModelAdmin):
+    list_display = ('projet', 'nb_chantiers', 'nb_taches', 'nb_taches_terminees', 'nb_taches_en_retard', 'budget_utilise', 'avancement', 'date_reference')
+    list_filter = ('date_reference',)
+    search_fields = ('projet__name',)
+    readonly_fields = ('updated_at',)
+    raw_id_fields = ('projet',)
+
+
+# ===== DÉPENDANCES ENTRE TÂCHES =====
+@admin.register(TacheDependance)
+class TacheDependanceAdmin(admin.ModelAdmin):
+    list_display = ('predecesseur', 'successeur', 'decalage', 'created_at')
+    search_fields = ('predecesseur__name', 'successeur__name')
+    readonly_fields = ('created_at', 'updated_at')
+    raw_id_fields = ('predecesseur', 'successeur')
+
+
+# ===== ANALYSES ASYNCHRONES =====
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'projet', 'ia', 'status', 'created_at', 'finished_at', 'expires_at')
+    list_filter = ('status',)
+    search_fields = ('projet__name', 'cle')
+    readonly_fields = ('cle', 'parametres', 'result', 'error', 'created_at', 'started_at', 'finished_at', 'expires_at')
+    raw_id_fields = ('projet', 'ia')
@@ -0,0 +1,194 @@
+"""
+Analyses complètes asynchrones (IAViewSet.full_analysis avec `async`)
+
+Sur un worker gunicorn synchrone, l'analyse d'un gros projet bloque le worker pendant
+tout le calcul. En mode asynchrone, la requête crée un AnalysisJob et répond 202 ;
+l'analyse est exécutée par un petit pool de threads du worker
+(ANALYSIS_JOB_WORKERS) et son résultat est stocké en base, consultable par
+GET /api/ia/jobs/<id>/ (tous les workers lisent la même table).
+
+Réutilisation : la clé d'un job combine l'IA, la version de ses modèles, le projet dans
+sa version (dernières modifications du projet et de ses agrégats ProjetFeatures, tenus
+à jour par les tâches et chantiers) et les paramètres. Une demande identique reprend le
+job en attente, en cours ou terminé au lieu d'en lancer un nouveau ; une contrainte
+d'unicité sur les jobs actifs couvre les demandes simultanées de plusieurs workers.
+
+Durées de vie :
+- un job terminé (ou en échec) est gardé ANALYSIS_JOB_TTL secondes puis supprimé ;
+- un job en attente ou en cours depuis plus de ANALYSIS_JOB_TIMEOUT secondes (worker
+  redémarré pendant le calcul) passe en échec et ne bloque plus une nouvelle demande.
+"""
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .feature_store import version_projet
+from .ml_deadline import predict_within
+
+logger = logging.getLogger(__name__)
+
+ACTIFS = ('pending', 'running')
+TERMINES = ('succeeded', 'failed')
+DEFAULT_TTL = 3600
+DEFAULT_TIMEOUT = 600
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(getattr(settings, 'ANALYSIS_JOB_WORKERS', 1)),
+                thread_name_prefix='analysis-job',
+            )
+        return _executor
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, 'ANALYSIS_JOB_TTL', DEFAULT_TTL)))
+
+
+def _timeout() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, 'ANALYSIS_JOB_TIMEOUT', DEFAULT_TIMEOUT)))
+
+
+def analyse_complete(ia, projet, latency_budget_ms: Optional[float] = None, explain: bool = False) -> Dict:
+    """Prédictions de retard et de budget, recommandations et synthèse d'un projet"""
+    # Budget de latence commun aux deux modèles
+    predictions = predict_within(ia, projet, ['delay', 'budget'], latency_budget_ms, explain)
+    delay_prediction = predictions['delay']
+    budget_prediction = predictions['budget']
+    recommendations = ia.generate_recommendations(
+        projet,
+        delay_prediction=delay_prediction,
+        budget_prediction=budget_prediction
+    )
+    return {
+        'projet_id': str(projet.id),
+        'projet_name': projet.name,
+        'delay_prediction': delay_prediction,
+        'budget_prediction': budget_prediction,
+        'recommendations': recommendations,
+        'degraded': bool(delay_prediction.get('degraded') or budget_prediction.get('degraded')),
+        'summary': {
+            'delay_risk_level': delay_prediction.get('risk_level', 'moyen'),
+            'budget_risk_level': budget_prediction.get('risk_level', 'moyen'),
+            'total_recommendations': len(recommendations),
+            'high_priority_recommendations': len([r for r in recommendations if r.get('priority') == 'high'])
+        }
+    }
+
+
+def job_key(ia, projet, parametres: Dict) -> str:
+    model_version = ia.get_ml_service().model_version or 'none'
+    raw = json.dumps(
+        [str(ia.pk), ia.modele, model_version, str(projet.pk), version_projet(projet), parametres],
+        sort_keys=True,
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _json(value):
+    """Résultat converti en JSON natif (les scalaires NumPy ne sont pas sérialisables tels quels)"""
+    return json.loads(json.dumps(value, default=lambda o: o.item() if hasattr(o, 'item') else str(o)))
+
+
+def purger(now=None) -> None:
+    """Jobs actifs trop anciens passés en échec, jobs terminés expirés supprimés"""
+    from .models import AnalysisJob
+
+    now = now or timezone.now()
+    AnalysisJob.objects.filter(status__in=ACTIFS, expires_at__lte=now).update(
+        status='failed', error="Délai d'exécution dépassé", finished_at=now, expires_at=now + _ttl()
+    )
+    AnalysisJob.objects.filter(status__in=TERMINES, expires_at__lte=now).delete()
+
+
+def soumettre(ia, projet, latency_budget_ms: Optional[float] = None, explain: bool = False) -> Tuple[object, bool]:
+    """
+    Job d'analyse du projet : job existant de même clé (en attente, en cours ou terminé avec
+    succès) ou nouveau job lancé en arrière-plan. Retourne (job, créé).
+    """
+    from .models import AnalysisJob
+
+    now = timezone.now()
+    purger(now)
+    parametres = {'latency_budget_ms': latency_budget_ms, 'explain': explain}
+    cle = job_key(ia, projet, parametres)
+
+    existant = (
+        AnalysisJob.objects.filter(cle=cle, status__in=ACTIFS + ('succeeded',), expires_at__gt=now)
+        .order_by('-created_at').first()
+    )
+    if existant is not None:
+        return existant, False
+
+    try:
+        with transaction.atomic():
+            job = AnalysisJob.objects.create(
+                ia=ia, projet=projet, cle=cle, parametres=parametres, expires_at=now + _timeout(),
+            )
+    except IntegrityError:
+        # Job créé entre-temps par une demande concurrente (autre worker)
+        job = AnalysisJob.objects.filter(cle=cle, status__in=ACTIFS).first()
+        if job is None:
+            raise
+        return job, False
+
+    transaction.on_commit(lambda: _get_executor().submit(executer, job.pk))
+    return job, True
+
+
+def executer(job_id) -> None:
+    """Exécute un job en attente (thread du pool) ; un job déjà pris ou expiré est ignoré"""
+    from .models import AnalysisJob
+
+    try:
+        pris = AnalysisJob.objects.filter(pk=job_id, status='pending').update(
+            status='running', started_at=timezone.now()
+        )
+        if not pris:
+            return
+        job = AnalysisJob.objects.select_related('ia', 'projet').get(pk=job_id)
+        try:
+            result = _json(analyse_complete(job.ia, job.projet, **job.parametres))
+            fin = timezone.now()
+            AnalysisJob.objects.filter(pk=job_id, status='running').update(
+                status='succeeded', result=result, finished_at=fin, expires_at=fin + _ttl()
+            )
+        except Exception as e:
+            import traceback
+            logger.error(f"Erreur dans le job d'analyse {job_id}: {str(e)}")
+            logger.error(traceback.format_exc())
+            fin = timezone.now()
+            AnalysisJob.objects.filter(pk=job_id, status='running').update(
+                status='failed', error=str(e), finished_at=fin, expires_at=fin + _ttl()
+            )
+    except Exception as e:
+        logger.error(f"Job d'analyse {job_id} non exécuté: {str(e)}")
+    finally:
+        # Chaque thread du pool a sa propre connexion : ne pas la laisser ouverte entre deux jobs
+        connection.close()
+
+
+def lire(job_id):
+    """Job non expiré d'identifiant `job_id`, ou None"""
+    from django.core.exceptions import ValidationError
+    from .models import AnalysisJob
+
+    purger()
+    try:
+        return AnalysisJob.objects.filter(pk=job_id).first()
+    except (ValidationError, ValueError):
+        return None
@@ -0,0 +1,153 @@
+"""
+Authentification JWT sans requête en base
+
+`login` place dans le jeton d'accès les claims user_id, email, role et is_approved.
+JWTPrincipalAuthentication valide le jeton (signature, expiration, type 'access') et
+construit à partir de ces claims un JWTPrincipal, disponible dans request.user :
+une requête authentifiée ne coûte aucune requête SQL.
+
+Le modèle Utilisateur complet n'est chargé que si une vue le demande
+(principal.utilisateur), avec un petit cache à durée de vie (AUTH_USER_CACHE_TTL) dans
+le cache 'shared' (commun aux workers ; cache local s'il est indisponible), invalidé à
+l'enregistrement ou la suppression de l'utilisateur.
+
+Les claims restent valides jusqu'à l'expiration du jeton (ACCESS_TOKEN_LIFETIME) : un
+changement de rôle, un rejet ou une désactivation n'est vu qu'au jeton suivant. Les
+vues qui modifient des données revérifient donc le compte (principal.verifier_compte()).
+
+Toutes les vues sont en AllowAny : un jeton absent, invalide ou expiré donne une
+requête anonyme, et les vues réservées répondent 403 comme auparavant.
+"""
+import logging
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import BaseAuthentication
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_CACHE_TTL = 60
+SHARED_CACHE_ALIAS = 'shared'
+FALLBACK_CACHE_ALIAS = 'default'
+AUTH_HEADER_PREFIX = 'Bearer'
+
+
+def _cle_cache(user_id) -> str:
+    return f'auth:utilisateur:{user_id}'
+
+
+def _executer(operation, defaut=None):
+    """Opération sur le cache partagé, sur le cache local du worker si le premier échoue"""
+    try:
+        return operation(caches[SHARED_CACHE_ALIAS])
+    except Exception as e:
+        logger.warning(f"Cache partagé indisponible pour l'authentification: {str(e)}")
+    try:
+        return operation(caches[FALLBACK_CACHE_ALIAS])
+    except Exception as e:
+        logger.error(f"Cache d'authentification indisponible: {str(e)}")
+        return defaut
+
+
+class JWTPrincipal:
+    """Utilisateur authentifié tel que décrit par les claims du jeton"""
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id: str, email: str = '', role: str = '', is_approved: bool = True, token=None):
+        self.id = id
+        self.email = email
+        self.role = role
+        self.is_approved = is_approved
+        self.token = token
+
+    @property
+    def pk(self) -> str:
+        return self.id
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == 'ADMINISTRATEUR'
+
+    @classmethod
+    def from_token(cls, token) -> Optional['JWTPrincipal']:
+        user_id = token.get(getattr(settings, 'SIMPLE_JWT', {}).get('USER_ID_CLAIM', 'user_id'))
+        if not user_id:
+            return None
+        return cls(
+            id=str(user_id),
+            email=token.get('email', ''),
+            role=token.get('role', ''),
+            # Jetons émis avant l'ajout du claim : login ne délivre de jeton qu'aux comptes validés
+            is_approved=bool(token.get('is_approved', True)),
+            token=token,
+        )
+
+    @property
+    def utilisateur(self):
+        """Utilisateur complet (None s'il a été supprimé), lu au plus une fois par AUTH_USER_CACHE_TTL"""
+        if not hasattr(self, '_utilisateur'):
+            self._utilisateur = charger_utilisateur(self.id)
+        return self._utilisateur
+
+    def verifier_compte(self):
+        """
+        Utilisateur complet si le compte confirme les claims du jeton (actif, même rôle,
+        validé ou administrateur), sinon None. À appeler avant une écriture.
+        """
+        utilisateur = self.utilisateur
+        if utilisateur is None or not utilisateur.is_active or utilisateur.role != self.role:
+            return None
+        if utilisateur.role != 'ADMINISTRATEUR' and not utilisateur.is_approved:
+            return None
+        return utilisateur
+
+    def __str__(self) -> str:
+        return self.email or self.id
+
+
+def charger_utilisateur(user_id):
+    from .models import Utilisateur
+
+    cle = _cle_cache(user_id)
+    utilisateur = _executer(lambda cache: cache.get(cle))
+    if utilisateur is None:
+        utilisateur = Utilisateur.objects.filter(pk=user_id).first()
+        if utilisateur is not None:
+            timeout = int(getattr(settings, 'AUTH_USER_CACHE_TTL', DEFAULT_USER_CACHE_TTL))
+            _executer(lambda cache: cache.set(cle, utilisateur, timeout=timeout))
+    return utilisateur
+
+
+def oublier_utilisateur(user_id) -> None:
+    """Retire l'utilisateur du cache (appelé à l'enregistrement / la suppression d'un Utilisateur)"""
+    cle = _cle_cache(user_id)
+    _executer(lambda cache: cache.delete(cle))
+
+
+class JWTPrincipalAuthentication(BaseAuthentication):
+    """Authentification DRF par jeton d'accès JWT (en-tête Authorization: Bearer <jeton>)"""
+
+    def authenticate(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        parts = header.split()
+        if len(parts) != 2 or parts[0] != AUTH_HEADER_PREFIX:
+            return None
+
+        from rest_framework_simplejwt.exceptions import TokenError
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        try:
+            token = AccessToken(parts[1])
+        except TokenError as e:
+            logger.debug(f"Jeton JWT refusé: {str(e)}")
+            return None
+        principal = JWTPrincipal.from_token(token)
+        if principal is None:
+            return None
+        return principal, token
+
+    def authenticate_header(self, request):
+        return AUTH_HEADER_PREFIX
@@ -0,0 +1,247 @@
+"""
+Indicateurs de la valeur acquise (EVM) par chantier, projet et portefeuille
+
+Calculés par agrégats SQL groupés par chantier (une requête sur les tâches, une sur les
+chantiers, une sur les projets), quel que soit le nombre de projets :
+- BAC (budget à l'achèvement) : somme des coûts des tâches du chantier ;
+- PV (valeur planifiée) : coût x fraction écoulée de la période prévue de la tâche à la
+  date d'évaluation (0 avant son début, 1 après sa fin ; dates du lot à défaut) ;
+- EV (valeur acquise) : par défaut règle 0/100, coût des seules tâches terminées
+  (ev_method='completed') ; en option, coût x avancement déclaré de la tâche
+  (ev_method='percent_complete', 100 % si 'Terminé'), qui crédite le travail en cours
+  sur la seule déclaration de progress ;
+- AC (coût réel) : budget consommé du chantier (Chantier.budget_used).
+AC et BAC ne viennent pas de la même source : AC est saisi au niveau du chantier, BAC
+somme les coûts prévus des tâches. CV et CPI comparent donc deux bases distinctes ; la
+réponse le rappelle dans `cost_basis`.
+Un chantier dont les tâches n'ont pas de coût est évalué sur son budget, réparti à parts
+égales entre ses tâches (base 'chantier_budget').
+
+Indicateurs dérivés : SV = EV - PV, CV = EV - AC, SPI = EV / PV, CPI = EV / AC,
+EAC = BAC / CPI (BAC tant que rien n'est dépensé), ETC = EAC - AC, VAC = BAC - EAC.
+Les cumuls projet et portefeuille somment BAC, PV, EV et AC avant de recalculer les
+indices (pas de moyenne d'indices).
+"""
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+from django.db.models import Case, Count, F, FloatField, Func, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest, Least
+
+STATUT_TERMINE = 'Terminé'
+MONTANTS = ('bac', 'pv', 'ev', 'ac')
+
+EV_TERMINEES = 'completed'
+EV_AVANCEMENT = 'percent_complete'
+METHODES_EV = (EV_TERMINEES, EV_AVANCEMENT)
+
+BASES_COUTS = {
+    'bac': "Somme des coûts prévus des tâches (Tache.cost), ou budget du chantier si ses tâches n'ont pas de coût",
+    'ac': "Budget consommé saisi sur le chantier (Chantier.budget_used), sans lien avec les coûts des tâches",
+    'note': "AC et BAC proviennent de sources différentes : CV et CPI sont à interpréter avec prudence",
+}
+
+
+class JoursEntre(Func):
+    """Nombre de jours (réel) entre deux dates, selon le moteur de base de données"""
+    arity = 2
+    output_field = FloatField()
+
+    def __init__(self, debut, fin, **extra):
+        # Arguments stockés dans l'ordre (fin, début) : les templates calculent fin - début
+        super().__init__(fin, debut, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL : date - date donne un entier de jours
+        return super().as_sql(compiler, connection, template='CAST((%(expressions)s) AS double precision)',
+                              arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='(julianday(%(expressions)s))',
+                              arg_joiner=') - julianday(', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='DATEDIFF(%(expressions)s)', arg_joiner=', ',
+                              **extra_context)
+
+
+def _fraction_planifiee(today: date):
+    """Fraction écoulée de la période prévue de chaque tâche à `today` (0 à 1)"""
+    debut = Coalesce('start_date', 'lot__start_date')
+    fin = Coalesce('end_date', 'lot__end_date')
+    jour = Value(today)
+    return Case(
+        When(Q(end_date__lte=today) | Q(end_date__isnull=True, lot__end_date__lte=today), then=Value(1.0)),
+        When(Q(start_date__gte=today) | Q(start_date__isnull=True, lot__start_date__gte=today), then=Value(0.0)),
+        default=JoursEntre(debut, jour) / JoursEntre(debut, fin),
+        output_field=FloatField(),
+    )
+
+
+def _fraction_acquise(ev_method: str = EV_TERMINEES):
+    """
+    Part acquise de chaque tâche (0 à 1) : 1 pour une tâche terminée, 0 sinon, ou son
+    avancement déclaré avec EV_AVANCEMENT
+    """
+    if ev_method == EV_AVANCEMENT:
+        en_cours = Least(Greatest(F('progress'), Value(0.0)), Value(100.0)) / Value(100.0)
+    else:
+        en_cours = Value(0.0)
+    return Case(
+        When(status=STATUT_TERMINE, then=Value(1.0)),
+        default=en_cours,
+        output_field=FloatField(),
+    )
+
+
+def indicateurs(bac: float, pv: float, ev: float, ac: float) -> Dict:
+    """Indicateurs EVM dérivés des quatre montants de base"""
+    spi = ev / pv if pv > 0 else None
+    cpi = ev / ac if ac > 0 else None
+    eac = bac / cpi if cpi else bac
+    return {
+        'bac': round(bac, 2),
+        'pv': round(pv, 2),
+        'ev': round(ev, 2),
+        'ac': round(ac, 2),
+        'sv': round(ev - pv, 2),
+        'cv': round(ev - ac, 2),
+        'spi': round(spi, 4) if spi is not None else None,
+        'cpi': round(cpi, 4) if cpi is not None else None,
+        'eac': round(eac, 2),
+        'etc': round(max(eac - ac, 0), 2),
+        'vac': round(bac - eac, 2),
+    }
+
+
+def _montants_chantiers(chantier_filter: Q, today: date, ev_method: str) -> Dict:
+    """{chantier_id: {nb_taches, bac, pv, ev, pv_taches, ev_taches}} à partir des tâches, en une requête groupée"""
+    from .models import Tache
+
+    fraction_planifiee = _fraction_planifiee(today)
+    fraction_acquise = _fraction_acquise(ev_method)
+    cout = Cast('cost', FloatField())
+    lignes = (
+        Tache.objects.filter(chantier_filter)
+        .values('lot__chantier_id')
+        .annotate(
+            nb_taches=Count('id'),
+            bac=Sum(cout),
+            pv=Sum(cout * fraction_planifiee, output_field=FloatField()),
+            ev=Sum(cout * fraction_acquise, output_field=FloatField()),
+            pv_taches=Sum(fraction_planifiee),
+            ev_taches=Sum(fraction_acquise),
+        )
+    )
+    return {ligne['lot__chantier_id']: ligne for ligne in lignes}
+
+
+def _cumuler(total: Dict, montants: Dict) -> None:
+    for champ in MONTANTS:
+        total[champ] += montants[champ]
+
+
+def calculer_evm(projet_ids: Optional[Iterable] = None, chantier_ids: Optional[Iterable] = None,
+        today: Optional[date] = None, ev_method: str = EV_TERMINEES) -> Dict:
+    """
+    EVM des chantiers, des projets et du portefeuille (projets de `projet_ids`, ou projets des
+    chantiers de `chantier_ids`, ou tous les projets)
+    """
+    from .models import Chantier, Projet
+
+    today = today or date.today()
+    projets = Projet.objects.all()
+    chantiers = Chantier.objects.all()
+    filtre_taches = Q()
+    if projet_ids is not None:
+        projet_ids = list(projet_ids)
+        projets = projets.filter(id__in=projet_ids)
+        chantiers = chantiers.filter(projet_id__in=projet_ids)
+        filtre_taches = Q(lot__chantier__projet_id__in=projet_ids)
+    if chantier_ids is not None:
+        chantier_ids = list(chantier_ids)
+        projets = projets.filter(chantiers__id__in=chantier_ids).distinct()
+        chantiers = chantiers.filter(id__in=chantier_ids)
+        filtre_taches &= Q(lot__chantier_id__in=chantier_ids)
+
+    montants_taches = _montants_chantiers(filtre_taches, today, ev_method)
+    resultat_projets = {
+        ligne['id']: {'projet_id': str(ligne['id']), 'name': ligne['name'], 'chantiers': [],
+                      'totaux': dict.fromkeys(MONTANTS, 0.0)}
+        for ligne in projets.values('id', 'name').order_by('name')
+    }
+    portefeuille = dict.fromkeys(MONTANTS, 0.0)
+
+    for chantier in chantiers.values('id', 'projet_id', 'name', 'budget', 'budget_used').order_by('name'):
+        taches = montants_taches.get(chantier['id'], {})
+        nb_taches = taches.get('nb_taches', 0)
+        budget = float(chantier['budget'] or 0)
+        montants = {'bac': float(taches.get('bac') or 0), 'pv': float(taches.get('pv') or 0),
+                    'ev': float(taches.get('ev') or 0), 'ac': float(chantier['budget_used'] or 0)}
+        base = 'task_cost'
+        if montants['bac'] <= 0 and budget > 0:
+            # Tâches sans coût : budget du chantier réparti à parts égales entre les tâches
+            base = 'chantier_budget'
+            montants['bac'] = budget
+            montants['pv'] = budget * float(taches.get('pv_taches') or 0) / nb_taches if nb_taches else 0.0
+            montants['ev'] = budget * float(taches.get('ev_taches') or 0) / nb_taches if nb_taches else 0.0
+
+        projet = resultat_projets.get(chantier['projet_id'])
+        if projet is None:
+            continue
+        entree = {'chantier_id': str(chantier['id']), 'name': chantier['name'], 'basis': base,
+                  'task_count': nb_taches, 'budget': round(budget, 2)}
+        entree.update(indicateurs(**montants))
+        projet['chantiers'].append(entree)
+        _cumuler(projet['totaux'], montants)
+        _cumuler(portefeuille, montants)
+
+    projets_resultat = []
+    for projet in resultat_projets.values():
+        totaux = projet.pop('totaux')
+        projet.update(indicateurs(**totaux))
+        projets_resultat.append(projet)
+
+    return {
+        'date': today.isoformat(),
+        'ev_method': ev_method,
+        'cost_basis': BASES_COUTS,
+        'portfolio': dict(indicateurs(**portefeuille), project_count=len(projets_resultat)),
+        'projects': projets_resultat,
+    }
+
+
+def _contexte(resultat: Dict) -> Dict:
+    return {champ: resultat[champ] for champ in ('date', 'ev_method', 'cost_basis')}
+
+
+def evm_projet(projet, today: Optional[date] = None, ev_method: str = EV_TERMINEES) -> Dict:
+    """EVM d'un projet et de ses chantiers"""
+    resultat = calculer_evm(projet_ids=[projet.pk], today=today, ev_method=ev_method)
+    projet_evm = resultat['projects'][0] if resultat['projects'] else {'projet_id': str(projet.pk), 'chantiers': []}
+    return dict(projet_evm, **_contexte(resultat))
+
+
+def evm_chantier(chantier, today: Optional[date] = None, ev_method: str = EV_TERMINEES) -> Dict:
+    """EVM d'un chantier"""
+    resultat = calculer_evm(chantier_ids=[chantier.pk], today=today, ev_method=ev_method)
+    for projet in resultat['projects']:
+        for entree in projet['chantiers']:
+            return dict(entree, projet_id=projet['projet_id'], **_contexte(resultat))
+    return dict({'chantier_id': str(chantier.pk)}, **_contexte(resultat))
+
+
+def parse_date(value) -> Optional[date]:
+    """Date d'évaluation (ISO) ; None si absente, ValueError si invalide"""
+    if value in (None, ''):
+        return None
+    return date.fromisoformat(str(value))
+
+
+def parse_ev_method(value) -> str:
+    """Méthode de calcul de EV ; EV_TERMINEES si absente, ValueError si inconnue"""
+    if value in (None, ''):
+        return EV_TERMINEES
+    if value not in METHODES_EV:
+        raise ValueError(value)
+    return value
@@ -0,0 +1,341 @@
+"""
+Feature store des projets (table ProjetFeatures)
+
+Les entrées du scoring ML (tâches actives / terminées / en retard, budget consommé,
+avancement) sont maintenues par deltas depuis les signaux Tache, Lot et Chantier :
+- un pre_save mémorise l'état précédent de l'objet (une requête par clé primaire,
+  évitée quand update_fields ne touche aucun champ suivi) ;
+- le post_save / post_delete applique la différence de contribution avec des
+  UPDATE ... SET champ = champ + delta (F()), sans parcourir l'arborescence.
+L'avancement (moyenne des lots puis des chantiers, comme Projet.avancement_calcule)
+est recalculé par trois requêtes agrégées quand un statut de tâche, le progress d'un
+lot ou d'un chantier, ou le rattachement d'un lot change.
+
+Le nombre de tâches en retard dépend du jour : les deltas ne s'appliquent qu'à une
+ligne calculée aujourd'hui (date_reference), sinon la ligne est recalculée en entier.
+La commande refresh_project_features recalcule tous les projets chaque nuit et
+corrige les cas non suivis (mises à jour en masse par queryset.update()).
+"""
+import logging
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import Count, F, Q, QuerySet, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STATUT_TERMINE = 'Terminé'
+
+# Champs dont la modification change la contribution d'une tâche / d'un chantier
+CHAMPS_TACHE = {'status', 'end_date', 'lot', 'lot_id'}
+CHAMPS_CHANTIER = {'budget_used', 'progress', 'projet', 'projet_id'}
+CHAMPS_LOT = {'progress', 'chantier', 'chantier_id'}
+
+FEATURE_FIELDS = [
+    'nb_chantiers', 'nb_taches', 'nb_taches_terminees', 'nb_taches_en_retard',
+    'budget_utilise', 'avancement', 'date_reference',
+]
+
+
+def contribution_tache(status, end_date, reference: date) -> Dict[str, int]:
+    termine = status == STATUT_TERMINE
+    return {
+        'nb_taches': 1,
+        'nb_taches_terminees': int(termine),
+        'nb_taches_en_retard': int(bool(end_date and end_date < reference and not termine)),
+    }
+
+
+def _suivi(update_fields, champs) -> bool:
+    return update_fields is None or bool(set(update_fields) & champs)
+
+
+# ----- Recalcul complet -----
+
+def _avancements(projet_ids: Optional[List]) -> Dict:
+    """Avancement par projet, même calcul que Projet.avancement_calcule en 3 requêtes"""
+    from .models import Chantier, Lot, Tache
+
+    chantiers = Chantier.objects.all()
+    lots = Lot.objects.all()
+    taches = Tache.objects.all()
+    if projet_ids is not None:
+        chantiers = chantiers.filter(projet_id__in=projet_ids)
+        lots = lots.filter(chantier__projet_id__in=projet_ids)
+        taches = taches.filter(lot__chantier__projet_id__in=projet_ids)
+
+    comptes = {
+        row['lot_id']: (row['total'], row['terminees'])
+        for row in taches.values('lot_id').annotate(
+            total=Count('id'), terminees=Count('id', filter=Q(status=STATUT_TERMINE))
+        )
+    }
+    lots_par_chantier = defaultdict(list)
+    for lot_id, chantier_id, progress in lots.values_list('id', 'chantier_id', 'progress'):
+        if lot_id in comptes:
+            total, terminees = comptes[lot_id]
+            valeur = round((terminees / total) * 100, 2)
+        else:
+            valeur = float(progress) if progress is not None else 0
+        lots_par_chantier[chantier_id].append(valeur)
+
+    chantiers_par_projet = defaultdict(list)
+    for chantier_id, projet_id, progress in chantiers.values_list('id', 'projet_id', 'progress'):
+        valeurs = lots_par_chantier.get(chantier_id)
+        if valeurs:
+            chantiers_par_projet[projet_id].append(round(sum(valeurs) / len(valeurs), 2))
+        else:
+            chantiers_par_projet[projet_id].append(float(progress) if progress is not None else 0)
+
+    return {
+        projet_id: round(sum(valeurs) / len(valeurs), 2)
+        for projet_id, valeurs in chantiers_par_projet.items()
+    }
+
+
+def calculer_features(projet_ids: Optional[Iterable] = None, reference: Optional[date] = None) -> Dict:
+    """
+    Calcule les agrégats de zéro pour `projet_ids` (tous les projets si None),
+    par requêtes groupées. Retourne {projet_id: {champ: valeur}}.
+    """
+    from .models import Chantier, Projet, Tache
+
+    reference = reference or date.today()
+    ids = list(projet_ids) if projet_ids is not None else None
+    projets = Projet.objects.all() if ids is None else Projet.objects.filter(id__in=ids)
+
+    features = {
+        projet_id: {
+            'nb_chantiers': 0, 'nb_taches': 0, 'nb_taches_terminees': 0, 'nb_taches_en_retard': 0,
+            'budget_utilise': Decimal('0'), 'avancement': 0.0, 'date_reference': reference,
+        }
+        for projet_id in projets.values_list('id', flat=True)
+    }
+    if not features:
+        return features
+
+    chantiers = Chantier.objects.all() if ids is None else Chantier.objects.filter(projet_id__in=ids)
+    for row in chantiers.values('projet_id').annotate(n=Count('id'), budget=Sum('budget_used')):
+        features[row['projet_id']]['nb_chantiers'] = row['n']
+        features[row['projet_id']]['budget_utilise'] = row['budget'] or Decimal('0')
+
+    taches = Tache.objects.all() if ids is None else Tache.objects.filter(lot__chantier__projet_id__in=ids)
+    non_terminee = ~Q(status=STATUT_TERMINE)
+    for row in taches.values('lot__chantier__projet_id').annotate(
+        total=Count('id'),
+        terminees=Count('id', filter=Q(status=STATUT_TERMINE)),
+        retard=Count('id', filter=Q(end_date__lt=reference) & non_terminee),
+    ):
+        projet_features = features[row['lot__chantier__projet_id']]
+        projet_features['nb_taches'] = row['total']
+        projet_features['nb_taches_terminees'] = row['terminees']
+        projet_features['nb_taches_en_retard'] = row['retard']
+
+    for projet_id, avancement in _avancements(ids).items():
+        features[projet_id]['avancement'] = avancement
+    return features
+
+
+def rafraichir(projet_ids: Optional[Iterable] = None, reference: Optional[date] = None) -> int:
+    """Recalcule et enregistre les lignes ProjetFeatures ; retourne le nombre de projets écrits"""
+    from .models import ProjetFeatures
+
+    features = calculer_features(projet_ids, reference)
+    lignes = [ProjetFeatures(projet_id=projet_id, **valeurs) for projet_id, valeurs in features.items()]
+    if lignes:
+        ProjetFeatures.objects.bulk_create(
+            lignes, batch_size=500, update_conflicts=True, unique_fields=['projet'],
+            update_fields=FEATURE_FIELDS + ['updated_at'],
+        )
+    return len(lignes)
+
+
+def version_projet(projet) -> str:
+    """
+    Version d'un projet pour les caches de résultats ML (jobs d'analyse, prédictions) :
+    dernière modification du projet et de sa ligne ProjetFeatures
+    """
+    from .models import ProjetFeatures
+
+    features_at = ProjetFeatures.objects.filter(pk=projet.pk).values_list('updated_at', flat=True).first()
+    return ':'.join(
+        value.isoformat() if value else '' for value in (getattr(projet, 'updated_at', None), features_at)
+    )
+
+
+# ----- Deltas (appelés par les signaux) -----
+
+def appliquer_delta(projet_id, deltas: Dict, recalculer_avancement: bool = False) -> None:
+    """Applique des deltas à la ligne du projet si elle est à jour du jour, sinon la recalcule"""
+    from .models import ProjetFeatures
+
+    if not projet_id:
+        return
+    updates = {champ: F(champ) + valeur for champ, valeur in deltas.items() if valeur}
+    if recalculer_avancement:
+        updates['avancement'] = _avancements([projet_id]).get(projet_id, 0)
+    if not updates:
+        return
+    # update() ne renseigne pas auto_now : updated_at sert de version (version_projet)
+    updates['updated_at'] = timezone.now()
+    modifies = ProjetFeatures.objects.filter(pk=projet_id, date_reference=date.today()).update(**updates)
+    if not modifies:
+        # Ligne absente ou calculée un autre jour (retards à réévaluer) : recalcul complet
+        rafraichir([projet_id])
+
+
+def _projet_du_lot(lot_id):
+    from .models import Lot
+    return Lot.objects.filter(pk=lot_id).values_list('chantier__projet_id', flat=True).first()
+
+
+def memoriser_tache(instance, update_fields=None) -> None:
+    """pre_save Tache : état précédent (lot, statut, échéance) pour calculer le delta"""
+    instance._features_avant = None
+    if instance._state.adding or not _suivi(update_fields, CHAMPS_TACHE):
+        return
+    from .models import Tache
+    instance._features_avant = Tache.objects.filter(pk=instance.pk).values('lot_id', 'status', 'end_date').first()
+
+
+def tache_enregistree(instance, created: bool, update_fields=None) -> None:
+    if not created and not _suivi(update_fields, CHAMPS_TACHE):
+        return
+    reference = date.today()
+    avant = getattr(instance, '_features_avant', None)
+    apres = contribution_tache(instance.status, instance.end_date, reference)
+
+    if avant is None:
+        # Création (ou tâche absente de la base avant cet enregistrement)
+        appliquer_delta(_projet_du_lot(instance.lot_id), apres, recalculer_avancement=True)
+        return
+
+    contribution_avant = contribution_tache(avant['status'], avant['end_date'], reference)
+    if avant['lot_id'] == instance.lot_id:
+        deltas = {champ: apres[champ] - contribution_avant[champ] for champ in apres}
+        appliquer_delta(_projet_du_lot(instance.lot_id), deltas, recalculer_avancement=avant['status'] != instance.status)
+        return
+
+    # Tâche déplacée vers un autre lot (éventuellement d'un autre projet)
+    projet_avant = _projet_du_lot(avant['lot_id'])
+    projet_apres = _projet_du_lot(instance.lot_id)
+    if projet_avant == projet_apres:
+        deltas = {champ: apres[champ] - contribution_avant[champ] for champ in apres}
+        appliquer_delta(projet_apres, deltas, recalculer_avancement=True)
+    else:
+        appliquer_delta(projet_avant, {champ: -valeur for champ, valeur in contribution_avant.items()}, True)
+        appliquer_delta(projet_apres, apres, True)
+
+
+def _origine(origin):
+    """Modèle à l'origine d'une suppression (instance ou queryset)"""
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def tache_supprimee(instance, origin=None) -> None:
+    from .models import Tache
+    if origin is not None and _origine(origin) is not Tache:
+        # Suppression en cascade : le lot / chantier supprimé recalcule le projet en une fois
+        return
+    contribution = contribution_tache(instance.status, instance.end_date, date.today())
+    appliquer_delta(
+        _projet_du_lot(instance.lot_id),
+        {champ: -valeur for champ, valeur in contribution.items()},
+        recalculer_avancement=True,
+    )
+
+
+def memoriser_chantier(instance, update_fields=None) -> None:
+    """pre_save Chantier : projet et budget consommé précédents"""
+    instance._features_avant = None
+    if instance._state.adding or not _suivi(update_fields, CHAMPS_CHANTIER):
+        return
+    from .models import Chantier
+    instance._features_avant = Chantier.objects.filter(pk=instance.pk).values('projet_id', 'budget_used', 'progress').first()
+
+
+def chantier_enregistre(instance, created: bool, update_fields=None) -> None:
+    if not created and not _suivi(update_fields, CHAMPS_CHANTIER):
+        return
+    budget = Decimal(instance.budget_used or 0)
+    avant = getattr(instance, '_features_avant', None)
+    if avant is None:
+        appliquer_delta(instance.projet_id, {'nb_chantiers': 1, 'budget_utilise': budget}, recalculer_avancement=True)
+        return
+    budget_avant = Decimal(avant['budget_used'] or 0)
+    if avant['projet_id'] == instance.projet_id:
+        # Le progress d'un chantier sans lot entre dans l'avancement du projet
+        appliquer_delta(
+            instance.projet_id,
+            {'budget_utilise': budget - budget_avant},
+            recalculer_avancement=avant['progress'] != instance.progress,
+        )
+    else:
+        # Chantier rattaché à un autre projet : ses tâches changent aussi de projet
+        rafraichir([avant['projet_id'], instance.projet_id])
+
+
+def _projet_du_chantier(chantier_id):
+    from .models import Chantier
+    return Chantier.objects.filter(pk=chantier_id).values_list('projet_id', flat=True).first()
+
+
+def _lot_a_des_taches(lot_id) -> bool:
+    from .models import Tache
+    return Tache.objects.filter(lot_id=lot_id).exists()
+
+
+def memoriser_lot(instance, update_fields=None) -> None:
+    """pre_save Lot : chantier et progress précédents (état de chargement suivi par le modèle si connu)"""
+    instance._features_avant = None
+    if instance._state.adding or not _suivi(update_fields, CHAMPS_LOT):
+        return
+    initiales = getattr(instance, '_valeurs_initiales', None) or {}
+    if 'chantier_id' in initiales and 'progress' in initiales:
+        instance._features_avant = {'chantier_id': initiales['chantier_id'], 'progress': initiales['progress']}
+        return
+    from .models import Lot
+    instance._features_avant = Lot.objects.filter(pk=instance.pk).values('chantier_id', 'progress').first()
+
+
+def lot_enregistre(instance, created: bool, update_fields=None) -> None:
+    if not created and not _suivi(update_fields, CHAMPS_LOT):
+        return
+    avant = getattr(instance, '_features_avant', None)
+    if avant is None:
+        # Nouveau lot : il entre dans la moyenne de son chantier
+        appliquer_delta(_projet_du_chantier(instance.chantier_id), {}, recalculer_avancement=True)
+        return
+    if avant['chantier_id'] == instance.chantier_id:
+        # Seul le progress d'un lot sans tâche entre dans l'avancement du projet (celui d'un
+        # lot avec tâches suit ses tâches, déjà recalculé par le signal de la tâche)
+        if avant['progress'] != instance.progress and not _lot_a_des_taches(instance.pk):
+            appliquer_delta(_projet_du_chantier(instance.chantier_id), {}, recalculer_avancement=True)
+        return
+    projet_avant = _projet_du_chantier(avant['chantier_id'])
+    projet_apres = _projet_du_chantier(instance.chantier_id)
+    if projet_avant == projet_apres:
+        appliquer_delta(projet_apres, {}, recalculer_avancement=True)
+    else:
+        # Lot rattaché à un chantier d'un autre projet : ses tâches changent aussi de projet
+        rafraichir([projet_avant, projet_apres])
+
+
+def lot_supprime(instance, origin=None) -> None:
+    from .models import Chantier, Lot
+    if origin is not None and _origine(origin) is not Lot:
+        return
+    projet_id = Chantier.objects.filter(pk=instance.chantier_id).values_list('projet_id', flat=True).first()
+    if projet_id:
+        rafraichir([projet_id])
+
+
+def chantier_supprime(instance, origin=None) -> None:
+    from .models import Projet
+    if origin is not None and _origine(origin) is Projet:
+        # Le projet et sa ligne ProjetFeatures sont supprimés avec lui
+        return
+    rafraichir([instance.projet_id])
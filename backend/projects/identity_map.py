@@ -0,0 +1,224 @@
+"""
+Carte d'identité des objets de la hiérarchie pendant une requête (identity map)
+
+Les mises à jour en cascade (tâche -> lot -> chantier -> projet) passaient par
+`tache.lot`, `lot.chantier` et `chantier.projet`, rechargés à chaque étape et par
+chaque signal, puis enregistrés en entier. Pendant une requête (IdentityMapMiddleware),
+la carte garde une seule instance par Lot, Chantier et Projet :
+- parent() et enfants() donnent l'instance déjà chargée (chargée au plus une fois) ;
+  les enfants sont installés dans le cache de prefetch du parent, de sorte que
+  calculer_avancement / synchroniser_statut voient les valeurs modifiées en mémoire ;
+- marquer() note les champs recalculés ; dans une unite_de_travail(), l'enregistrement
+  est différé à la sortie de l'unité la plus externe : chaque objet est enregistré au plus
+  une fois, avec update_fields limité aux colonnes dont la valeur a réellement changé
+  (SuiviModificationsMixin des modèles). Hors unité, marquer() enregistre immédiatement.
+L'unité la plus externe est une transaction (transaction.atomic) : l'écriture qui l'ouvre
+(tâche, lot...) et les recalculs enregistrés à sa sortie sont validés ou annulés ensemble.
+Une unité qui sort sur une exception, ou dont un enregistrement en cascade échoue, est
+annulée entièrement : pas de parents désynchronisés de l'objet enregistré.
+Hors requête (shell, commandes, threads), unite_de_travail() crée une carte temporaire.
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_carte_courante: ContextVar[Optional['IdentityMap']] = ContextVar('identity_map', default=None)
+
+
+def _cle(instance) -> Tuple:
+    return type(instance), instance.pk
+
+
+class IdentityMap:
+    def __init__(self):
+        self._objets: Dict[Tuple, object] = {}
+        self._enfants: Dict[Tuple, List] = {}
+        self._marques: Dict[Tuple, Set[str]] = {}
+        self._profondeur = 0
+
+    def _invalider_enfants(self, instance) -> None:
+        """Oublie les listes d'enfants des parents (actuels et précédents) de l'instance"""
+        for field in instance._meta.concrete_fields:
+            if not field.many_to_one:
+                continue
+            accessor = field.remote_field.get_accessor_name()
+            for parent_id in {getattr(instance, field.attname), instance.valeur_precedente(field.name)}:
+                if parent_id is not None:
+                    self._enfants.pop((field.related_model, parent_id, accessor), None)
+
+    def ajouter(self, instance, remplacer: bool = False):
+        """
+        Instance de la carte pour cet objet. Avec `remplacer`, l'instance fournie (qui vient
+        d'être enregistrée, par un serializer par exemple) devient la référence.
+        """
+        if instance is None or instance.pk is None:
+            return instance
+        cle = _cle(instance)
+        existante = self._objets.get(cle)
+        if existante is not None and not remplacer:
+            return existante
+        self._invalider_enfants(instance)
+        self._objets[cle] = instance
+        return instance
+
+    def oublier(self, instance) -> None:
+        """Retire un objet supprimé de la carte"""
+        cle = _cle(instance)
+        self._invalider_enfants(instance)
+        self._objets.pop(cle, None)
+        self._marques.pop(cle, None)
+
+    def get(self, model, pk):
+        if pk is None:
+            return None
+        instance = self._objets.get((model, pk))
+        if instance is None:
+            instance = model._default_manager.filter(pk=pk).first()
+            if instance is not None:
+                self.ajouter(instance)
+        return instance
+
+    def parent(self, instance, champ: str):
+        """Parent `champ` (clé étrangère) de l'instance, chargé au plus une fois par requête"""
+        field = instance._meta.get_field(champ)
+        parent_id = getattr(instance, field.attname)
+        if parent_id is None:
+            return None
+        parent = self._objets.get((field.related_model, parent_id))
+        if parent is None:
+            if field.is_cached(instance):
+                parent = self.ajouter(field.get_cached_value(instance))
+            else:
+                parent = self.get(field.related_model, parent_id)
+        if parent is not None:
+            field.set_cached_value(instance, parent)
+        return parent
+
+    def enfants(self, parent, relation: str) -> List:
+        """
+        Enfants `relation` (nom de la relation inverse) du parent, instances de la carte,
+        installés dans le cache de prefetch du parent
+        """
+        cle = (type(parent), parent.pk, relation)
+        enfants = self._enfants.get(cle)
+        manager = getattr(parent, relation)
+        cache = getattr(parent, '_prefetched_objects_cache', None)
+        if cache is None:
+            cache = parent._prefetched_objects_cache = {}
+        if enfants is None:
+            cache.pop(relation, None)
+            enfants = [self.ajouter(enfant) for enfant in manager.all()]
+            self._enfants[cle] = enfants
+        queryset = manager.all()
+        queryset._result_cache = list(enfants)
+        queryset._prefetch_done = True
+        cache[relation] = queryset
+        return enfants
+
+    def marquer(self, instance, *champs: str) -> None:
+        """Champs recalculés de l'instance, enregistrés à la fin de l'unité de travail"""
+        cle = _cle(instance)
+        if self._objets.get(cle) is not instance:
+            # Instance hors carte : elle devient la référence (ses modifications sont suivies)
+            self.ajouter(instance, remplacer=True)
+        self._marques.setdefault(cle, set()).update(champs)
+        if self._profondeur == 0:
+            self.enregistrer()
+
+    def enregistrer(self, lever: bool = False) -> None:
+        """
+        Enregistre les objets marqués dont des champs ont changé (un save() par objet).
+        Avec `lever` (sortie d'unité de travail), un échec est propagé pour annuler l'unité.
+        """
+        marques, self._marques = self._marques, {}
+        for cle, champs in marques.items():
+            instance = self._objets.get(cle)
+            if instance is None:
+                continue
+            modifies = champs & instance.champs_modifies()
+            if not modifies:
+                continue
+            update_fields = sorted(modifies)
+            if any(f.name == 'updated_at' for f in instance._meta.concrete_fields):
+                update_fields.append('updated_at')
+            try:
+                instance.save(update_fields=update_fields)
+            except Exception as e:
+                logger.error(f"Erreur d'enregistrement en cascade ({cle[0].__name__} {cle[1]}): {str(e)}")
+                if lever:
+                    raise
+
+    def abandonner(self) -> None:
+        """Oublie les recalculs non enregistrés et les instances modifiées en mémoire"""
+        self._objets.clear()
+        self._enfants.clear()
+        self._marques.clear()
+
+    @contextmanager
+    def differer(self):
+        externe = self._profondeur == 0
+        # Seule l'unité la plus externe ouvre une transaction (pas de savepoint par signal)
+        with transaction.atomic() if externe else _sans_transaction():
+            self._profondeur += 1
+            try:
+                yield self
+                if externe:
+                    self.enregistrer(lever=True)
+            except BaseException:
+                if externe:
+                    # Opération en échec : la transaction est annulée, la carte oublie ses recalculs
+                    self.abandonner()
+                raise
+            finally:
+                self._profondeur -= 1
+
+
+@contextmanager
+def _sans_transaction():
+    yield
+
+
+def carte_courante() -> Optional[IdentityMap]:
+    return _carte_courante.get()
+
+
+@contextmanager
+def unite_de_travail():
+    """
+    Unité de travail sur la carte de la requête (carte temporaire hors requête) : les
+    enregistrements marqués sont faits une seule fois, à la sortie de l'unité la plus externe
+    """
+    carte = _carte_courante.get()
+    token = None
+    if carte is None:
+        carte = IdentityMap()
+        token = _carte_courante.set(carte)
+    try:
+        with carte.differer():
+            yield carte
+    finally:
+        if token is not None:
+            _carte_courante.reset(token)
+
+
+class IdentityMapMiddleware:
+    """
+    Une carte d'identité par requête. Les enregistrements sont faits par les unités de
+    travail (ou immédiatement hors unité) : la carte ne sert ici qu'à partager les
+    instances chargées entre les vues et les signaux de la requête.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _carte_courante.set(IdentityMap())
+        try:
+            return self.get_response(request)
+        finally:
+            _carte_courante.reset(token)
@@ -0,0 +1,34 @@
+"""
+Chargement des objets cibles des endpoints d'acteurs avec leurs parents
+
+Chaque chargeur récupère l'objet et toute sa hiérarchie (chantier -> projet,
+lot -> chantier -> projet, tâche -> lot -> chantier -> projet) en une seule requête,
+et lève NotFound ({'error': ...}, 404) s'il n'existe pas ou si l'identifiant n'est pas un UUID.
+"""
+from django.core.exceptions import ValidationError
+from rest_framework.exceptions import NotFound
+
+from .models import Chantier, Lot, Projet, Tache
+
+
+def _charger(queryset, pk, message: str):
+    try:
+        return queryset.get(pk=pk)
+    except (queryset.model.DoesNotExist, ValidationError, ValueError):
+        raise NotFound({'error': message})
+
+
+def charger_projet(projet_id) -> Projet:
+    return _charger(Projet.objects.all(), projet_id, 'Projet non trouvé')
+
+
+def charger_chantier(chantier_id) -> Chantier:
+    return _charger(Chantier.objects.select_related('projet'), chantier_id, 'Chantier non trouvé')
+
+
+def charger_lot(lot_id) -> Lot:
+    return _charger(Lot.objects.select_related('chantier__projet'), lot_id, 'Lot non trouvé')
+
+
+def charger_tache(tache_id) -> Tache:
+    return _charger(Tache.objects.select_related('lot__chantier__projet'), tache_id, 'Tâche non trouvée')
@@ -0,0 +1,179 @@
+"""
+Protection de l'endpoint de connexion contre l'épuisement CPU
+
+Le hachage des mots de passe (PBKDF2) est volontairement coûteux : une rafale d'échecs
+de connexion peut occuper tous les workers. Ce module garantit :
+- au plus un hachage coûteux par tentative : seul le compte correspondant à l'email est
+  vérifié (Utilisateur, sinon compte staff Django), et un email inconnu est vérifié contre
+  un hash factice pour que la durée de réponse ne révèle pas l'existence du compte ;
+- une limitation des échecs par adresse IP et par compte, comptés par fenêtres fixes de
+  LOGIN_THROTTLE_WINDOW secondes dans le cache 'shared' (commun aux workers ; cache
+  local du worker s'il est indisponible). La limite atteinte, la connexion répond 429
+  sans hacher le mot de passe.
+Le re-hachage d'un mot de passe dont l'algorithme ou le nombre d'itérations ne correspond
+plus à PASSWORD_HASHERS est fait à la connexion réussie (Utilisateur.check_password).
+"""
+import hashlib
+import logging
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import caches
+from django.db.models import Case, IntegerField, Q, Value, When
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_ALIAS = 'shared'
+FALLBACK_CACHE_ALIAS = 'default'
+DEFAULT_WINDOW = 300
+DEFAULT_IP_FAILURES = 20
+DEFAULT_ACCOUNT_FAILURES = 5
+
+_dummy_hash = None
+_dummy_lock = threading.Lock()
+
+
+def _window() -> int:
+    return int(getattr(settings, 'LOGIN_THROTTLE_WINDOW', DEFAULT_WINDOW))
+
+
+def _limites():
+    return (
+        int(getattr(settings, 'LOGIN_THROTTLE_IP_FAILURES', DEFAULT_IP_FAILURES)),
+        int(getattr(settings, 'LOGIN_THROTTLE_ACCOUNT_FAILURES', DEFAULT_ACCOUNT_FAILURES)),
+    )
+
+
+def client_ip(request) -> str:
+    """
+    Adresse du client : REMOTE_ADDR, ou l'entrée de X-Forwarded-For ajoutée par le premier
+    des LOGIN_PROXY_COUNT proxys de confiance (0 = pas de proxy, en-tête ignoré)
+    """
+    proxies = int(getattr(settings, 'LOGIN_PROXY_COUNT', 0))
+    if proxies > 0:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if forwarded:
+            return forwarded[-min(proxies, len(forwarded))]
+    return request.META.get('REMOTE_ADDR', '') or 'inconnue'
+
+
+def _cles(request, email: str, now: float):
+    """Clés des compteurs d'échecs (IP, compte) de la fenêtre courante, et fin de la fenêtre"""
+    window = _window()
+    fenetre = int(now // window)
+    compte = hashlib.sha256(email.strip().lower().encode('utf-8')).hexdigest()
+    ip = hashlib.sha256(client_ip(request).encode('utf-8')).hexdigest()
+    return f'login:echecs:ip:{ip}:{fenetre}', f'login:echecs:compte:{compte}:{fenetre}', (fenetre + 1) * window
+
+
+def _executer(operation, defaut=None):
+    """Opération sur le cache partagé, sur le cache local du worker si le premier échoue"""
+    try:
+        return operation(caches[SHARED_CACHE_ALIAS])
+    except Exception as e:
+        logger.warning(f"Cache partagé indisponible pour la limitation des connexions: {str(e)}")
+    try:
+        return operation(caches[FALLBACK_CACHE_ALIAS])
+    except Exception as e:
+        logger.error(f"Limitation des connexions indisponible: {str(e)}")
+        return defaut
+
+
+def attente(request, email: str) -> int:
+    """Secondes à attendre avant une nouvelle tentative (0 si la connexion est autorisée)"""
+    now = time.time()
+    cle_ip, cle_compte, fin = _cles(request, email, now)
+    compteurs = _executer(lambda cache: cache.get_many([cle_ip, cle_compte]), {})
+    limite_ip, limite_compte = _limites()
+    if compteurs.get(cle_ip, 0) >= limite_ip or compteurs.get(cle_compte, 0) >= limite_compte:
+        return max(int(fin - now), 1)
+    return 0
+
+
+def _incrementer(cache, cle: str, timeout: int) -> int:
+    if cache.add(cle, 1, timeout=timeout):
+        return 1
+    try:
+        return cache.incr(cle)
+    except ValueError:
+        # Clé expirée entre add() et incr()
+        cache.set(cle, 1, timeout=timeout)
+        return 1
+
+
+def enregistrer_echec(request, email: str) -> None:
+    cle_ip, cle_compte, _ = _cles(request, email, time.time())
+    timeout = _window()
+    _executer(lambda cache: [_incrementer(cache, cle, timeout) for cle in (cle_ip, cle_compte)])
+
+
+def reinitialiser(request, email: str) -> None:
+    """Remet à zéro le compteur d'échecs du compte après une connexion réussie"""
+    _, cle_compte, _ = _cles(request, email, time.time())
+    _executer(lambda cache: cache.delete(cle_compte))
+
+
+def _hash_factice() -> str:
+    global _dummy_hash
+    with _dummy_lock:
+        if _dummy_hash is None:
+            _dummy_hash = make_password(secrets.token_urlsafe(32))
+        return _dummy_hash
+
+
+def _compte_staff(email: str):
+    """Compte staff / superuser Django actif dont l'identifiant est l'email ou sa partie locale"""
+    UserModel = get_user_model()
+    champ = UserModel.USERNAME_FIELD
+    candidats = [email, email.split('@')[0]]
+    return (
+        UserModel._default_manager
+        .filter(**{f'{champ}__in': candidats}, is_active=True)
+        .filter(Q(is_staff=True) | Q(is_superuser=True))
+        .order_by(Case(When(**{champ: email}, then=Value(0)), default=Value(1), output_field=IntegerField()))
+        .first()
+    )
+
+
+def verifier_identifiants(email: str, mot_de_passe: str):
+    """
+    Utilisateur ou compte staff Django correspondant aux identifiants, ou None.
+    Un seul mot de passe est haché, qu'il existe un compte ou non.
+    """
+    from .models import Utilisateur
+
+    utilisateur = Utilisateur.objects.filter(email=email).first()
+    if utilisateur is not None:
+        return utilisateur if utilisateur.check_password(mot_de_passe) else None
+
+    django_user = _compte_staff(email)
+    if django_user is not None:
+        return django_user if django_user.check_password(mot_de_passe) else None
+
+    # Email inconnu : même coût qu'une vérification réelle
+    check_password(mot_de_passe, _hash_factice())
+    return None
+
+
+def provisionner_admin(django_user, email: str, mot_de_passe: str):
+    """Utilisateur administrateur correspondant à un compte staff Django (créé s'il n'existe pas)"""
+    from .models import Utilisateur
+
+    utilisateur = Utilisateur.objects.filter(email=django_user.email or email).first()
+    if utilisateur is None:
+        utilisateur = Utilisateur(
+            nom=getattr(django_user, 'username', 'Admin'),
+            email=django_user.email or email,
+            # Hash déjà calculé par Django : pas de nouveau hachage du mot de passe
+            mot_de_passe=django_user.password or make_password(mot_de_passe),
+            role='ADMINISTRATEUR',
+            is_active=True,
+            is_approved=True,
+        )
+        utilisateur.save()
+    return utilisateur
+
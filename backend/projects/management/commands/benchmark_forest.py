@@ -0,0 +1,87 @@
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.ml_inference import CompiledForest, batch_threshold_setting
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le moteur de forêts compilé à scikit-learn (latence unitaire, débit par lot, parité numérique) "
+        "et indique le seuil de lot au-delà duquel scikit-learn est plus rapide (ML_FOREST_BATCH_THRESHOLD)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=None, help='Chemin du pickle (défaut: ML_MODELS_PATH)')
+        parser.add_argument('--repeat', type=int, default=200, help='Nombre d\'appels pour la latence unitaire')
+        parser.add_argument('--batch-sizes', default='1,100,500,1000,10000', help='Tailles de lot séparées par des virgules')
+
+    def handle(self, *args, **options):
+        source = Path(options['source'] or settings.ML_MODELS_PATH)
+        if not source.exists():
+            raise CommandError(f"Fichier modèle non trouvé: {source}")
+        with open(source, 'rb') as f:
+            models = pickle.load(f)
+
+        batch_sizes = sorted(int(size) for size in options['batch_sizes'].split(',') if size.strip())
+        rng = np.random.default_rng(0)
+        threshold = batch_threshold_setting()
+        self.stdout.write(f"ML_FOREST_BATCH_THRESHOLD = {threshold} (lots plus grands : scikit-learn)")
+
+        for name in ('budget', 'risk'):
+            model = models[f'{name}_model']
+            scaler = models[f'scaler_{name}']
+
+            start = time.perf_counter()
+            compiled = CompiledForest.from_sklearn(model)
+            production = CompiledForest.from_sklearn(model, batch_threshold=threshold)
+            compile_ms = (time.perf_counter() - start) * 1000
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{name}_model: {compiled.n_estimators} arbres, {len(compiled.feature)} nœuds, "
+                f"profondeur {compiled.max_depth}, compilation {compile_ms:.1f} ms"
+            ))
+
+            # Plus grand lot mesuré où le moteur compilé reste plus rapide que scikit-learn
+            crossover = None
+            for batch_size in batch_sizes:
+                raw = scaler.mean_ + rng.standard_normal((batch_size, len(scaler.mean_))) * scaler.scale_ * 2
+                X = scaler.transform(raw)
+
+                expected = model.predict_proba(X)
+                actual = compiled.predict_proba(X)
+                if not np.array_equal(expected, actual) or not np.array_equal(expected, production.predict_proba(X)):
+                    diff = float(np.max(np.abs(expected - actual)))
+                    raise CommandError(f"Écart de prédiction pour {name}_model, lot {batch_size} (max {diff:.3e})")
+
+                repeat = max(options['repeat'] // batch_size, 3)
+                sklearn_s = self._time(lambda: model.predict_proba(X), repeat)
+                compiled_s = self._time(lambda: compiled.predict_proba(X), repeat)
+                production_s = self._time(lambda: production.predict_proba(X), repeat)
+                if compiled_s < sklearn_s:
+                    crossover = batch_size
+                moteur = 'compilé' if batch_size <= threshold else 'sklearn'
+                self.stdout.write(
+                    f"  lot {batch_size:>6}: sklearn {sklearn_s * 1000:9.3f} ms | compilé {compiled_s * 1000:9.3f} ms "
+                    f"| x{sklearn_s / compiled_s:6.1f} | seuil ({moteur}) {production_s * 1000:9.3f} ms | parité OK"
+                )
+
+            if crossover is None:
+                self.stdout.write(f"  seuil recommandé : 0 (scikit-learn plus rapide dès {batch_sizes[0]} ligne(s))")
+            else:
+                self.stdout.write(
+                    f"  seuil recommandé : {crossover} (compilé plus rapide jusqu'à {crossover} lignes parmi les lots mesurés)"
+                )
+
+    def _time(self, fn, repeat):
+        """Retourne la meilleure durée (en secondes) sur `repeat` appels"""
+        fn()
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
@@ -0,0 +1,245 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from projects.ml_service import MLPredictionService
+from projects.models import Chantier, Lot, Projet, Tache
+from projects.portfolio import score_projets
+
+TACHES_PAR_LOT = 50
+LOTS_PAR_CHANTIER = 4
+
+
+class Command(BaseCommand):
+    help = (
+        "Suite de benchmarks du chemin ML (chargement, latence par prédiction, extraction des features, "
+        "débit portefeuille) sur un portefeuille synthétique ; résultats JSON comparables entre commits"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Fichier JSON de résultats')
+        parser.add_argument('--compare', default=None, help='Fichier JSON de référence à comparer')
+        parser.add_argument('--repeat', type=int, default=20, help='Répétitions par mesure de latence')
+        parser.add_argument('--task-sizes', default='10,100,1000,10000', help='Tailles de projets (nombre de tâches)')
+        parser.add_argument('--portfolio-size', type=int, default=50, help='Nombre de projets pour le débit portefeuille')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        task_sizes = [int(size) for size in options['task_sizes'].split(',') if size.strip()]
+        self.rng = np.random.default_rng(options['seed'])
+        self.repeat = max(options['repeat'], 1)
+
+        results = {
+            'meta': self._meta(),
+            'cold_load': self._bench_cold_load(),
+        }
+        service = MLPredictionService()
+        results['meta']['model_version'] = service.model_version
+        results['meta']['models_loaded'] = service.models_loaded
+
+        # Le portefeuille synthétique est créé puis annulé dans une transaction
+        with transaction.atomic():
+            projets = {size: self._creer_projet(size) for size in task_sizes}
+            results['single_project'] = self._bench_single_project(service, projets[min(task_sizes)])
+            results['feature_extraction'] = self._bench_feature_extraction(service, projets)
+            portfolio = [self._creer_projet(TACHES_PAR_LOT) for _ in range(options['portfolio_size'])]
+            results['portfolio'] = self._bench_portfolio(portfolio)
+            transaction.set_rollback(True)
+
+        self._print(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}"))
+        if options['compare']:
+            self._compare(results, options['compare'])
+
+    # ----- Mesures -----
+
+    def _timings(self, fn, repeat=None):
+        """Statistiques de durée (ms) sur `repeat` appels, après un appel de chauffe"""
+        fn()
+        durations = []
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            fn()
+            durations.append((time.perf_counter() - start) * 1000)
+        durations.sort()
+        return {
+            'n': len(durations),
+            'min_ms': round(durations[0], 4),
+            'median_ms': round(statistics.median(durations), 4),
+            'p95_ms': round(durations[min(int(len(durations) * 0.95), len(durations) - 1)], 4),
+            'max_ms': round(durations[-1], 4),
+        }
+
+    def _bench_cold_load(self):
+        durations = []
+        for _ in range(3):
+            start = time.perf_counter()
+            MLPredictionService()
+            durations.append((time.perf_counter() - start) * 1000)
+        return {'min_ms': round(min(durations), 3), 'max_ms': round(max(durations), 3)}
+
+    def _bench_single_project(self, service, projet):
+        chantiers = list(projet.chantiers.all())
+        taches = [t for chantier in chantiers for lot in chantier.lots.all() for t in lot.taches.all()]
+        return {
+            'n_taches': len(taches),
+            'predict_delay_risk': self._timings(lambda: service.predict_delay_risk(projet)),
+            'predict_budget_overrun': self._timings(lambda: service.predict_budget_overrun(projet)),
+            'predict_risk': self._timings(lambda: service.predict_risk(projet)),
+            # Mêmes appels avec l'arborescence déjà chargée : coût du modèle seul
+            'predict_delay_risk_preloaded': self._timings(lambda: service.predict_delay_risk(projet, chantiers, taches)),
+            'predict_risk_preloaded': self._timings(lambda: service.predict_risk(projet, chantiers, taches)),
+        }
+
+    def _bench_feature_extraction(self, service, projets):
+        results = {}
+        for size, projet in projets.items():
+            chantiers = list(projet.chantiers.all())
+            taches = [t for chantier in chantiers for lot in chantier.lots.all() for t in lot.taches.all()]
+            repeat = max(self.repeat // max(size // 1000, 1), 3)
+            results[str(size)] = {
+                'load_tree': self._timings(lambda: [
+                    t for chantier in projet.chantiers.all() for lot in chantier.lots.all() for t in lot.taches.all()
+                ], repeat),
+                'extract_ml_features': self._timings(lambda: service.extract_ml_features(projet, chantiers, taches), repeat),
+                'extract_project_features': self._timings(
+                    lambda: service.extract_project_features(projet, chantiers, taches), repeat
+                ),
+            }
+        return results
+
+    def _bench_portfolio(self, projets):
+        ids = [projet.id for projet in projets]
+        start = time.perf_counter()
+        scored = score_projets(ids)
+        elapsed = time.perf_counter() - start
+        return {
+            'n_projets': len(ids),
+            'n_scored': len(scored),
+            'total_s': round(elapsed, 3),
+            'projets_per_s': round(len(scored) / elapsed, 2) if elapsed > 0 else None,
+        }
+
+    # ----- Portefeuille synthétique -----
+
+    def _creer_projet(self, nb_taches):
+        today = date.today()
+        duree = int(self.rng.integers(90, 720))
+        debut = today - timedelta(days=int(self.rng.integers(0, duree)))
+        projet = Projet.objects.create(
+            name=f'Benchmark {nb_taches} tâches',
+            status='En cours',
+            priority=str(self.rng.choice(['Haute', 'Moyenne', 'Basse'])),
+            budget=int(self.rng.integers(50_000, 5_000_000)),
+            start_date=debut,
+            end_date=debut + timedelta(days=duree),
+        )
+        nb_lots = max(-(-nb_taches // TACHES_PAR_LOT), 1)
+        nb_chantiers = max(-(-nb_lots // LOTS_PAR_CHANTIER), 1)
+        chantiers = Chantier.objects.bulk_create([
+            Chantier(
+                projet=projet, name=f'Chantier {i}', status='En cours', priority='Moyenne',
+                budget=projet.budget / nb_chantiers,
+                budget_used=float(projet.budget) / nb_chantiers * float(self.rng.uniform(0.1, 1.3)),
+                start_date=projet.start_date, end_date=projet.end_date, location='Synthétique', manager='Benchmark',
+            )
+            for i in range(nb_chantiers)
+        ])
+        lots = Lot.objects.bulk_create([
+            Lot(chantier=chantiers[i % nb_chantiers], name=f'Lot {i}', status='En cours',
+                start_date=projet.start_date, end_date=projet.end_date)
+            for i in range(nb_lots)
+        ])
+        statuts = self.rng.choice(['Terminé', 'En cours', 'En attente'], size=nb_taches, p=[0.4, 0.4, 0.2])
+        debuts = self.rng.integers(0, duree, size=nb_taches)
+        durees = self.rng.integers(1, 60, size=nb_taches)
+        Tache.objects.bulk_create([
+            Tache(
+                lot=lots[i // TACHES_PAR_LOT], name=f'Tâche {i}', status=str(statuts[i]),
+                start_date=debut + timedelta(days=int(debuts[i])),
+                end_date=debut + timedelta(days=int(debuts[i] + durees[i])),
+                cost=int(self.rng.integers(100, 10_000)),
+            )
+            for i in range(nb_taches)
+        ], batch_size=1000)
+        return projet
+
+    # ----- Sortie -----
+
+    def _meta(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                cwd=Path(__file__).resolve().parent, timeout=5,
+            ).stdout.strip() or None
+        except Exception:
+            commit = None
+        return {
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'git_commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+        }
+
+    def _print(self, results):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Modèles {results['meta'].get('model_version')} (commit {results['meta'].get('git_commit')})"
+        ))
+        self.stdout.write(f"Chargement à froid: {results['cold_load']['min_ms']:.1f} ms")
+        for name, value in results['single_project'].items():
+            if isinstance(value, dict):
+                self.stdout.write(f"  {name:32} médiane {value['median_ms']:9.3f} ms | p95 {value['p95_ms']:9.3f} ms")
+        for size, values in results['feature_extraction'].items():
+            self.stdout.write(
+                f"  {size:>6} tâches: arbre {values['load_tree']['median_ms']:9.3f} ms | "
+                f"features ML {values['extract_ml_features']['median_ms']:9.3f} ms | "
+                f"features stat {values['extract_project_features']['median_ms']:9.3f} ms"
+            )
+        portfolio = results['portfolio']
+        self.stdout.write(f"Portefeuille: {portfolio['n_scored']} projets en {portfolio['total_s']} s "
+                          f"({portfolio['projets_per_s']} projets/s)")
+
+    def _compare(self, results, baseline_path):
+        try:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Référence illisible: {e}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Comparaison avec {baseline.get('meta', {}).get('git_commit')} (négatif = plus rapide)"
+        ))
+        for path, current in _iter_medians(results):
+            previous = _lookup(baseline, path)
+            if previous:
+                delta = (current - previous) / previous * 100
+                self.stdout.write(f"  {'/'.join(path):60} {previous:9.3f} → {current:9.3f} ms ({delta:+.1f}%)")
+
+
+def _iter_medians(results, path=()):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            if 'median_ms' in value:
+                yield path + (key,), value['median_ms']
+            else:
+                yield from _iter_medians(value, path + (key,))
+
+
+def _lookup(results, path):
+    node = results
+    for key in path:
+        if not isinstance(node, dict) or key not in node:
+            return None
+        node = node[key]
+    return node.get('median_ms') if isinstance(node, dict) else None
@@ -0,0 +1,63 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.ml_artifact import MODEL_KINDS, export_models, load_artifact
+
+
+class Command(BaseCommand):
+    help = "Exporte buildflow_models.pkl vers un artefact versionné de tableaux .npy (chargés en mmap)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=None, help='Chemin du pickle (défaut: ML_MODELS_PATH)')
+        parser.add_argument('--output', default=None, help="Répertoire des artefacts (défaut: ML_ARTIFACTS_DIR)")
+        parser.add_argument('--artifact-version', dest='artifact_version', default=None, help='Nom de version (défaut: empreinte du pickle)')
+        parser.add_argument('--verify', action='store_true',
+                            help="Vérifie que l'artefact donne exactement les mêmes prédictions que le pickle")
+        parser.add_argument('--samples', type=int, default=2000, help='Nombre de lignes aléatoires pour --verify')
+
+    def handle(self, *args, **options):
+        source = Path(options['source'] or settings.ML_MODELS_PATH)
+        output = Path(options['output'] or settings.ML_ARTIFACTS_DIR)
+        if not source.exists():
+            raise CommandError(f"Fichier modèle non trouvé: {source}")
+
+        with open(source, 'rb') as f:
+            models = pickle.load(f)
+
+        manifest = export_models(models, output, source_path=source, version=options['artifact_version'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Artefact {manifest['version']} écrit dans {output / manifest['version']}"
+        ))
+
+        if options['verify']:
+            artifact_models, _ = load_artifact(output / manifest['version'])
+            self._verify(models, artifact_models, options['samples'])
+
+    def _verify(self, models, artifact_models, n_samples):
+        """Compare les sorties pickle / artefact sur des lignes tirées autour des moyennes d'entraînement"""
+        rng = np.random.default_rng(0)
+        for name, kind in MODEL_KINDS.items():
+            scaler = models[f'scaler_{name}']
+            raw = scaler.mean_ + rng.standard_normal((n_samples, len(scaler.mean_))) * scaler.scale_ * 2
+
+            expected_X = scaler.transform(raw)
+            actual_X = artifact_models[f'scaler_{name}'].transform(raw)
+            if not np.array_equal(expected_X, actual_X):
+                raise CommandError(f"Écart de normalisation pour scaler_{name}")
+
+            model = models[f'{name}_model']
+            artifact_model = artifact_models[f'{name}_model']
+            if kind == 'ridge':
+                expected, actual = model.predict(expected_X), artifact_model.predict(actual_X)
+            else:
+                expected, actual = model.predict_proba(expected_X), artifact_model.predict_proba(actual_X)
+            if not np.array_equal(expected, actual):
+                diff = float(np.max(np.abs(expected - actual)))
+                raise CommandError(f"Écart de prédiction pour {name}_model (max {diff:.3e})")
+            self.stdout.write(f"  {name}_model: {n_samples} prédictions identiques")
+
+        self.stdout.write(self.style.SUCCESS("Parité pickle / artefact vérifiée"))
@@ -0,0 +1,37 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.feature_store import rafraichir
+from projects.models import Projet
+from projects.portfolio import iter_chunks
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule le feature store ML (ProjetFeatures) de tous les projets : "
+        "tâches en retard à la date du jour et correction des deltas (tâche quotidienne)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Nombre de projets par paquet')
+        parser.add_argument('--date', default=None, help="Date de référence des retards (AAAA-MM-JJ, défaut: aujourd'hui)")
+
+    def handle(self, *args, **options):
+        try:
+            reference = date.fromisoformat(options['date']) if options['date'] else date.today()
+        except ValueError:
+            raise CommandError(f"Date invalide: {options['date']}")
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size doit être positif')
+
+        start = time.perf_counter()
+        projet_ids = list(Projet.objects.order_by('created_at').values_list('id', flat=True))
+        written = 0
+        for chunk in iter_chunks(projet_ids, options['chunk_size']):
+            written += rafraichir(chunk, reference)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{written} projets rafraîchis au {reference} en {time.perf_counter() - start:.1f} s"
+        ))
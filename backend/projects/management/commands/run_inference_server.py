@@ -0,0 +1,45 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.ml_server import InferenceServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Lance le serveur d'inférence ML local (micro-batching sur socket Unix). "
+        "Les workers Django l'utilisent quand ML_INFERENCE_SOCKET est configuré."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=None, help='Chemin du socket Unix (défaut: ML_INFERENCE_SOCKET)')
+        parser.add_argument('--window-ms', type=float, default=5.0, help='Fenêtre de regroupement des requêtes (ms)')
+        parser.add_argument('--max-batch', type=int, default=256, help='Taille maximale d\'un lot')
+
+    def handle(self, *args, **options):
+        socket_path = options['socket'] or getattr(settings, 'ML_INFERENCE_SOCKET', '')
+        if not socket_path:
+            raise CommandError('Indiquer --socket ou configurer ML_INFERENCE_SOCKET')
+
+        server = InferenceServer(socket_path, window_ms=options['window_ms'], max_batch=options['max_batch'])
+        if not server.service.models_loaded:
+            raise CommandError('Aucun modèle ML chargé : rien à servir')
+
+        # SIGTERM (arrêt du service) : fermer le socket proprement
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: server.shutdown())
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Serveur d'inférence sur {socket_path} (modèles {server.service.model_version}, "
+            f"fenêtre {options['window_ms']} ms)"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+        stats = server.stats
+        self.stdout.write(
+            f"{stats['requests']} requêtes en {stats['batches']} lots (lot max: {stats['max_batch_size']})"
+        )
@@ -0,0 +1,67 @@
+import os
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.models import RiskSnapshot
+from projects.portfolio import projets_actifs_ids, score_portfolio
+
+
+class Command(BaseCommand):
+    help = "Score tous les projets actifs et enregistre un instantané RiskSnapshot par projet (tâche quotidienne)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=50, help='Nombre de projets par paquet')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Nombre de processus de scoring')
+        parser.add_argument(
+            '--date', default=None,
+            help="Date de l'instantané (AAAA-MM-JJ) ; seule la date du jour est acceptée : les scores sont ceux du jour",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            snapshot_date = date.fromisoformat(options['date']) if options['date'] else date.today()
+        except ValueError:
+            raise CommandError(f"Date invalide: {options['date']}")
+        if snapshot_date != date.today():
+            # Un instantané daté du passé fausserait risk_history et l'entraînement (ml_training)
+            raise CommandError(
+                f"Date {snapshot_date} refusée : les scores calculés sont ceux du jour ({date.today()})"
+            )
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size doit être positif')
+
+        start = time.perf_counter()
+        projet_ids = projets_actifs_ids()
+        written = 0
+        for resultats in score_portfolio(projet_ids, options['chunk_size'], options['workers']):
+            snapshots = [
+                RiskSnapshot(
+                    projet_id=resultat['projet_id'],
+                    date=snapshot_date,
+                    delay_score=resultat['delay_score'],
+                    days_delay=resultat['days_delay'],
+                    budget_score=resultat['budget_score'],
+                    risk_score=resultat['risk_score'],
+                    risk_level=resultat['risk_level'],
+                    model_version=resultat['model_version'],
+                    features=resultat.get('features', {}),
+                )
+                for resultat in resultats
+            ]
+            # Relancer la commande le même jour remplace l'instantané du jour
+            RiskSnapshot.objects.bulk_create(
+                snapshots,
+                update_conflicts=True,
+                unique_fields=['projet', 'date'],
+                update_fields=[
+                    'delay_score', 'days_delay', 'budget_score', 'risk_score', 'risk_level', 'model_version', 'features',
+                ],
+            )
+            written += len(snapshots)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{written}/{len(projet_ids)} projets scorés pour le {snapshot_date} "
+            f"en {time.perf_counter() - start:.1f} s"
+        ))
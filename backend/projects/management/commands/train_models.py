@@ -0,0 +1,52 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.ml_training import train_and_export
+
+
+class Command(BaseCommand):
+    help = (
+        "Réentraîne les modèles budget / retard / risk sur les projets terminés de la base "
+        "et écrit un nouvel artefact versionné avec ses métriques de validation"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help="Répertoire des artefacts (défaut: ML_ARTIFACTS_DIR)")
+        parser.add_argument('--artifact-version', dest='artifact_version', default=None,
+                            help='Nom de version (défaut: train-<horodatage UTC>)')
+        parser.add_argument('--n-jobs', dest='n_jobs', type=int, default=os.cpu_count() or 1,
+                            help='Nombre de cœurs pour les forêts aléatoires (-1: tous)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Nombre de projets lus par paquet')
+        parser.add_argument('--min-samples', type=int, default=50, help='Nombre minimal de projets terminés')
+        parser.add_argument('--no-publish', dest='publish', action='store_false',
+                            help="Écrit l'artefact sans mettre à jour current.json (versions servies inchangées)")
+
+    def handle(self, *args, **options):
+        output = Path(options['output'] or settings.ML_ARTIFACTS_DIR)
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size doit être positif')
+
+        start = time.perf_counter()
+        try:
+            manifest = train_and_export(
+                output,
+                version=options['artifact_version'],
+                n_jobs=options['n_jobs'],
+                chunk_size=options['chunk_size'],
+                min_samples=options['min_samples'],
+                publish=options['publish'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps(manifest['metrics'], indent=2))
+        state = 'publié' if options['publish'] else 'non publié (--no-publish)'
+        self.stdout.write(self.style.SUCCESS(
+            f"Artefact {manifest['version']} {state} dans {output / manifest['version']} "
+            f"({manifest['metrics']['n_samples']} projets, {time.perf_counter() - start:.1f} s)"
+        ))
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-19 03:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiskSnapshot',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('delay_score', models.FloatField()),
+                ('days_delay', models.IntegerField(default=0)),
+                ('budget_score', models.FloatField()),
+                ('risk_score', models.FloatField()),
+                ('risk_level', models.CharField(max_length=16)),
+                ('model_version', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('projet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='risk_snapshots', to='projects.projet')),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='risksnapshot',
+            constraint=models.UniqueConstraint(fields=('projet', 'date'), name='unique_risk_snapshot_per_day'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_risk_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alerte',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=128),
+        ),
+    ]
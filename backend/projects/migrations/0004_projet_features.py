@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0003_alerte_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjetFeatures',
+            fields=[
+                ('projet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='features', serialize=False, to='projects.projet')),
+                ('nb_chantiers', models.IntegerField(default=0)),
+                ('nb_taches', models.IntegerField(default=0)),
+                ('nb_taches_terminees', models.IntegerField(default=0)),
+                ('nb_taches_en_retard', models.IntegerField(default=0)),
+                ('budget_utilise', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('avancement', models.FloatField(default=0)),
+                ('date_reference', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_projet_features'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TacheDependance',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('decalage', models.IntegerField(default=0)),
+                ('predecesseur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dependances_sortantes', to='projects.tache')),
+                ('projet', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='dependances_taches', to='projects.projet')),
+                ('successeur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dependances_entrantes', to='projects.tache')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tachedependance',
+            constraint=models.UniqueConstraint(fields=('predecesseur', 'successeur'), name='unique_tache_dependance'),
+        ),
+        migrations.AddConstraint(
+            model_name='tachedependance',
+            constraint=models.CheckConstraint(check=models.Q(('predecesseur', models.F('successeur')), _negated=True), name='tache_dependance_distincte'),
+        ),
+    ]
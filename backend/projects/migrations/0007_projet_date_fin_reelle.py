@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:42
+
+from django.db import migrations, models
+
+
+def renseigner_projets_termines(apps, schema_editor):
+    # Projets terminés avant l'ajout du champ : seule la dernière modification est connue
+    Projet = apps.get_model('projects', 'Projet')
+    projets = Projet.objects.filter(status='Terminé', date_fin_reelle__isnull=True).only('id', 'updated_at')
+    for projet in projets.iterator():
+        Projet.objects.filter(pk=projet.pk).update(date_fin_reelle=projet.updated_at.date())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_analysis_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projet',
+            name='date_fin_reelle',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(renseigner_projets_termines, migrations.RunPython.noop),
+    ]
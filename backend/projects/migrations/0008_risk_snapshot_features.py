@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0007_projet_date_fin_reelle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='risksnapshot',
+            name='features',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0008_risk_snapshot_features'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alerte',
+            name='statut',
+            field=models.CharField(choices=[('NOUVELLE', 'Nouvelle'), ('EN_COURS', 'En cours de traitement'), ('RESOLUE', 'Résolue')], default='NOUVELLE', max_length=50),
+        ),
+    ]
@@ -0,0 +1,247 @@
+"""
+Format d'artefact des modèles ML (répertoire versionné de tableaux .npy)
+
+Le pickle buildflow_models.pkl est exporté une fois (commande export_models) vers
+ml_artifacts/<version>/ : moyennes et écarts-types des scalers, coefficients Ridge
+et tableaux de nœuds aplatis des forêts. Les tableaux sont rechargés avec
+mmap_mode='r' : tous les workers gunicorn partagent les mêmes pages physiques
+et le chargement ne nécessite ni unpickling ni la version exacte de scikit-learn.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .ml_inference import FOREST_ARRAYS, CompiledForest, batch_threshold_setting
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FORMAT = 1
+MANIFEST_NAME = 'manifest.json'
+CURRENT_NAME = 'current.json'
+
+# Préfixes des modèles dans le pickle : budget_model / scaler_budget / feature_names_budget, etc.
+MODEL_KINDS = {
+    'budget': 'forest',
+    'retard': 'ridge',
+    'risk': 'forest',
+}
+
+
+def file_sha256(path) -> str:
+    """Calcule l'empreinte SHA-256 d'un fichier par blocs"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactScaler:
+    """Équivalent de StandardScaler.transform à partir de mean_ / scale_"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        X = np.array(X, dtype=np.float64)
+        X -= self.mean_
+        X /= self.scale_
+        return X
+
+
+class ArtifactRidge:
+    """Équivalent de Ridge.predict à partir de coef_ / intercept_"""
+
+    def __init__(self, coef, intercept):
+        self.coef_ = coef
+        self.intercept_ = intercept
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return X @ self.coef_.T + self.intercept_
+
+
+def _save_array(directory: Path, name: str, array) -> str:
+    filename = f'{name}.npy'
+    np.save(directory / filename, np.ascontiguousarray(array))
+    return filename
+
+
+def export_models(models: Dict, output_dir, source_path=None, version: Optional[str] = None,
+                  metrics: Optional[Dict] = None, publish: bool = True) -> Dict:
+    """
+    Exporte un dictionnaire de modèles (format buildflow_models.pkl) vers
+    output_dir/<version>/ et met à jour le pointeur output_dir/current.json
+    (sauf publish=False : la version est écrite mais pas servie).
+    `metrics` (métriques d'entraînement) est enregistré tel quel dans le manifeste.
+
+    Retourne le manifeste écrit.
+    """
+    output_dir = Path(output_dir)
+    source_sha = file_sha256(source_path) if source_path else None
+    if version is None:
+        version = (source_sha or hashlib.sha256(repr(sorted(models)).encode()).hexdigest())[:12]
+
+    target = output_dir / version
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # Répertoire temporaire unique, sur le même système de fichiers que la cible (os.replace)
+    tmp_target = Path(tempfile.mkdtemp(prefix=f'.{version}.', suffix='.tmp', dir=output_dir))
+    try:
+        # mkdtemp crée le répertoire en 0700 : la version publiée doit rester lisible par les workers
+        os.chmod(tmp_target, 0o755)
+        manifest = _write_artifact(models, tmp_target, version, source_path, source_sha, metrics)
+        _swap_directory(tmp_target, target)
+    except Exception:
+        shutil.rmtree(tmp_target, ignore_errors=True)
+        raise
+    if publish:
+        write_current_pointer(output_dir, version)
+    return manifest
+
+
+def _swap_directory(source: Path, target: Path) -> None:
+    """
+    Remplace target par source. Une version existante est d'abord renommée de côté
+    (puis supprimée une fois la nouvelle en place, ou restaurée si le remplacement échoue) :
+    elle n'est jamais supprimée avant os.replace, et les workers qui l'ont chargée en mmap
+    gardent leurs fichiers.
+    """
+    backup = None
+    if target.exists():
+        backup = Path(tempfile.mkdtemp(prefix=f'.{target.name}.', suffix='.old', dir=target.parent))
+        os.replace(target, backup / target.name)
+    try:
+        os.replace(source, target)
+    except Exception:
+        if backup is not None:
+            os.replace(backup / target.name, target)
+            backup.rmdir()
+        raise
+    if backup is not None:
+        shutil.rmtree(backup, ignore_errors=True)
+
+
+def _write_artifact(models: Dict, tmp_target: Path, version: str, source_path, source_sha, metrics) -> Dict:
+    """Écrit les tableaux et le manifeste d'un artefact dans tmp_target ; retourne le manifeste"""
+
+    manifest = {
+        'format': ARTIFACT_FORMAT,
+        'version': version,
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'source': {
+            'path': str(source_path) if source_path else None,
+            'sha256': source_sha,
+        },
+        'sklearn_version': None,
+        'metrics': metrics,
+        'models': {},
+    }
+    try:
+        import sklearn
+        manifest['sklearn_version'] = sklearn.__version__
+    except Exception:
+        pass
+
+    for name, kind in MODEL_KINDS.items():
+        scaler = models[f'scaler_{name}']
+        model = models[f'{name}_model']
+        n_features = len(scaler.mean_)
+        mean = scaler.mean_ if getattr(scaler, 'with_mean', True) and scaler.mean_ is not None else np.zeros(n_features)
+        scale = scaler.scale_ if getattr(scaler, 'with_std', True) and scaler.scale_ is not None else np.ones(n_features)
+
+        entry = {
+            'kind': kind,
+            'feature_names': list(models[f'feature_names_{name}']),
+            'files': {
+                'scaler_mean': _save_array(tmp_target, f'scaler_{name}_mean', np.asarray(mean, dtype=np.float64)),
+                'scaler_scale': _save_array(tmp_target, f'scaler_{name}_scale', np.asarray(scale, dtype=np.float64)),
+            },
+        }
+        if kind == 'ridge':
+            entry['files']['coef'] = _save_array(tmp_target, f'{name}_coef', np.asarray(model.coef_, dtype=np.float64))
+            entry['files']['intercept'] = _save_array(tmp_target, f'{name}_intercept', np.asarray(model.intercept_, dtype=np.float64))
+        else:
+            forest = CompiledForest.from_sklearn(model)
+            entry['classes'] = [c.item() if hasattr(c, 'item') else c for c in forest.classes_]
+            entry['n_estimators'] = forest.n_estimators
+            for array_name in FOREST_ARRAYS:
+                entry['files'][array_name] = _save_array(tmp_target, f'{name}_forest_{array_name}', getattr(forest, array_name))
+        manifest['models'][name] = entry
+
+    with open(tmp_target / MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def write_current_pointer(output_dir, version: str) -> Dict:
+    """Écrit output_dir/current.json de façon atomique (écriture temporaire + os.replace)"""
+    output_dir = Path(output_dir)
+    pointer = {
+        'version': version,
+        'path': version,
+        'sha256': file_sha256(output_dir / version / MANIFEST_NAME),
+    }
+    tmp_path = output_dir / f'.{CURRENT_NAME}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(pointer, f, indent=2)
+    os.replace(tmp_path, output_dir / CURRENT_NAME)
+    return pointer
+
+
+def read_current_pointer(artifacts_dir) -> Optional[Dict]:
+    """Lit le pointeur current.json, ou None s'il n'existe pas"""
+    pointer_path = Path(artifacts_dir) / CURRENT_NAME
+    if not pointer_path.exists():
+        return None
+    with open(pointer_path) as f:
+        return json.load(f)
+
+
+def load_artifact(artifact_dir) -> Tuple[Dict, Dict]:
+    """
+    Charge un artefact versionné sans unpickling.
+
+    Retourne (models, manifest) où models a les mêmes clés que buildflow_models.pkl
+    (budget_model, scaler_budget, feature_names_budget, ...).
+    """
+    artifact_dir = Path(artifact_dir)
+    with open(artifact_dir / MANIFEST_NAME) as f:
+        manifest = json.load(f)
+
+    if manifest.get('format') != ARTIFACT_FORMAT:
+        raise ValueError(f"Format d'artefact non supporté: {manifest.get('format')}")
+
+    def load(filename):
+        return np.load(artifact_dir / filename, mmap_mode='r')
+
+    models = {}
+    for name, entry in manifest['models'].items():
+        files = entry['files']
+        models[f'scaler_{name}'] = ArtifactScaler(load(files['scaler_mean']), load(files['scaler_scale']))
+        models[f'feature_names_{name}'] = list(entry['feature_names'])
+        if entry['kind'] == 'ridge':
+            models[f'{name}_model'] = ArtifactRidge(load(files['coef']), load(files['intercept']))
+        else:
+            models[f'{name}_model'] = CompiledForest(
+                classes=entry['classes'],
+                batch_threshold=batch_threshold_setting(),
+                **{array_name: load(files[array_name]) for array_name in FOREST_ARRAYS}
+            )
+    return models, manifest
+
+
+def load_current_artifact(artifacts_dir) -> Optional[Tuple[Dict, Dict]]:
+    """Charge la version pointée par current.json, ou None si aucun artefact n'est publié"""
+    pointer = read_current_pointer(artifacts_dir)
+    if not pointer:
+        return None
+    return load_artifact(Path(artifacts_dir) / pointer['path'])
@@ -0,0 +1,170 @@
+"""
+Prédictions IA avec budget de latence
+
+Les actions de prédiction d'IAViewSet acceptent `latency_budget_ms`. Le calcul ML
+complet (extraction des features + scoring) est lancé dans un petit pool de threads ;
+s'il ne termine pas dans le budget, la réponse est l'estimation statistique
+(méthode de fallback existante du service) marquée `degraded: true`.
+Le calcul complet continue en arrière-plan et alimente le cache de prédictions :
+la requête suivante sur le même projet obtient directement le résultat ML.
+
+Le cache (alias 'shared', commun aux workers) est indexé par variante et version de
+modèles, projet et version du projet (feature_store.version_projet, comme les jobs
+d'analyse : dernière modification du projet et de ses agrégats ProjetFeatures, tenus
+à jour par les tâches et chantiers) ; ML_PREDICTION_CACHE_TTL borne l'âge d'un résultat.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from .feature_store import version_projet
+from .ml_metrics import ml_metrics
+from .ml_service import ModelBundle
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'shared'
+KINDS = ('delay', 'budget')
+
+# Bundle vide : les méthodes predict_* passent directement à l'estimation statistique
+STATISTICAL_BUNDLE = ModelBundle()
+
+_executor = None
+_executor_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(getattr(settings, 'ML_BACKGROUND_WORKERS', 2)),
+                thread_name_prefix='ml-deadline',
+            )
+        return _executor
+
+
+def _budget_detail(projet):
+    try:
+        return projet.budget_detail
+    except Exception:
+        return None
+
+
+def _cache_key(ia, projet, kind: str, version: str, explain: bool = False) -> str:
+    """`version` : version_projet(projet), partagée par les clés d'un même appel"""
+    model_version = ia.get_ml_service().model_version or 'none'
+    suffix = ':explain' if explain else ''
+    return f'ml:prediction:{kind}:{ia.modele}:{model_version}:{projet.pk}:{version}{suffix}'
+
+
+def _cache_get(key: str):
+    try:
+        return caches[CACHE_ALIAS].get(key)
+    except Exception as e:
+        logger.warning(f"Cache de prédictions indisponible: {str(e)}")
+        return None
+
+
+def _cache_set(key: str, value) -> None:
+    try:
+        caches[CACHE_ALIAS].set(key, value, timeout=int(getattr(settings, 'ML_PREDICTION_CACHE_TTL', 300)))
+    except Exception as e:
+        logger.warning(f"Prédiction non mise en cache: {str(e)}")
+
+
+def _compute(ia, projet_id, kind: str, key: str, explain: bool = False) -> Dict:
+    """Calcul ML complet dans un thread du pool ; le résultat est mis en cache"""
+    from .models import Projet
+    try:
+        projet = Projet.objects.get(pk=projet_id)
+        if kind == 'delay':
+            prediction = ia.predict_delay_risk(projet, explain=explain)
+        else:
+            prediction = ia.predict_budget_overrun(projet, explain=explain)
+        _cache_set(key, prediction)
+        return prediction
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        # Chaque thread du pool a sa propre connexion : ne pas la laisser ouverte entre deux tâches
+        connection.close()
+
+
+def _submit(ia, projet, kind: str, key: str, explain: bool = False):
+    """Lance (ou rejoint) le calcul complet de `key` en arrière-plan"""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _get_executor().submit(_compute, ia, projet.pk, kind, key, explain)
+            _inflight[key] = future
+        return future
+
+
+def statistical_prediction(ia, projet, kind: str) -> Dict:
+    """Estimation statistique (sans modèle), utilisée quand le budget de latence est dépassé"""
+    service = ia.get_ml_service()
+    if kind == 'delay':
+        return service.predict_delay_risk(projet, bundle=STATISTICAL_BUNDLE)
+    return service.predict_budget_overrun(projet, budget=_budget_detail(projet), bundle=STATISTICAL_BUNDLE)
+
+
+def predict_within(ia, projet, kinds: Iterable[str], latency_budget_ms: Optional[float],
+                   explain: bool = False) -> Dict[str, Dict]:
+    """
+    Prédictions `kinds` ('delay', 'budget') du projet avec un budget de latence commun.
+    explain=True demande les contributions des features (absentes d'une réponse dégradée).
+
+    Sans budget : calcul direct, comme IA.predict_delay_risk / predict_budget_overrun.
+    Avec budget : résultat en cache s'il existe, sinon calcul ML borné par le budget,
+    sinon estimation statistique avec 'degraded': True.
+    """
+    kinds = list(kinds)
+    if latency_budget_ms is None:
+        return {
+            kind: ia.predict_delay_risk(projet, explain=explain) if kind == 'delay'
+            else ia.predict_budget_overrun(projet, explain=explain)
+            for kind in kinds
+        }
+
+    deadline = time.monotonic() + max(float(latency_budget_ms), 0) / 1000.0
+    resultats, futures = {}, {}
+    version = version_projet(projet)
+    for kind in kinds:
+        key = _cache_key(ia, projet, kind, version, explain)
+        cached = _cache_get(key)
+        if cached is not None:
+            resultats[kind] = cached
+        else:
+            futures[kind] = _submit(ia, projet, kind, key, explain)
+
+    if futures:
+        wait(list(futures.values()), timeout=max(deadline - time.monotonic(), 0))
+    for kind, future in futures.items():
+        if future.done() and future.exception() is None:
+            resultats[kind] = future.result()
+        else:
+            # Le calcul complet continue en arrière-plan et réchauffe le cache
+            prediction = dict(statistical_prediction(ia, projet, kind))
+            prediction['degraded'] = True
+            ml_metrics.record_degraded(kind)
+            resultats[kind] = prediction
+    return resultats
+
+
+def parse_latency_budget(value) -> Optional[float]:
+    """Lit latency_budget_ms d'une requête ; None si absent, ValueError si invalide"""
+    if value in (None, ''):
+        return None
+    budget = float(value)
+    if budget < 0:
+        raise ValueError('latency_budget_ms doit être positif')
+    return budget
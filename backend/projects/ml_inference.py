@@ -0,0 +1,265 @@
+"""
+Moteur d'inférence compilé pour les RandomForest (budget_model, risk_model)
+
+Les nœuds de tous les arbres sont lus une fois dans des tableaux NumPy plats ;
+la prédiction parcourt ensuite tous les arbres pour tout un lot de lignes avec
+de l'indexation NumPy (une itération par niveau de profondeur, en ne gardant que
+les couples ligne/arbre pas encore arrivés sur une feuille), sans la
+validation ni le dispatch joblib de scikit-learn à chaque appel.
+Les sorties sont identiques bit à bit à RandomForestClassifier.predict_proba.
+
+Le parcours par niveaux est plus rapide que scikit-learn pour une ligne ou un petit lot
+(pas de validation ni de dispatch), mais son coût croît linéairement avec le nombre de
+couples ligne/arbre : au-delà de ML_FOREST_BATCH_THRESHOLD lignes, le lot est confié au
+RandomForestClassifier d'origine quand il est disponible (pickle), sinon (artefact, sans
+scikit-learn) traité par paquets de cette taille pour borner la mémoire des tableaux
+de parcours. `manage.py benchmark_forest` mesure le point de bascule.
+"""
+import numpy as np
+
+FOREST_ARRAYS = ('feature', 'threshold', 'children_left', 'children_right', 'value', 'roots')
+DEFAULT_BATCH_THRESHOLD = 500
+
+
+def batch_threshold_setting() -> int:
+    """Taille de lot au-delà de laquelle une forêt compilée délègue ou découpe (ML_FOREST_BATCH_THRESHOLD)"""
+    try:
+        from django.conf import settings
+        return int(getattr(settings, 'ML_FOREST_BATCH_THRESHOLD', DEFAULT_BATCH_THRESHOLD))
+    except Exception:
+        return DEFAULT_BATCH_THRESHOLD
+
+
+class CompiledForest:
+    """
+    RandomForestClassifier aplati : les nœuds de tous les arbres sont concaténés,
+    children_left/children_right contiennent des indices absolus (-1 pour une feuille)
+    et value contient les probabilités de classe déjà normalisées par nœud.
+    `fallback` (forêt scikit-learn d'origine) score les lots de plus de `batch_threshold`
+    lignes ; sans fallback, ces lots sont découpés (batch_threshold=None : jamais).
+    """
+
+    def __init__(self, feature, threshold, children_left, children_right, value, roots, classes,
+                 fallback=None, batch_threshold=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.classes_ = np.asarray(classes)
+        self.n_estimators = len(self.roots)
+        self.fallback = fallback
+        self.batch_threshold = batch_threshold
+
+        # Enfants entrelacés [gauche, droite] : un seul gather par niveau (2 * nœud + aller_à_droite)
+        self._is_leaf = np.asarray(children_left) == -1
+        self._children = np.empty(2 * len(self._is_leaf), dtype=np.int64)
+        self._children[0::2] = children_left
+        self._children[1::2] = children_right
+        self._feature = np.where(self._is_leaf, 0, feature).astype(np.int64)
+        self.max_depth = self._compute_max_depth()
+
+    def _compute_max_depth(self) -> int:
+        depth = 0
+        frontier = self.roots
+        while True:
+            frontier = frontier[~self._is_leaf[frontier]]
+            if frontier.size == 0:
+                return depth
+            frontier = np.concatenate((self._children[2 * frontier], self._children[2 * frontier + 1]))
+            depth += 1
+
+    @classmethod
+    def from_sklearn(cls, model, batch_threshold=None) -> 'CompiledForest':
+        """
+        Aplatit les arbres d'un RandomForestClassifier entraîné ; avec `batch_threshold`,
+        le modèle d'origine est gardé pour les lots plus grands
+        """
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        n_classes = len(model.classes_)
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            left = tree.children_left.astype(np.int32)
+            right = tree.children_right.astype(np.int32)
+            # Même normalisation que DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :n_classes].astype(np.float64)
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba = proba / normalizer
+
+            roots.append(offset)
+            features.append(tree.feature.astype(np.int32))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(np.where(left >= 0, left + offset, -1).astype(np.int32))
+            rights.append(np.where(right >= 0, right + offset, -1).astype(np.int32))
+            values.append(proba)
+            offset += tree.node_count
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            children_left=np.concatenate(lefts),
+            children_right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int64),
+            classes=model.classes_,
+            fallback=model if batch_threshold else None,
+            batch_threshold=batch_threshold,
+        )
+
+    def apply(self, X):
+        """Retourne l'indice de feuille atteint dans chaque arbre, shape (n_lignes, n_arbres)"""
+        # Les arbres scikit-learn comparent des entrées float32 à des seuils float64
+        X = np.asarray(X, dtype=np.float64).astype(np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        n_rows, n_features = X.shape
+        X_flat = X.ravel()
+
+        # Un couple (ligne, arbre) par position ; seuls les couples pas encore sur une feuille avancent
+        nodes = np.tile(self.roots, n_rows)
+        row_offsets = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, self.n_estimators)
+        active = np.arange(nodes.size)
+        for _ in range(self.max_depth):
+            current = nodes[active]
+            keep = ~self._is_leaf[current]
+            if not keep.all():
+                active = active[keep]
+                current = current[keep]
+                if active.size == 0:
+                    break
+            go_right = X_flat[row_offsets[active] + self._feature[current]] > self.threshold[current]
+            nodes[active] = self._children[2 * current + go_right]
+        return nodes.reshape(n_rows, self.n_estimators)
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        limite = self.batch_threshold
+        if not limite or len(X) <= limite:
+            return self._predict_proba(X)
+        if self.fallback is not None:
+            return self.fallback.predict_proba(X)
+        return np.concatenate([self._predict_proba(X[i:i + limite]) for i in range(0, len(X), limite)])
+
+    def _predict_proba(self, X):
+        leaves = self.apply(X)
+        # Somme séquentielle arbre par arbre (cumsum) : même ordre d'accumulation que scikit-learn
+        proba = np.cumsum(self.value[leaves], axis=1)[:, -1, :]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def contributions(self, X):
+        """
+        Contributions par feature (méthode des chemins de décision) :
+        proba = biais + somme des contributions. À chaque nœud traversé, l'écart entre la
+        distribution du nœud enfant et celle du nœud parent est attribué à la feature du split.
+        Retourne (biais (n_lignes, n_classes), contributions (n_lignes, n_features, n_classes)).
+        """
+        X = np.asarray(X, dtype=np.float64).astype(np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        n_rows, n_features = X.shape
+        X_flat = X.ravel()
+        n_classes = self.value.shape[1]
+        node_deltas = self.node_deltas
+
+        nodes = np.tile(self.roots, n_rows)
+        rows = np.repeat(np.arange(n_rows, dtype=np.int64), self.n_estimators)
+        contributions = np.zeros((n_rows, n_features, n_classes), dtype=np.float64)
+        active = np.arange(nodes.size)
+        for _ in range(self.max_depth):
+            current = nodes[active]
+            keep = ~self._is_leaf[current]
+            if not keep.all():
+                active = active[keep]
+                current = current[keep]
+                if active.size == 0:
+                    break
+            feature = self._feature[current]
+            go_right = X_flat[rows[active] * n_features + feature] > self.threshold[current]
+            child = self._children[2 * current + go_right]
+            np.add.at(contributions, (rows[active], feature), node_deltas[child])
+            nodes[active] = child
+
+        contributions /= self.n_estimators
+        bias = np.broadcast_to(np.asarray(self.value[self.roots]).mean(axis=0), (n_rows, n_classes))
+        return bias, contributions
+
+    @property
+    def node_deltas(self):
+        """Écart de distribution entre chaque nœud et son parent (0 pour les racines), calculé une fois"""
+        deltas = getattr(self, '_node_deltas', None)
+        if deltas is None:
+            value = np.asarray(self.value, dtype=np.float64)
+            parent = np.arange(len(value), dtype=np.int64)
+            internal = np.flatnonzero(~self._is_leaf)
+            parent[np.asarray(self.children_left)[internal]] = internal
+            parent[np.asarray(self.children_right)[internal]] = internal
+            deltas = value - value[parent]
+            self._node_deltas = deltas
+        return deltas
+
+
+def compile_models(models: dict, batch_threshold=None) -> dict:
+    """
+    Remplace les RandomForest scikit-learn d'un dictionnaire de modèles par leur version
+    compilée, qui leur confie les lots de plus de `batch_threshold` lignes
+    (défaut ML_FOREST_BATCH_THRESHOLD)
+    """
+    if batch_threshold is None:
+        batch_threshold = batch_threshold_setting()
+    compiled = dict(models)
+    for key, model in models.items():
+        if key.endswith('_model') and hasattr(model, 'estimators_') and hasattr(model, 'predict_proba'):
+            compiled[key] = CompiledForest.from_sklearn(model, batch_threshold=batch_threshold)
+    return compiled
+
+
+# Préfixe des modèles de régression (les autres sont des classifieurs : predict_proba)
+REGRESSION_KINDS = ('retard',)
+
+
+def scale_rows(models: dict, kind: str, rows):
+    """Normalise un lot de lignes avec le scaler du modèle `kind`"""
+    return models[f'scaler_{kind}'].transform(np.asarray(rows, dtype=np.float64))
+
+
+def score_scaled(models: dict, kind: str, X):
+    """Valeur prédite par ligne (régression) ou vecteur de probabilités (classifieurs) de lignes normalisées"""
+    model = models[f'{kind}_model']
+    if kind in REGRESSION_KINDS:
+        return model.predict(X)
+    return model.predict_proba(X)
+
+
+def explain_scaled(models: dict, kind: str, X):
+    """
+    Décomposition des prédictions de lignes normalisées : (biais, contributions par feature).
+    Ridge : biais = intercept, contribution = coefficient x valeur normalisée (n_lignes, n_features).
+    Forêts : contributions des chemins de décision (n_lignes, n_features, n_classes).
+    """
+    model = models[f'{kind}_model']
+    if kind in REGRESSION_KINDS:
+        X = np.asarray(X, dtype=np.float64)
+        coef = np.asarray(model.coef_, dtype=np.float64).ravel()
+        intercept = float(np.asarray(model.intercept_, dtype=np.float64).ravel()[0])
+        return np.full(len(X), intercept), X * coef
+    if not hasattr(model, 'contributions'):
+        model = CompiledForest.from_sklearn(model)
+    return model.contributions(X)
+
+
+def predict_rows(models: dict, kind: str, rows):
+    """
+    Normalise puis score un lot de lignes avec le modèle `kind` (budget, retard, risk).
+    Retourne une valeur par ligne pour la régression, un vecteur de probabilités sinon.
+    Utilisé à l'identique pour une ligne (in-process) et pour un lot (ml_server).
+    """
+    return score_scaled(models, kind, scale_rows(models, kind, rows))
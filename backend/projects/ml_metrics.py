@@ -0,0 +1,221 @@
+"""
+Observabilité de l'inférence ML (par processus)
+
+- Durées par étape : snapshot (bundle + agrégats du projet), features (compute_ml_features),
+  scale (normalisation), predict (modèle ou aller-retour vers le serveur d'inférence),
+  explain (contributions des features, si demandées), plus la durée totale de chaque prédiction.
+- Compteurs par modèle ('delay', 'budget', 'risk') et résultat (model_used : 'ML',
+  'statistical', 'error').
+- Une prédiction appelée par une autre (fallback statistique de predict_risk, qui passe
+  par predict_delay_risk et predict_budget_overrun) n'est pas comptée à part : seule la
+  prédiction demandée enregistre son résultat, sa durée totale et ses étapes.
+- Dérive des features : moyenne et variance glissantes de chaque feature scorée
+  (algorithme de Welford, O(1) par feature et par appel), comparées aux statistiques
+  d'entraînement enregistrées dans l'artefact (moyenne / écart-type des scalers).
+
+Les valeurs sont propres au worker qui sert la requête ; l'endpoint GET /api/ia/metrics/
+renvoie celles du worker interrogé (avec son pid).
+"""
+import functools
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('snapshot', 'features', 'scale', 'predict', 'explain', 'total')
+# Versions de modèles dont la dérive est suivie (les plus récentes), par worker
+MAX_DRIFT_VERSIONS = 8
+# |moyenne observée - moyenne d'entraînement| au-delà de laquelle une feature est signalée (en écarts-types)
+DRIFT_THRESHOLD = 1.0
+
+# Profondeur des appels instrumentés en cours (> 1 : prédiction imbriquée)
+_profondeur: ContextVar[int] = ContextVar('ml_prediction_depth', default=0)
+
+
+def _imbrique() -> bool:
+    return _profondeur.get() > 1
+
+
+class RunningStats:
+    """Moyenne, variance, min et max en flux (Welford)"""
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def as_dict(self, digits: int = 4) -> Dict:
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': round(self.mean, digits),
+            'std': round(self.std, digits),
+            'min': round(self.min, digits),
+            'max': round(self.max, digits),
+        }
+
+
+class FeatureDrift:
+    """Statistiques glissantes des features d'un modèle, et statistiques d'entraînement de référence"""
+
+    def __init__(self, feature_names: List[str], train_mean, train_scale):
+        self.feature_names = list(feature_names)
+        self.train_mean = np.asarray(train_mean, dtype=np.float64).copy()
+        self.train_scale = np.asarray(train_scale, dtype=np.float64).copy()
+        self.stats = [RunningStats() for _ in self.feature_names]
+
+    def update(self, values) -> None:
+        for stats, value in zip(self.stats, values):
+            stats.update(float(value))
+
+    def report(self) -> Dict:
+        features = {}
+        for i, name in enumerate(self.feature_names):
+            stats = self.stats[i]
+            entry = stats.as_dict()
+            entry['train_mean'] = round(float(self.train_mean[i]), 4)
+            entry['train_std'] = round(float(self.train_scale[i]), 4)
+            if stats.count:
+                scale = self.train_scale[i] if self.train_scale[i] > 0 else 1.0
+                entry['mean_shift'] = round(float((stats.mean - self.train_mean[i]) / scale), 3)
+                entry['std_ratio'] = round(float(stats.std / scale), 3)
+                entry['drift'] = abs(entry['mean_shift']) > DRIFT_THRESHOLD
+            features[name] = entry
+        return features
+
+
+class MLMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.timers = {stage: RunningStats() for stage in STAGES}
+            self.outcomes = {}
+            self.drift = OrderedDict()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start)
+
+    def record_stage(self, name: str, seconds: float) -> None:
+        if _imbrique():
+            return
+        with self._lock:
+            self.timers.setdefault(name, RunningStats()).update(seconds * 1000.0)
+
+    def record_prediction(self, model: str, result, seconds: float) -> None:
+        outcome = result.get('model_used', 'unknown') if isinstance(result, dict) else 'error'
+        with self._lock:
+            counters = self.outcomes.setdefault(model, {})
+            counters[outcome] = counters.get(outcome, 0) + 1
+            self.timers['total'].update(seconds * 1000.0)
+
+    def record_degraded(self, model: str) -> None:
+        """Réponse statistique servie faute de résultat ML dans le budget de latence (ml_deadline)"""
+        with self._lock:
+            counters = self.outcomes.setdefault(model, {})
+            counters['degraded'] = counters.get('degraded', 0) + 1
+
+    def observe_features(self, bundle, kind: str, feature_values) -> None:
+        """Met à jour les statistiques glissantes des features scorées par le modèle `kind` du bundle"""
+        key = (bundle.version, kind)
+        with self._lock:
+            drift = self.drift.get(key)
+            if drift is None:
+                scaler = bundle.models[f'scaler_{kind}']
+                drift = FeatureDrift(bundle.models[f'feature_names_{kind}'], scaler.mean_, scaler.scale_)
+                self.drift[key] = drift
+                while len(self.drift) > MAX_DRIFT_VERSIONS:
+                    self.drift.popitem(last=False)
+            else:
+                self.drift.move_to_end(key)
+            drift.update(feature_values)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            predictions = {}
+            for model, counters in self.outcomes.items():
+                total = sum(count for outcome, count in counters.items() if outcome != 'degraded')
+                predictions[model] = {
+                    'total': total,
+                    'outcomes': dict(counters),
+                    'fallback_rate': round(
+                        sum(count for outcome, count in counters.items() if outcome not in ('ML', 'degraded')) / total, 4
+                    ) if total else 0,
+                }
+            drift = {}
+            for (version, kind), feature_drift in self.drift.items():
+                drift.setdefault(version, {})[kind] = feature_drift.report()
+            return {
+                'pid': os.getpid(),
+                'since': self.started_at,
+                'timings_ms': {stage: stats.as_dict(digits=3) for stage, stats in self.timers.items()},
+                'predictions': predictions,
+                'feature_drift': drift,
+            }
+
+
+def instrumented(model: str):
+    """Décorateur des méthodes predict_* : durée totale et compteur par résultat (model_used)"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = None
+            token = _profondeur.set(_profondeur.get() + 1)
+            try:
+                result = method(*args, **kwargs)
+                return result
+            finally:
+                imbrique = _imbrique()
+                _profondeur.reset(token)
+                if not imbrique:
+                    try:
+                        ml_metrics.record_prediction(model, result, time.perf_counter() - start)
+                    except Exception as e:
+                        logger.debug(f"Métriques ML non enregistrées: {str(e)}")
+        return wrapper
+    return decorator
+
+
+# Instance globale (une par processus)
+ml_metrics = MLMetrics()
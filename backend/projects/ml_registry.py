@@ -0,0 +1,110 @@
+"""
+Registre des variantes de modèles ML (par région, par type de projet, ...)
+
+Chaque IA désigne sa variante par IA.modele. La variante est résolue ainsi :
+1. settings.ML_MODEL_REGISTRY[modele] : répertoire d'artefacts (avec current.json)
+   ou fichier .pkl, relatif à ML_ARTIFACTS_DIR s'il n'est pas absolu ;
+2. convention ML_ARTIFACTS_DIR/<modele>/current.json (export_models --output) ;
+3. sinon le service global ml_service.
+
+Les services des variantes sont chargés à la demande et gardés dans un LRU borné
+(ML_MODEL_REGISTRY_SIZE) : un worker ne garde en mémoire que les variantes qu'il
+sert réellement, et chaque service garde son rechargement à chaud.
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .ml_artifact import CURRENT_NAME
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_SIZE = 4
+
+# Un nom de variante ne doit pas permettre de sortir de ML_ARTIFACTS_DIR
+_NOM_VARIANTE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+
+def _get_setting(name, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+class ModelRegistry:
+    """LRU thread-safe de MLPredictionService indexé par sources (répertoire d'artefacts, pickle)"""
+
+    def __init__(self, max_size: Optional[int] = None):
+        self._max_size = max_size
+        self._services = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self) -> int:
+        if self._max_size is not None:
+            return self._max_size
+        return max(int(_get_setting('ML_MODEL_REGISTRY_SIZE', DEFAULT_REGISTRY_SIZE)), 1)
+
+    def resolve(self, modele: str) -> Optional[Tuple[Optional[Path], Optional[Path]]]:
+        """Retourne (artifacts_dir, model_path) de la variante, ou None pour le modèle global"""
+        if not modele:
+            return None
+        base_dir = Path(_get_setting('ML_ARTIFACTS_DIR', Path(__file__).resolve().parent.parent / 'ml_artifacts'))
+
+        configured = (_get_setting('ML_MODEL_REGISTRY', None) or {}).get(modele)
+        if configured:
+            path = Path(configured)
+            if not path.is_absolute():
+                path = base_dir / path
+            if path.suffix == '.pkl':
+                return None, path
+            return path, None
+
+        if _NOM_VARIANTE.match(modele) and (base_dir / modele / CURRENT_NAME).exists():
+            return base_dir / modele, None
+        return None
+
+    def get_service(self, modele: str):
+        """Service ML de la variante `modele` (chargé à la demande), ou le service global"""
+        sources = self.resolve(modele)
+        if sources is None:
+            from .ml_service import ml_service
+            return ml_service
+
+        with self._lock:
+            service = self._services.get(sources)
+            if service is not None:
+                self._services.move_to_end(sources)
+                return service
+
+        # Chargement hors verrou : les autres variantes restent servies pendant ce temps
+        from .ml_service import MLPredictionService
+        service = MLPredictionService(artifacts_dir=sources[0], model_path=sources[1])
+        if not service.models_loaded:
+            logger.warning(f"Variante ML '{modele}' non chargée ({sources}), méthodes statistiques utilisées")
+
+        with self._lock:
+            # Un autre thread a pu charger la même variante entre-temps : garder la première
+            service = self._services.setdefault(sources, service)
+            self._services.move_to_end(sources)
+            while len(self._services) > self.max_size:
+                evicted, _ = self._services.popitem(last=False)
+                logger.info(f"Variante ML déchargée du registre: {evicted}")
+        return service
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return [str(artifacts_dir or model_path) for artifacts_dir, model_path in self._services]
+
+    def clear(self):
+        with self._lock:
+            self._services.clear()
+
+
+# Registre global (un par processus)
+registry = ModelRegistry()
@@ -0,0 +1,254 @@
+"""
+Serveur d'inférence local avec micro-batching (optionnel)
+
+Lancé par `manage.py run_inference_server`, il écoute sur un socket Unix
+(ML_INFERENCE_SOCKET). Les requêtes arrivant dans une même fenêtre de quelques
+millisecondes sont regroupées en un lot NumPy par modèle : chaque modèle n'est
+exécuté qu'une fois par lot, puis chaque appelant reçoit sa ligne.
+
+Protocole : messages JSON précédés de leur longueur (entier 32 bits big-endian).
+    requête  {"model": "budget" | "retard" | "risk", "features": [float, ...]}
+    réponse  {"result": float | [float, ...], "model_version": str} ou {"error": str}
+
+Côté Django, InferenceClient est utilisé par MLPredictionService quand
+ML_INFERENCE_SOCKET est configuré ; si le serveur ne répond pas, le scoring
+repasse en local.
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from .ml_artifact import MODEL_KINDS
+from .ml_inference import predict_rows
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('!I')
+MAX_MESSAGE_SIZE = 1024 * 1024
+
+
+class InferenceUnavailable(Exception):
+    """Le serveur d'inférence n'a pas pu répondre : l'appelant doit scorer en local"""
+
+
+def send_message(sock, payload) -> None:
+    data = json.dumps(payload).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size: int) -> Optional[bytes]:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            if buffer:
+                raise ConnectionError('Connexion fermée au milieu d\'un message')
+            return None
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def recv_message(sock):
+    """Lit un message ; retourne None si la connexion a été fermée proprement"""
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message trop volumineux: {size} octets")
+    body = _recv_exact(sock, size)
+    if body is None:
+        raise ConnectionError('Connexion fermée au milieu d\'un message')
+    return json.loads(body)
+
+
+class InferenceServer:
+    """
+    Un thread par connexion lit les requêtes et les dépose dans une file ;
+    un thread de batching vide la file par fenêtres de `window_ms` et score chaque lot.
+    """
+
+    def __init__(self, socket_path, service=None, window_ms: float = 5.0, max_batch: int = 256):
+        if service is None:
+            from .ml_service import MLPredictionService
+            service = MLPredictionService()
+        self.socket_path = str(socket_path)
+        self.service = service
+        self.window = max(window_ms, 0) / 1000.0
+        self.max_batch = max(max_batch, 1)
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._listener = None
+        # Chaque connexion a au plus une requête en cours : quand toutes sont dans le lot, inutile d'attendre
+        self._connections = 0
+        self._connections_lock = threading.Lock()
+        self.stats = {'requests': 0, 'batches': 0, 'max_batch_size': 0}
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.socket_path):
+            # Socket laissé par un arrêt brutal précédent
+            os.unlink(self.socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        self._listener.listen(128)
+        threading.Thread(target=self._batch_loop, name='ml-batcher', daemon=True).start()
+        logger.info(f"Serveur d'inférence ML en écoute sur {self.socket_path} (modèles {self.service.model_version})")
+
+        try:
+            while not self._stop.is_set():
+                try:
+                    conn, _ = self._listener.accept()
+                except OSError:
+                    if self._stop.is_set():
+                        break
+                    raise
+                threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except OSError:
+                pass
+            self._listener = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _handle_connection(self, conn) -> None:
+        with self._connections_lock:
+            self._connections += 1
+        try:
+            self._serve_connection(conn)
+        finally:
+            with self._connections_lock:
+                self._connections -= 1
+
+    def _serve_connection(self, conn) -> None:
+        with conn:
+            while not self._stop.is_set():
+                try:
+                    request = recv_message(conn)
+                    if request is None:
+                        return
+                    future = Future()
+                    self._queue.put((request, future))
+                    send_message(conn, future.result())
+                except (OSError, ValueError) as e:
+                    logger.debug(f"Connexion d'inférence fermée: {str(e)}")
+                    return
+
+    def _batch_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            # Attendre la fin de la fenêtre pour regrouper les requêtes concurrentes
+            deadline = time.monotonic() + self.window
+            while len(batch) < min(self.max_batch, self._connections):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[Tuple[dict, Future]]) -> None:
+        self.stats['requests'] += len(batch)
+        self.stats['batches'] += 1
+        self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(batch))
+
+        bundle = self.service._current_bundle()
+        groups = {}
+        for request, future in batch:
+            kind = request.get('model') if isinstance(request, dict) else None
+            if kind not in MODEL_KINDS or not isinstance(request.get('features'), list):
+                future.set_result({'error': f"Requête invalide: modèle {kind!r}"})
+            elif not bundle.loaded:
+                future.set_result({'error': 'Modèles ML non chargés'})
+            else:
+                groups.setdefault(kind, []).append((request, future))
+
+        for kind, items in groups.items():
+            try:
+                outputs = predict_rows(bundle.models, kind, [request['features'] for request, _ in items])
+                for (_, future), output in zip(items, outputs):
+                    result = output.tolist() if getattr(output, 'ndim', 0) else float(output)
+                    future.set_result({'result': result, 'model_version': bundle.version})
+            except Exception as e:
+                logger.error(f"Erreur lors du scoring d'un lot {kind}: {str(e)}")
+                for _, future in items:
+                    if not future.done():
+                        future.set_result({'error': str(e)})
+
+
+class InferenceClient:
+    """
+    Client du serveur d'inférence : une connexion persistante par thread.
+    Après un échec de connexion, le serveur est considéré indisponible pendant
+    `retry_after` secondes pour ne pas payer un timeout à chaque prédiction.
+    """
+
+    def __init__(self, socket_path, timeout: float = 0.5, retry_after: float = 5.0):
+        self.socket_path = str(socket_path)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _close(self) -> None:
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def score(self, kind: str, features) -> Tuple[object, Optional[str]]:
+        """Retourne (résultat, version des modèles) ou lève InferenceUnavailable"""
+        try:
+            sock = self._connection()
+            send_message(sock, {'model': kind, 'features': [float(value) for value in features]})
+            response = recv_message(sock)
+            if response is None:
+                raise ConnectionError('Connexion fermée par le serveur')
+        except (OSError, ValueError) as e:
+            self._close()
+            self._down_until = time.monotonic() + self.retry_after
+            logger.warning(f"Serveur d'inférence injoignable ({self.socket_path}): {str(e)}, "
+                           f"scoring local pendant {self.retry_after:.0f} s")
+            raise InferenceUnavailable(str(e))
+        if 'error' in response:
+            raise InferenceUnavailable(response['error'])
+        return response['result'], response.get('model_version')
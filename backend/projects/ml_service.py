@@ -6,42 +6,142 @@ Utilise les modèles ML entraînés depuis buildflow_models.pkl
 import logging
 import os
 import pickle
+import threading
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from decimal import Decimal
 
+import numpy as np
+
+from .ml_metrics import instrumented, ml_metrics
+
 logger = logging.getLogger(__name__)
 
 
+class ModelBundle:
+    """
+    Ensemble de modèles chargés ensemble (une version).
+    Jamais modifié après création : un rechargement construit un nouveau bundle
+    et remplace la référence du service en une seule affectation.
+    """
+    
+    def __init__(self, models=None, version=None, source=None, identity=None):
+        self.models = models or {}
+        self.version = version
+        self.source = source
+        self.identity = identity
+        self.loaded = bool(self.models)
+
+
 class MLPredictionService:
     """
     Service de prédiction ML pour les projets
     Utilise les modèles ML entraînés depuis buildflow_models.pkl
     Fallback vers des méthodes statistiques si les modèles ne peuvent pas être chargés
+    
+    La version publiée (ml_artifacts/current.json, ou le pickle) est vérifiée au plus
+    toutes les ML_RELOAD_INTERVAL secondes ; une nouvelle version est chargée dans un
+    thread hors du chemin des requêtes puis échangée atomiquement. Les requêtes en cours
+    terminent sur le bundle qu'elles ont pris au début.
     """
     
-    def __init__(self):
+    def __init__(self, artifacts_dir=None, model_path=None):
+        """
+        Sans argument : ML_ARTIFACTS_DIR puis ML_MODELS_PATH (service global).
+        Avec artifacts_dir et/ou model_path : seules ces sources sont utilisées
+        (variantes de modèles du registre, voir ml_registry).
+        """
         self.logger = logger
-        self.models = {}
-        self.models_loaded = False
-        self._load_models()
+        self._artifacts_dir = Path(artifacts_dir) if artifacts_dir else None
+        self._model_path = Path(model_path) if model_path else None
+        self._explicit_sources = bool(artifacts_dir or model_path)
+        self.reload_interval = float(self._get_setting('ML_RELOAD_INTERVAL', 30))
+        self._reload_lock = threading.Lock()
+        self._reloading = False
+        self._failed_identity = None
+        self._last_check = time.monotonic()
+        self._bundle = self._load_bundle()
+    
+    @property
+    def models(self):
+        return self._bundle.models
     
-    def _load_models(self):
-        """Charge les modèles ML depuis le fichier buildflow_models.pkl"""
+    @property
+    def models_loaded(self):
+        return self._bundle.loaded
+    
+    @property
+    def model_version(self):
+        return self._bundle.version
+    
+    def _get_setting(self, name, default):
+        """Lit un réglage Django s'il est configuré, sinon la valeur par défaut"""
+        try:
+            from django.conf import settings
+            return getattr(settings, name, default)
+        except Exception:
+            return default
+    
+    def _paths(self):
+        """(répertoire d'artefacts, chemin du pickle) ; l'un ou l'autre peut être None pour une variante"""
+        if self._explicit_sources:
+            return self._artifacts_dir, self._model_path
+        # ml_service.py est dans projects/, donc on remonte de 2 niveaux pour aller au backend
+        base_dir = Path(__file__).resolve().parent.parent
+        artifacts_dir = Path(self._get_setting('ML_ARTIFACTS_DIR', base_dir / 'ml_artifacts'))
+        model_path = Path(self._get_setting('ML_MODELS_PATH', base_dir / 'buildflow_models.pkl'))
+        return artifacts_dir, model_path
+    
+    def _manifest_identity(self):
+        """
+        Identité de la version publiée, lue sans charger les modèles :
+        chemin + empreinte du manifeste courant, sinon taille + date du pickle
+        """
+        from .ml_artifact import read_current_pointer
+        artifacts_dir, model_path = self._paths()
+        pointer = read_current_pointer(artifacts_dir) if artifacts_dir else None
+        if pointer:
+            return f"artifact:{pointer.get('path')}:{pointer.get('sha256')}"
+        if model_path and model_path.exists():
+            stat = model_path.stat()
+            return f"pickle:{stat.st_size}:{stat.st_mtime_ns}"
+        return None
+    
+    def _load_bundle(self) -> ModelBundle:
+        """
+        Charge les modèles ML : d'abord l'artefact versionné mmap (ml_artifacts/current.json),
+        sinon le fichier buildflow_models.pkl
+        """
+        artifacts_dir, model_path = self._paths()
+        try:
+            identity = self._manifest_identity()
+        except Exception:
+            identity = None
+        
+        try:
+            from .ml_artifact import load_current_artifact
+            loaded = load_current_artifact(artifacts_dir) if artifacts_dir else None
+            if loaded:
+                models, manifest = loaded
+                version = manifest.get('version')
+                self.logger.info(f"Modèles ML chargés depuis l'artefact {version} ({artifacts_dir})")
+                return ModelBundle(models, version, 'artifact', identity)
+        except Exception as e:
+            self.logger.warning(f"Artefact ML illisible ({artifacts_dir}): {str(e)}, chargement du pickle")
+        
         try:
             # Chemin vers le fichier .pkl (dans le répertoire backend)
-            # ml_service.py est dans projects/, donc on remonte de 2 niveaux pour aller au backend
-            base_dir = Path(__file__).resolve().parent.parent
-            model_path = base_dir / 'buildflow_models.pkl'
-            
+            if model_path is None:
+                self.logger.warning(f"Aucun artefact ML publié dans {artifacts_dir}")
+                return ModelBundle(identity=identity)
             if not model_path.exists():
                 self.logger.warning(f"Fichier modèle non trouvé: {model_path}")
-                self.models_loaded = False
-                return
+                return ModelBundle(identity=identity)
             
             with open(model_path, 'rb') as f:
-                self.models = pickle.load(f)
+                models = pickle.load(f)
             
             # Vérifier que tous les modèles nécessaires sont présents
             required_keys = [
@@ -50,96 +150,153 @@ class MLPredictionService:
                 'risk_model', 'scaler_risk', 'feature_names_risk'
             ]
             
-            missing_keys = [key for key in required_keys if key not in self.models]
+            missing_keys = [key for key in required_keys if key not in models]
             if missing_keys:
                 self.logger.warning(f"Clés manquantes dans le modèle: {missing_keys}")
-                self.models_loaded = False
-                return
+                return ModelBundle(identity=identity)
             
-            self.models_loaded = True
-            self.logger.info("Modèles ML chargés avec succès depuis buildflow_models.pkl")
+            # Moteur compilé (parcours vectorisé) pour les petits lots ; la forêt scikit-learn
+            # d'origine reste utilisée au-delà de ML_FOREST_BATCH_THRESHOLD lignes
+            from .ml_inference import compile_models
+            models = compile_models(models)
+            
+            from .ml_artifact import file_sha256
+            version = file_sha256(model_path)[:12]
+            self.logger.info(f"Modèles ML chargés avec succès depuis {model_path.name}")
+            return ModelBundle(models, version, 'pickle', identity)
             
         except Exception as e:
             self.logger.error(f"Erreur lors du chargement des modèles ML: {str(e)}")
             self.logger.warning("Utilisation des méthodes statistiques en fallback")
-            self.models_loaded = False
-            self.models = {}
+            return ModelBundle(identity=identity)
     
-    def extract_ml_features(self, projet, chantiers, taches):
+    def _inference_client(self):
+        """Client du serveur de micro-batching (ML_INFERENCE_SOCKET), réservé au service global"""
+        if self._explicit_sources:
+            return None
+        socket_path = self._get_setting('ML_INFERENCE_SOCKET', '')
+        if not socket_path:
+            return None
+        client = getattr(self, '_client', None)
+        if client is None or client.socket_path != str(socket_path):
+            from .ml_server import InferenceClient
+            client = InferenceClient(socket_path, timeout=float(self._get_setting('ML_INFERENCE_TIMEOUT', 0.5)))
+            self._client = client
+        return client
+    
+    def _score(self, bundle: ModelBundle, kind: str, feature_values):
         """
-        Extrait les caractéristiques d'un projet selon le format attendu par les modèles ML
-        
-        Features attendues:
-        - budget_prevu: Budget prévu du projet
-        - duree_prevue: Durée prévue en jours
-        - nb_ouvriers: Nombre d'ouvriers (estimé depuis les tâches)
-        - incidents_chantier: Nombre d'incidents (estimé depuis les tâches en retard)
-        - experience_entreprise: Score d'expérience (basé sur la priorité et l'avancement)
-        - retard_prevu: Retard prévu en jours (pour certains modèles)
+        Score une ligne de features avec le modèle `kind` : valeur prédite (retard)
+        ou vecteur de probabilités (budget, risk).
+        Passe par le serveur d'inférence s'il répond avec la même version de modèles,
+        sinon score en local.
         """
         try:
-            features = {}
-            
-            # Budget prévu
-            budget_total = float(projet.budget) if projet.budget else 0
-            features['budget_prevu'] = max(budget_total, 1)
-            
-            # Durée prévue
-            if projet.start_date and projet.end_date:
-                duree_prevue = (projet.end_date - projet.start_date).days
-                features['duree_prevue'] = max(duree_prevue, 1)
-            else:
-                features['duree_prevue'] = 365  # Valeur par défaut
-            
-            # Nombre d'ouvriers (estimé depuis le nombre de tâches actives)
-            nb_taches_actives = sum(1 for t in taches if t.status != 'Terminé')
-            # Estimation: 1 ouvrier pour 5 tâches actives (minimum 1)
-            features['nb_ouvriers'] = max(nb_taches_actives // 5, 1)
-            
-            # Incidents chantier (estimé depuis les tâches en retard)
-            nb_taches_retard = sum(
-                1 for t in taches 
-                if t.end_date and t.end_date < datetime.now().date() and t.status != 'Terminé'
-            )
-            features['incidents_chantier'] = nb_taches_retard
-            
-            # Expérience entreprise (score basé sur la priorité et l'avancement)
-            priority_map = {'Haute': 3, 'Moyenne': 2, 'Basse': 1}
-            priorite_num = priority_map.get(projet.priority, 2)
-            
-            avancement = 0
+            ml_metrics.observe_features(bundle, kind, feature_values)
+        except Exception as e:
+            self.logger.debug(f"Statistiques de features non mises à jour: {str(e)}")
+        
+        client = self._inference_client()
+        if client is not None and client.available:
+            from .ml_server import InferenceUnavailable
             try:
-                if hasattr(projet, 'avancement_calcule'):
-                    avancement = float(projet.avancement_calcule) if projet.avancement_calcule else 0
-            except Exception:
-                avancement = 0
-            
-            # Score d'expérience: combinaison de priorité et avancement
-            # Plus le projet est avancé et prioritaire, plus l'expérience est élevée
-            experience_score = (priorite_num * 10) + (avancement / 10)
-            features['experience_entreprise'] = max(experience_score, 1)
-            
-            # Retard prévu (en jours)
-            if projet.start_date and projet.end_date:
-                jours_ecoules = (datetime.now().date() - projet.start_date).days if projet.start_date else 0
-                pourcentage_temps_ecoule = min(jours_ecoules / features['duree_prevue'] if features['duree_prevue'] > 0 else 0, 1.0)
-                retard_avancement = pourcentage_temps_ecoule - (avancement / 100)
-                
-                if retard_avancement > 0:
-                    jours_retard = int(retard_avancement * features['duree_prevue'])
-                else:
-                    # Estimation basée sur la tendance
-                    jours_restants = features['duree_prevue'] - jours_ecoules
-                    if avancement < 50 and pourcentage_temps_ecoule > 0.5:
-                        jours_retard = max(int((0.5 - avancement/100) * jours_restants), 0)
-                    else:
-                        jours_retard = 0
+                with ml_metrics.stage('predict'):
+                    result, version = client.score(kind, feature_values)
+                if version == bundle.version:
+                    return np.asarray(result) if isinstance(result, list) else result
+            except InferenceUnavailable:
+                pass
+        
+        from .ml_inference import scale_rows, score_scaled
+        with ml_metrics.stage('scale'):
+            X = scale_rows(bundle.models, kind, [feature_values])
+        with ml_metrics.stage('predict'):
+            return score_scaled(bundle.models, kind, X)[0]
+    
+    def _explain(self, bundle: ModelBundle, kind: str, feature_values, class_index=None) -> Dict:
+        """
+        Contributions de chaque feature à la prédiction ML (toujours calculées en local) :
+        base_value + somme des contributions = sortie du modèle (jours de retard pour
+        retard_model avant arrondi, probabilité de la classe retenue pour les forêts).
+        """
+        from .ml_inference import explain_scaled, scale_rows
+        with ml_metrics.stage('explain'):
+            feature_names = bundle.models[f'feature_names_{kind}']
+            X = scale_rows(bundle.models, kind, [feature_values])
+            bias, contributions = explain_scaled(bundle.models, kind, X)
+            bias, contributions = bias[0], contributions[0]
+            if class_index is not None:
+                bias, contributions = bias[class_index], contributions[:, class_index]
+            ordre = sorted(range(len(feature_names)), key=lambda i: abs(contributions[i]), reverse=True)
+            return {
+                'base_value': round(float(bias), 4),
+                'contributions': [
+                    {
+                        'feature': feature_names[i],
+                        'value': round(float(feature_values[i]), 4),
+                        'contribution': round(float(contributions[i]), 4),
+                    }
+                    for i in ordre
+                ],
+            }
+    
+    def _current_bundle(self) -> ModelBundle:
+        """Bundle à utiliser pour une prédiction (déclenche au besoin un rechargement en arrière-plan)"""
+        self._maybe_reload()
+        return self._bundle
+    
+    def _maybe_reload(self):
+        if self.reload_interval <= 0:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        with self._reload_lock:
+            if self._reloading or now - self._last_check < self.reload_interval:
+                return
+            self._last_check = now
+            try:
+                identity = self._manifest_identity()
+            except Exception as e:
+                self.logger.warning(f"Lecture du manifeste ML impossible: {str(e)}")
+                return
+            if identity is None or identity in (self._bundle.identity, self._failed_identity):
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, args=(identity,), name='ml-model-reload', daemon=True).start()
+    
+    def _reload(self, identity):
+        try:
+            bundle = self._load_bundle()
+            if bundle.loaded:
+                previous = self._bundle.version
+                # Remplacement atomique : les requêtes en cours gardent leur référence à l'ancien bundle
+                self._bundle = bundle
+                self.logger.info(f"Modèles ML rechargés à chaud: {previous} -> {bundle.version}")
             else:
-                jours_retard = 0
-            
-            features['retard_prevu'] = max(jours_retard, 0)
-            
-            return features
+                self._failed_identity = identity
+                self.logger.warning(f"Nouvelle version ML non chargeable ({identity}), conservation de {self._bundle.version}")
+        except Exception as e:
+            self._failed_identity = identity
+            self.logger.error(f"Erreur lors du rechargement des modèles ML: {str(e)}")
+        finally:
+            self._reloading = False
+    
+    def reload_models(self) -> Optional[str]:
+        """Recharge immédiatement (de façon synchrone) la version publiée ; retourne la version active"""
+        bundle = self._load_bundle()
+        if bundle.loaded or not self._bundle.loaded:
+            self._bundle = bundle
+        self._last_check = time.monotonic()
+        return self._bundle.version
+    
+    def extract_ml_features(self, projet, chantiers, taches):
+        """
+        Extrait les caractéristiques d'un projet selon le format attendu par les modèles ML
+        (voir compute_ml_features) à partir de l'arborescence chargée
+        """
+        try:
+            return compute_ml_features(projet, ProjectAggregates.from_tree(projet, chantiers, taches))
         except Exception as e:
             self.logger.error(f"Erreur lors de l'extraction des features ML: {str(e)}")
             return {}
@@ -147,60 +304,40 @@ class MLPredictionService:
     def extract_project_features(self, projet, chantiers, taches):
         """Extrait les caractéristiques d'un projet (méthode de fallback)"""
         try:
-            features = {}
-            
-            # Caractéristiques temporelles
-            if projet.start_date and projet.end_date:
-                duree_prevue = (projet.end_date - projet.start_date).days
-                jours_ecoules = (datetime.now().date() - projet.start_date).days if projet.start_date else 0
-                features['duree_prevue'] = max(duree_prevue, 1)
-                features['jours_ecoules'] = max(jours_ecoules, 0)
-                features['pourcentage_temps_ecoule'] = min(jours_ecoules / duree_prevue if duree_prevue > 0 else 0, 1.0)
-            else:
-                features['duree_prevue'] = 365
-                features['jours_ecoules'] = 0
-                features['pourcentage_temps_ecoule'] = 0
-            
-            # Caractéristiques budgétaires
-            budget_total = float(projet.budget) if projet.budget else 0
-            budget_utilise = 0
-            for chantier in chantiers:
-                try:
-                    budget_utilise += float(chantier.budget_used) if chantier.budget_used else 0
-                except (ValueError, TypeError):
-                    continue
-            
-            features['budget_total'] = max(budget_total, 1)
-            features['budget_utilise'] = budget_utilise
-            features['ratio_budget'] = budget_utilise / features['budget_total'] if features['budget_total'] > 0 else 0
-            
-            # Caractéristiques d'avancement
-            avancement = 0
-            try:
-                if hasattr(projet, 'avancement_calcule'):
-                    avancement = float(projet.avancement_calcule) if projet.avancement_calcule else 0
-            except Exception:
-                avancement = 0
-            
-            features['avancement'] = min(max(avancement, 0), 100)
-            features['retard_avancement'] = features['pourcentage_temps_ecoule'] - (features['avancement'] / 100)
-            
-            # Caractéristiques structurelles
-            features['nb_chantiers'] = len(chantiers)
-            features['nb_taches'] = len(taches)
-            features['nb_taches_terminees'] = sum(1 for t in taches if t.status == 'Terminé')
-            features['nb_taches_en_retard'] = sum(1 for t in taches if t.end_date and t.end_date < datetime.now().date() and t.status != 'Terminé')
-            
-            # Caractéristiques de priorité
-            priority_map = {'Haute': 3, 'Moyenne': 2, 'Basse': 1}
-            features['priorite_num'] = priority_map.get(projet.priority, 2)
-            
-            return features
+            return compute_project_features(projet, ProjectAggregates.from_tree(projet, chantiers, taches))
         except Exception as e:
             self.logger.error(f"Erreur lors de l'extraction des features: {str(e)}")
             return {}
     
-    def predict_delay_risk(self, projet, chantiers=None, taches=None) -> Dict:
+    def _aggregates(self, projet, chantiers=None, taches=None) -> 'ProjectAggregates':
+        """
+        Agrégats du projet : une lecture par clé primaire de ProjetFeatures quand
+        l'appelant n'a pas déjà chargé l'arborescence, sinon calcul depuis les tâches
+        """
+        if chantiers is None and taches is None:
+            try:
+                from .models import ProjetFeatures
+                row = ProjetFeatures.objects.filter(pk=projet.pk).first()
+                if row is not None:
+                    return ProjectAggregates.from_store(row)
+            except Exception as e:
+                self.logger.warning(f"Feature store illisible pour le projet {projet.pk}: {str(e)}")
+        
+        if chantiers is None:
+            chantiers = list(projet.chantiers.all())
+        if taches is None:
+            taches = []
+            for chantier in chantiers:
+                try:
+                    for lot in chantier.lots.all():
+                        taches.extend(list(lot.taches.all()))
+                except Exception:
+                    continue
+        return ProjectAggregates.from_tree(projet, chantiers, taches)
+    
+    @instrumented('delay')
+    def predict_delay_risk(self, projet, chantiers=None, taches=None, bundle=None, aggregates=None,
+                           explain=False) -> Dict:
         """
         Prédit le risque de retard de livraison en utilisant le modèle ML si disponible
         
@@ -211,35 +348,30 @@ class MLPredictionService:
                 'days_delay': int (jours de retard estimés),
                 'confidence': float (0-1)
             }
+        explain=True ajoute 'explanation' (contributions des features, voir _explain)
+        quand le modèle ML est utilisé.
         """
+        # Bundle figé pour toute la prédiction, même si un rechargement à chaud intervient
+        snapshot_start = time.perf_counter()
+        bundle = bundle or self._current_bundle()
         try:
-            if chantiers is None:
-                chantiers = list(projet.chantiers.all())
-            if taches is None:
-                taches = []
-                for chantier in chantiers:
-                    try:
-                        for lot in chantier.lots.all():
-                            taches.extend(list(lot.taches.all()))
-                    except Exception:
-                        continue
+            # Une lecture de ProjetFeatures, ou l'arborescence fournie / chargée
+            aggregates = aggregates or self._aggregates(projet, chantiers, taches)
+            ml_metrics.record_stage('snapshot', time.perf_counter() - snapshot_start)
             
             # Essayer d'utiliser le modèle ML
-            if self.models_loaded and 'retard_model' in self.models:
+            if bundle.loaded and 'retard_model' in bundle.models:
                 try:
-                    ml_features = self.extract_ml_features(projet, chantiers, taches)
+                    with ml_metrics.stage('features'):
+                        ml_features = compute_ml_features(projet, aggregates)
                     if ml_features:
                         # Préparer les features selon l'ordre attendu par le modèle
-                        feature_names = self.models['feature_names_retard']
+                        feature_names = bundle.models['feature_names_retard']
                         feature_values = [ml_features.get(name, 0) for name in feature_names]
                         
-                        # Normaliser avec le scaler
-                        scaler = self.models['scaler_retard']
-                        feature_array = scaler.transform([feature_values])
+                        # Normaliser puis prédire avec le modèle Ridge (serveur d'inférence si configuré)
                         
-                        # Prédire avec le modèle Ridge
-                        model = self.models['retard_model']
-                        days_delay_predicted = model.predict(feature_array)[0]
+                        days_delay_predicted = self._score(bundle, 'retard', feature_values)
                         days_delay = max(int(days_delay_predicted), 0)
                         
                         # Calculer le score de risque basé sur la prédiction
@@ -255,22 +387,26 @@ class MLPredictionService:
                             risk_level = 'faible'
                         
                         # Calculer la confiance
-                        nb_taches_total = len(taches)
+                        nb_taches_total = aggregates.nb_taches
                         confidence = min(0.6 + (nb_taches_total / 20) * 0.3, 0.95) if nb_taches_total > 0 else 0.5
                         confidence = max(confidence, 0.3)
                         
-                        return {
+                        result = {
                             'risk_level': risk_level,
                             'risk_score': round(risk_score, 3),
                             'days_delay': days_delay,
                             'confidence': round(confidence, 2),
-                            'model_used': 'ML'
+                            'model_used': 'ML',
+                            'model_version': bundle.version
                         }
+                        if explain:
+                            result['explanation'] = self._explain(bundle, 'retard', feature_values)
+                        return result
                 except Exception as e:
                     self.logger.warning(f"Erreur lors de l'utilisation du modèle ML pour retard: {str(e)}, fallback vers méthode statistique")
             
             # Fallback vers la méthode statistique
-            features = self.extract_project_features(projet, chantiers, taches)
+            features = compute_project_features(projet, aggregates)
             
             if not features:
                 return {
@@ -278,7 +414,8 @@ class MLPredictionService:
                     'risk_score': 0.5,
                     'days_delay': 0,
                     'confidence': 0.3,
-                    'model_used': 'statistical'
+                    'model_used': 'statistical',
+                    'model_version': bundle.version
                 }
             
             # Calcul du score de risque basé sur plusieurs facteurs
@@ -344,6 +481,7 @@ class MLPredictionService:
                 'days_delay': max(jours_retard, 0),
                 'confidence': round(confidence, 2),
                 'model_used': 'statistical',
+                'model_version': bundle.version,
                 'factors': {
                     'retard_avancement': round(retard_avancement, 3),
                     'ratio_taches_retard': round(ratio_retard, 3),
@@ -358,10 +496,13 @@ class MLPredictionService:
                 'days_delay': 0,
                 'confidence': 0.3,
                 'model_used': 'error',
+                'model_version': bundle.version,
                 'error': str(e) if logger.level <= logging.DEBUG else None
             }
     
-    def predict_budget_overrun(self, projet, chantiers=None, budget=None) -> Dict:
+    @instrumented('budget')
+    def predict_budget_overrun(self, projet, chantiers=None, budget=None, bundle=None, aggregates=None,
+                               explain=False) -> Dict:
         """
         Prédit le risque de dépassement budgétaire en utilisant le modèle ML si disponible
         
@@ -373,19 +514,18 @@ class MLPredictionService:
                 'estimated_total': float (montant total estimé),
                 'confidence': float (0-1)
             }
+        explain=True ajoute 'explanation' quand le modèle ML est utilisé.
         """
+        # Bundle figé pour toute la prédiction, même si un rechargement à chaud intervient
+        snapshot_start = time.perf_counter()
+        bundle = bundle or self._current_bundle()
         try:
-            if chantiers is None:
-                chantiers = list(projet.chantiers.all())
+            # Une lecture de ProjetFeatures, ou l'arborescence fournie / chargée
+            aggregates = aggregates or self._aggregates(projet, chantiers)
+            ml_metrics.record_stage('snapshot', time.perf_counter() - snapshot_start)
             
             budget_total = float(projet.budget) if projet.budget else 0
-            budget_utilise = 0
-            
-            for chantier in chantiers:
-                try:
-                    budget_utilise += float(chantier.budget_used) if chantier.budget_used else 0
-                except (ValueError, TypeError):
-                    continue
+            budget_utilise = aggregates.budget_utilise
             
             # Si on a un budget détaillé
             if budget:
@@ -406,48 +546,30 @@ class MLPredictionService:
                     'estimated_overrun': 0,
                     'estimated_total': budget_total,
                     'confidence': 0.3,
-                    'model_used': 'statistical'
+                    'model_used': 'statistical',
+                    'model_version': bundle.version
                 }
             
-            # Récupérer les tâches
-            taches = []
-            for chantier in chantiers:
-                try:
-                    for lot in chantier.lots.all():
-                        taches.extend(list(lot.taches.all()))
-                except Exception:
-                    continue
-            
             # Essayer d'utiliser le modèle ML
-            if self.models_loaded and 'budget_model' in self.models:
+            if bundle.loaded and 'budget_model' in bundle.models:
                 try:
-                    ml_features = self.extract_ml_features(projet, chantiers, taches)
+                    with ml_metrics.stage('features'):
+                        ml_features = compute_ml_features(projet, aggregates)
                     if ml_features:
                         # Préparer les features selon l'ordre attendu par le modèle
-                        feature_names = self.models['feature_names_budget']
+                        feature_names = bundle.models['feature_names_budget']
                         feature_values = [ml_features.get(name, 0) for name in feature_names]
                         
-                        # Normaliser avec le scaler
-                        scaler = self.models['scaler_budget']
-                        feature_array = scaler.transform([feature_values])
+                        # Normaliser puis prédire avec le modèle RandomForest (serveur d'inférence si configuré)
                         
-                        # Prédire avec le modèle RandomForest
-                        model = self.models['budget_model']
-                        prediction = model.predict_proba(feature_array)[0]
+                        prediction = self._score(bundle, 'budget', feature_values)
                         
                         # Le modèle prédit la probabilité de dépassement
                         # Classe 1 = dépassement, classe 0 = pas de dépassement
                         risk_score = prediction[1] if len(prediction) > 1 else prediction[0]
                         
                         # Calculer l'estimation du dépassement
-                        avancement = 0
-                        try:
-                            if hasattr(projet, 'avancement_calcule'):
-                                avancement = float(projet.avancement_calcule) if projet.avancement_calcule else 0
-                        except Exception:
-                            avancement = 50
-                        
-                        avancement = max(min(avancement, 100), 0)
+                        avancement = max(min(aggregates.avancement, 100), 0)
                         
                         if avancement > 0 and avancement < 100:
                             consommation_finale_estimee = montant_depense / (avancement / 100) if avancement > 0 else montant_prev
@@ -474,7 +596,7 @@ class MLPredictionService:
                         if budget_total > 0:
                             confidence = max(confidence, 0.4)
                         
-                        return {
+                        result = {
                             'risk_level': risk_level,
                             'risk_score': round(risk_score, 3),
                             'estimated_overrun': round(estimated_overrun, 2),
@@ -483,22 +605,19 @@ class MLPredictionService:
                             'budget_prev': round(montant_prev, 2),
                             'confidence': round(confidence, 2),
                             'ratio_consommation': round(montant_depense / montant_prev, 3) if montant_prev > 0 else 0,
-                            'model_used': 'ML'
+                            'model_used': 'ML',
+                            'model_version': bundle.version
                         }
+                        if explain:
+                            result['explanation'] = self._explain(bundle, 'budget', feature_values, class_index=1 if len(prediction) > 1 else 0)
+                        return result
                 except Exception as e:
                     self.logger.warning(f"Erreur lors de l'utilisation du modèle ML pour budget: {str(e)}, fallback vers méthode statistique")
             
             # Fallback vers la méthode statistique
             ratio_consommation = montant_depense / montant_prev if montant_prev > 0 else 0
             
-            avancement = 0
-            try:
-                if hasattr(projet, 'avancement_calcule'):
-                    avancement = float(projet.avancement_calcule) if projet.avancement_calcule else 0
-            except Exception:
-                avancement = 50
-            
-            avancement = max(min(avancement, 100), 0)
+            avancement = max(min(aggregates.avancement, 100), 0)
             
             # Facteurs de risque
             risk_factors = []
@@ -547,7 +666,8 @@ class MLPredictionService:
                 'budget_prev': round(montant_prev, 2),
                 'confidence': round(confidence, 2),
                 'ratio_consommation': round(ratio_consommation, 3),
-                'model_used': 'statistical'
+                'model_used': 'statistical',
+                'model_version': bundle.version
             }
         except Exception as e:
             self.logger.error(f"Erreur lors de la prédiction budgétaire: {str(e)}")
@@ -558,10 +678,13 @@ class MLPredictionService:
                 'estimated_total': float(projet.budget) if projet.budget else 0,
                 'confidence': 0.3,
                 'model_used': 'error',
+                'model_version': bundle.version,
                 'error': str(e) if logger.level <= logging.DEBUG else None
             }
     
-    def predict_risk(self, projet, chantiers=None, taches=None) -> Dict:
+    @instrumented('risk')
+    def predict_risk(self, projet, chantiers=None, taches=None, bundle=None, aggregates=None,
+                     explain=False) -> Dict:
         """
         Prédit le risque global du projet en utilisant le modèle risk_model si disponible
         
@@ -571,35 +694,29 @@ class MLPredictionService:
                 'risk_score': float (0-1),
                 'confidence': float (0-1)
             }
+        explain=True ajoute 'explanation' quand le modèle ML est utilisé.
         """
+        # Bundle figé pour toute la prédiction, même si un rechargement à chaud intervient
+        snapshot_start = time.perf_counter()
+        bundle = bundle or self._current_bundle()
         try:
-            if chantiers is None:
-                chantiers = list(projet.chantiers.all())
-            if taches is None:
-                taches = []
-                for chantier in chantiers:
-                    try:
-                        for lot in chantier.lots.all():
-                            taches.extend(list(lot.taches.all()))
-                    except Exception:
-                        continue
+            # Une lecture de ProjetFeatures, ou l'arborescence fournie / chargée
+            aggregates = aggregates or self._aggregates(projet, chantiers, taches)
+            ml_metrics.record_stage('snapshot', time.perf_counter() - snapshot_start)
             
             # Essayer d'utiliser le modèle ML
-            if self.models_loaded and 'risk_model' in self.models:
+            if bundle.loaded and 'risk_model' in bundle.models:
                 try:
-                    ml_features = self.extract_ml_features(projet, chantiers, taches)
+                    with ml_metrics.stage('features'):
+                        ml_features = compute_ml_features(projet, aggregates)
                     if ml_features:
                         # Préparer les features selon l'ordre attendu par le modèle
-                        feature_names = self.models['feature_names_risk']
+                        feature_names = bundle.models['feature_names_risk']
                         feature_values = [ml_features.get(name, 0) for name in feature_names]
                         
-                        # Normaliser avec le scaler
-                        scaler = self.models['scaler_risk']
-                        feature_array = scaler.transform([feature_values])
+                        # Normaliser puis prédire avec le modèle RandomForest (serveur d'inférence si configuré)
                         
-                        # Prédire avec le modèle RandomForest
-                        model = self.models['risk_model']
-                        prediction = model.predict_proba(feature_array)[0]
+                        prediction = self._score(bundle, 'risk', feature_values)
                         
                         # Le modèle prédit la probabilité de risque
                         risk_score = prediction[1] if len(prediction) > 1 else prediction[0]
@@ -613,22 +730,26 @@ class MLPredictionService:
                             risk_level = 'faible'
                         
                         # Calculer la confiance
-                        nb_taches_total = len(taches)
+                        nb_taches_total = aggregates.nb_taches
                         confidence = min(0.6 + (nb_taches_total / 20) * 0.3, 0.95) if nb_taches_total > 0 else 0.5
                         confidence = max(confidence, 0.3)
                         
-                        return {
+                        result = {
                             'risk_level': risk_level,
                             'risk_score': round(risk_score, 3),
                             'confidence': round(confidence, 2),
-                            'model_used': 'ML'
+                            'model_used': 'ML',
+                            'model_version': bundle.version
                         }
+                        if explain:
+                            result['explanation'] = self._explain(bundle, 'risk', feature_values, class_index=1 if len(prediction) > 1 else 0)
+                        return result
                 except Exception as e:
                     self.logger.warning(f"Erreur lors de l'utilisation du modèle ML pour risque: {str(e)}, fallback vers méthode statistique")
             
             # Fallback: utiliser les prédictions de retard et budget
-            delay_pred = self.predict_delay_risk(projet, chantiers, taches)
-            budget_pred = self.predict_budget_overrun(projet, chantiers)
+            delay_pred = self.predict_delay_risk(projet, chantiers, taches, bundle=bundle, aggregates=aggregates)
+            budget_pred = self.predict_budget_overrun(projet, chantiers, bundle=bundle, aggregates=aggregates)
             
             # Combiner les scores
             combined_score = (delay_pred.get('risk_score', 0.5) + budget_pred.get('risk_score', 0.5)) / 2
@@ -645,7 +766,8 @@ class MLPredictionService:
                 'risk_level': risk_level,
                 'risk_score': round(combined_score, 3),
                 'confidence': round(combined_confidence, 2),
-                'model_used': 'statistical'
+                'model_used': 'statistical',
+                'model_version': bundle.version
             }
         except Exception as e:
             self.logger.error(f"Erreur lors de la prédiction de risque: {str(e)}")
@@ -654,6 +776,7 @@ class MLPredictionService:
                 'risk_score': 0.5,
                 'confidence': 0.3,
                 'model_used': 'error',
+                'model_version': bundle.version,
                 'error': str(e) if logger.level <= logging.DEBUG else None
             }
     
@@ -746,18 +869,20 @@ class MLPredictionService:
                                     'priority': 'medium',
                                     'message': f'Les projets similaires ont eu en moyenne {int(retard_moyen)} jours de retard',
                                     'action': 'Appliquer les leçons apprises et ajuster la planification',
-                                    'based_on': len(projets_similaires)
+                                    'based_on': len(projets_similaires),
+                                    'similar_projects': [h.get('name') for h in projets_similaires if h.get('name')]
                                 })
                             
                             if depassements_moyens:
                                 depassement_moyen = sum(depassements_moyens) / len(depassements_moyens)
-                                if depassement_moyen > projet.budget * 0.1:
+                                if depassement_moyen > float(projet.budget or 0) * 0.1:
                                     recommendations.append({
                                         'type': 'historical',
                                         'priority': 'medium',
                                         'message': f'Dépassement budgétaire moyen de {depassement_moyen:,.2f} XOF sur projets similaires',
                                         'action': 'Allouer une marge de sécurité supplémentaire',
-                                        'based_on': len(projets_similaires)
+                                        'based_on': len(projets_similaires),
+                                        'similar_projects': [h.get('name') for h in projets_similaires if h.get('name')]
                                     })
                 except Exception as e:
                     self.logger.warning(f"Erreur lors de l'analyse historique: {str(e)}")
@@ -803,5 +928,186 @@ class MLPredictionService:
             }]
 
 
+class ProjectAggregates:
+    """
+    Agrégats d'un projet dont dépendent les features ML et statistiques.
+    Calculés depuis l'arborescence (from_tree) ou lus dans ProjetFeatures (from_store).
+    """
+    
+    def __init__(self, nb_chantiers=0, nb_taches=0, nb_taches_terminees=0, nb_taches_en_retard=0,
+                 budget_utilise=0.0, avancement=0.0):
+        self.nb_chantiers = nb_chantiers
+        self.nb_taches = nb_taches
+        self.nb_taches_terminees = nb_taches_terminees
+        self.nb_taches_en_retard = nb_taches_en_retard
+        self.budget_utilise = budget_utilise
+        self.avancement = avancement
+    
+    @property
+    def nb_taches_actives(self) -> int:
+        return self.nb_taches - self.nb_taches_terminees
+    
+    def as_dict(self) -> Dict:
+        """Valeurs JSON des agrégats (RiskSnapshot.features), relues par ProjectAggregates(**valeurs)"""
+        return {
+            'nb_chantiers': int(self.nb_chantiers),
+            'nb_taches': int(self.nb_taches),
+            'nb_taches_terminees': int(self.nb_taches_terminees),
+            'nb_taches_en_retard': int(self.nb_taches_en_retard),
+            'budget_utilise': float(self.budget_utilise or 0),
+            'avancement': float(self.avancement or 0),
+        }
+    
+    @classmethod
+    def from_tree(cls, projet, chantiers, taches, today=None) -> 'ProjectAggregates':
+        today = today or datetime.now().date()
+        budget_utilise = 0
+        for chantier in chantiers:
+            try:
+                budget_utilise += float(chantier.budget_used) if chantier.budget_used else 0
+            except (ValueError, TypeError):
+                continue
+        
+        avancement = 0
+        try:
+            if hasattr(projet, 'avancement_calcule'):
+                avancement = float(projet.avancement_calcule) if projet.avancement_calcule else 0
+        except Exception:
+            avancement = 0
+        
+        return cls(
+            nb_chantiers=len(chantiers),
+            nb_taches=len(taches),
+            nb_taches_terminees=sum(1 for t in taches if t.status == 'Terminé'),
+            nb_taches_en_retard=sum(1 for t in taches if t.end_date and t.end_date < today and t.status != 'Terminé'),
+            budget_utilise=budget_utilise,
+            avancement=avancement,
+        )
+    
+    @classmethod
+    def from_store(cls, row, today=None) -> 'ProjectAggregates':
+        today = today or datetime.now().date()
+        nb_taches_en_retard = row.nb_taches_en_retard
+        if row.date_reference != today:
+            # Ligne pas encore rafraîchie aujourd'hui : les retards dépendent de la date
+            from .models import Tache
+            nb_taches_en_retard = Tache.objects.filter(
+                lot__chantier__projet_id=row.projet_id, end_date__lt=today
+            ).exclude(status='Terminé').count()
+        return cls(
+            nb_chantiers=row.nb_chantiers,
+            nb_taches=row.nb_taches,
+            nb_taches_terminees=row.nb_taches_terminees,
+            nb_taches_en_retard=nb_taches_en_retard,
+            budget_utilise=float(row.budget_utilise or 0),
+            avancement=float(row.avancement or 0),
+        )
+
+
+def compute_ml_features(projet, aggregates: ProjectAggregates, today=None) -> Dict:
+    """
+    Features au format attendu par les modèles ML
+    
+    Features attendues:
+    - budget_prevu: Budget prévu du projet
+    - duree_prevue: Durée prévue en jours
+    - nb_ouvriers: Nombre d'ouvriers (estimé depuis les tâches)
+    - incidents_chantier: Nombre d'incidents (estimé depuis les tâches en retard)
+    - experience_entreprise: Score d'expérience (basé sur la priorité et l'avancement)
+    - retard_prevu: Retard prévu en jours (pour certains modèles)
+    """
+    today = today or datetime.now().date()
+    features = {}
+    
+    # Budget prévu
+    budget_total = float(projet.budget) if projet.budget else 0
+    features['budget_prevu'] = max(budget_total, 1)
+    
+    # Durée prévue
+    if projet.start_date and projet.end_date:
+        duree_prevue = (projet.end_date - projet.start_date).days
+        features['duree_prevue'] = max(duree_prevue, 1)
+    else:
+        features['duree_prevue'] = 365  # Valeur par défaut
+    
+    # Nombre d'ouvriers (estimé: 1 ouvrier pour 5 tâches actives, minimum 1)
+    features['nb_ouvriers'] = max(aggregates.nb_taches_actives // 5, 1)
+    
+    # Incidents chantier (estimé depuis les tâches en retard)
+    features['incidents_chantier'] = aggregates.nb_taches_en_retard
+    
+    # Expérience entreprise (score basé sur la priorité et l'avancement)
+    priority_map = {'Haute': 3, 'Moyenne': 2, 'Basse': 1}
+    priorite_num = priority_map.get(projet.priority, 2)
+    avancement = aggregates.avancement
+    
+    # Score d'expérience: combinaison de priorité et avancement
+    # Plus le projet est avancé et prioritaire, plus l'expérience est élevée
+    experience_score = (priorite_num * 10) + (avancement / 10)
+    features['experience_entreprise'] = max(experience_score, 1)
+    
+    # Retard prévu (en jours)
+    if projet.start_date and projet.end_date:
+        jours_ecoules = (today - projet.start_date).days if projet.start_date else 0
+        pourcentage_temps_ecoule = min(jours_ecoules / features['duree_prevue'] if features['duree_prevue'] > 0 else 0, 1.0)
+        retard_avancement = pourcentage_temps_ecoule - (avancement / 100)
+        
+        if retard_avancement > 0:
+            jours_retard = int(retard_avancement * features['duree_prevue'])
+        else:
+            # Estimation basée sur la tendance
+            jours_restants = features['duree_prevue'] - jours_ecoules
+            if avancement < 50 and pourcentage_temps_ecoule > 0.5:
+                jours_retard = max(int((0.5 - avancement/100) * jours_restants), 0)
+            else:
+                jours_retard = 0
+    else:
+        jours_retard = 0
+    
+    features['retard_prevu'] = max(jours_retard, 0)
+    
+    return features
+
+
+def compute_project_features(projet, aggregates: ProjectAggregates, today=None) -> Dict:
+    """Caractéristiques d'un projet pour les méthodes statistiques de fallback"""
+    today = today or datetime.now().date()
+    features = {}
+    
+    # Caractéristiques temporelles
+    if projet.start_date and projet.end_date:
+        duree_prevue = (projet.end_date - projet.start_date).days
+        jours_ecoules = (today - projet.start_date).days if projet.start_date else 0
+        features['duree_prevue'] = max(duree_prevue, 1)
+        features['jours_ecoules'] = max(jours_ecoules, 0)
+        features['pourcentage_temps_ecoule'] = min(jours_ecoules / duree_prevue if duree_prevue > 0 else 0, 1.0)
+    else:
+        features['duree_prevue'] = 365
+        features['jours_ecoules'] = 0
+        features['pourcentage_temps_ecoule'] = 0
+    
+    # Caractéristiques budgétaires
+    budget_total = float(projet.budget) if projet.budget else 0
+    features['budget_total'] = max(budget_total, 1)
+    features['budget_utilise'] = aggregates.budget_utilise
+    features['ratio_budget'] = aggregates.budget_utilise / features['budget_total'] if features['budget_total'] > 0 else 0
+    
+    # Caractéristiques d'avancement
+    features['avancement'] = min(max(aggregates.avancement, 0), 100)
+    features['retard_avancement'] = features['pourcentage_temps_ecoule'] - (features['avancement'] / 100)
+    
+    # Caractéristiques structurelles
+    features['nb_chantiers'] = aggregates.nb_chantiers
+    features['nb_taches'] = aggregates.nb_taches
+    features['nb_taches_terminees'] = aggregates.nb_taches_terminees
+    features['nb_taches_en_retard'] = aggregates.nb_taches_en_retard
+    
+    # Caractéristiques de priorité
+    priority_map = {'Haute': 3, 'Moyenne': 2, 'Basse': 1}
+    features['priorite_num'] = priority_map.get(projet.priority, 2)
+    
+    return features
+
+
 # Instance globale du service
 ml_service = MLPredictionService()
@@ -0,0 +1,305 @@
+"""
+Index des projets terminés les plus proches (historique des recommandations)
+
+Chaque projet terminé est décrit par un vecteur de caractéristiques connues dès la
+planification (budget, durée prévue, nombre de chantiers et de tâches, priorité),
+comparable à celui d'un projet en cours. Les vecteurs sont gardés en mémoire dans
+une matrice NumPy ; la recherche des k plus proches voisins est une recherche
+exhaustive en distance euclidienne sur les colonnes centrées-réduites.
+
+Pour chaque voisin, l'index garde le retard réel (jours entre la date de fin prévue
+et la date de fin réelle, Projet.date_fin_reelle, posée au passage à 'Terminé') et le
+dépassement réel (budget consommé des chantiers au-delà du budget).
+
+L'index est construit à la première recherche puis tenu à jour incrémentalement :
+- les signaux Projet marquent les projets qui passent à 'Terminé' (ou en sortent),
+  rechargés en une requête à la recherche suivante ;
+- toutes les ML_SIMILARITY_SYNC_INTERVAL secondes, les projets modifiés depuis la
+  dernière synchronisation sont relus (changements faits par d'autres workers), et
+  l'index est reconstruit si le nombre de projets terminés ne correspond plus.
+"""
+import logging
+import math
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STATUT_TERMINE = 'Terminé'
+DEFAULT_K = 5
+DEFAULT_SYNC_INTERVAL = 60.0
+
+PRIORITY_MAP = {'Haute': 3, 'Moyenne': 2, 'Basse': 1}
+FEATURE_NAMES = ['log_budget', 'log_duree_prevue', 'log_nb_chantiers', 'log_nb_taches', 'priorite_num']
+RELOAD_FIELDS = [
+    'id', 'name', 'status', 'budget', 'priority', 'start_date', 'end_date', 'date_fin_reelle',
+    'features__nb_chantiers', 'features__nb_taches', 'features__budget_utilise',
+]
+
+
+def _get_setting(name, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def similarity_vector(budget, start_date, end_date, priority, nb_chantiers, nb_taches) -> List[float]:
+    """Vecteur de similarité d'un projet (mêmes colonnes que FEATURE_NAMES)"""
+    if start_date and end_date:
+        duree_prevue = max((end_date - start_date).days, 1)
+    else:
+        duree_prevue = 365
+    return [
+        math.log1p(max(float(budget or 0), 0)),
+        math.log1p(duree_prevue),
+        math.log1p(nb_chantiers or 0),
+        math.log1p(nb_taches or 0),
+        float(PRIORITY_MAP.get(priority, 2)),
+    ]
+
+
+def resultat_reel(row) -> Dict:
+    """Retard et dépassement constatés d'un projet terminé"""
+    fin_reelle = row['date_fin_reelle']
+    if row['end_date'] and fin_reelle:
+        days_delay = max((fin_reelle - row['end_date']).days, 0)
+    else:
+        days_delay = 0
+    budget = float(row['budget'] or 0)
+    budget_utilise = float(row['features__budget_utilise'] or 0)
+    return {
+        'days_delay': days_delay,
+        'budget_overrun': round(max(budget_utilise - budget, 0), 2),
+        'budget_overrun_pct': round(max(budget_utilise - budget, 0) / budget * 100, 2) if budget > 0 else 0,
+    }
+
+
+class SimilarityIndex:
+    """Matrice des projets terminés et recherche exhaustive des k plus proches voisins"""
+
+    def __init__(self, sync_interval: Optional[float] = None):
+        self._sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._ids = []
+        self._positions = {}
+        self._vectors = np.empty((0, len(FEATURE_NAMES)))
+        self._details = []
+        # Moyenne et écart-type des colonnes, recalculés à chaque modification
+        self._mean = np.zeros(len(FEATURE_NAMES))
+        self._scale = np.ones(len(FEATURE_NAMES))
+        self._built = False
+        self._dirty = set()
+        self._synced_at = None
+        self._next_sync = 0.0
+
+    @property
+    def sync_interval(self) -> float:
+        if self._sync_interval is not None:
+            return self._sync_interval
+        return float(_get_setting('ML_SIMILARITY_SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # ----- Mise à jour -----
+
+    def marquer(self, projet_id) -> None:
+        """Projet à relire à la prochaine recherche (appelé par les signaux Projet)"""
+        with self._lock:
+            self._dirty.add(projet_id)
+
+    def contient(self, projet_id) -> bool:
+        return projet_id in self._positions
+
+    def _charger(self, projet_ids: Optional[Iterable] = None) -> List[Dict]:
+        """Lignes des projets terminés (tous si projet_ids est None), agrégats lus dans ProjetFeatures"""
+        from .models import Projet
+        from .feature_store import calculer_features
+
+        projets = Projet.objects.filter(status=STATUT_TERMINE)
+        if projet_ids is not None:
+            projets = projets.filter(id__in=list(projet_ids))
+        rows = list(projets.values(*RELOAD_FIELDS))
+
+        manquants = [row['id'] for row in rows if row['features__nb_taches'] is None]
+        if manquants:
+            # Projets sans ligne ProjetFeatures (antérieurs au feature store) : calcul direct
+            features = calculer_features(manquants)
+            for row in rows:
+                if row['id'] in features:
+                    row['features__nb_chantiers'] = features[row['id']]['nb_chantiers']
+                    row['features__nb_taches'] = features[row['id']]['nb_taches']
+                    row['features__budget_utilise'] = features[row['id']]['budget_utilise']
+        return rows
+
+    def _entree(self, row):
+        vector = similarity_vector(
+            row['budget'], row['start_date'], row['end_date'], row['priority'],
+            row['features__nb_chantiers'], row['features__nb_taches'],
+        )
+        details = {'projet_id': str(row['id']), 'name': row['name'], 'status': row['status']}
+        details.update(resultat_reel(row))
+        return vector, details
+
+    def _recalculer_normalisation(self) -> None:
+        if len(self._ids):
+            self._mean = self._vectors.mean(axis=0)
+            scale = self._vectors.std(axis=0)
+            self._scale = np.where(scale > 0, scale, 1.0)
+        else:
+            self._mean = np.zeros(len(FEATURE_NAMES))
+            self._scale = np.ones(len(FEATURE_NAMES))
+
+    def reconstruire(self) -> int:
+        """Reconstruit l'index à partir de tous les projets terminés ; retourne leur nombre"""
+        synced_at = self._now()
+        rows = self._charger()
+        entrees = [self._entree(row) for row in rows]
+        with self._lock:
+            self._ids = [row['id'] for row in rows]
+            self._positions = {projet_id: i for i, projet_id in enumerate(self._ids)}
+            self._vectors = np.array([vector for vector, _ in entrees], dtype=float).reshape(-1, len(FEATURE_NAMES))
+            self._details = [details for _, details in entrees]
+            self._recalculer_normalisation()
+            self._built = True
+            self._synced_at = synced_at
+        logger.info(f"Index de similarité reconstruit: {len(rows)} projets terminés")
+        return len(rows)
+
+    def _appliquer(self, projet_ids: Iterable, rows: List[Dict]) -> None:
+        """Insère / met à jour les projets de `rows`, retire les autres projets de `projet_ids`"""
+        presents = {row['id'] for row in rows}
+        with self._lock:
+            ids = list(self._ids)
+            vectors = list(self._vectors)
+            details = list(self._details)
+            positions = dict(self._positions)
+            for row in rows:
+                vector, detail = self._entree(row)
+                position = positions.get(row['id'])
+                if position is None:
+                    positions[row['id']] = len(ids)
+                    ids.append(row['id'])
+                    vectors.append(np.asarray(vector, dtype=float))
+                    details.append(detail)
+                else:
+                    vectors[position] = np.asarray(vector, dtype=float)
+                    details[position] = detail
+
+            retires = {projet_id for projet_id in projet_ids if projet_id not in presents and projet_id in positions}
+            if retires:
+                garder = [i for i, projet_id in enumerate(ids) if projet_id not in retires]
+                ids = [ids[i] for i in garder]
+                vectors = [vectors[i] for i in garder]
+                details = [details[i] for i in garder]
+                positions = {projet_id: i for i, projet_id in enumerate(ids)}
+
+            self._ids = ids
+            self._positions = positions
+            self._vectors = np.array(vectors, dtype=float).reshape(-1, len(FEATURE_NAMES))
+            self._details = details
+            self._recalculer_normalisation()
+
+    def _now(self):
+        from django.utils import timezone
+        return timezone.now()
+
+    def synchroniser(self, force: bool = False) -> None:
+        """Construit l'index si besoin, puis applique les projets marqués et les modifications récentes"""
+        if not self._built:
+            with self._lock:
+                self._dirty.clear()
+            self.reconstruire()
+            self._next_sync = time.monotonic() + self.sync_interval
+            return
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if dirty:
+            self._appliquer(dirty, self._charger(dirty))
+
+        if not force and time.monotonic() < self._next_sync:
+            return
+        self._next_sync = time.monotonic() + self.sync_interval
+
+        # Modifications faites par d'autres workers depuis la dernière synchronisation
+        from .models import Projet
+        synced_at = self._now()
+        # Marge d'une seconde pour les enregistrements concurrents de la synchronisation précédente
+        modifies = list(
+            Projet.objects.filter(updated_at__gte=self._synced_at - timedelta(seconds=1)).values_list('id', flat=True)
+        )
+        if modifies:
+            self._appliquer(modifies, self._charger(modifies))
+        self._synced_at = synced_at
+
+        # Suppressions faites ailleurs : invisibles par date de modification
+        if Projet.objects.filter(status=STATUT_TERMINE).count() != len(self._ids):
+            self.reconstruire()
+
+    # ----- Recherche -----
+
+    def rechercher(self, vector, k: int = DEFAULT_K, exclude=None) -> List[Dict]:
+        """k projets terminés les plus proches de `vector` (distance croissante)"""
+        with self._lock:
+            vectors, details, ids, positions = self._vectors, self._details, self._ids, self._positions
+            mean, scale = self._mean, self._scale
+        if not len(ids) or k <= 0:
+            return []
+
+        query = (np.asarray(vector, dtype=float) - mean) / scale
+        distances = np.sqrt((((vectors - mean) / scale - query) ** 2).sum(axis=1))
+        if exclude in positions:
+            distances[positions[exclude]] = np.inf
+
+        k = min(k, len(ids))
+        nearest = np.argpartition(distances, k - 1)[:k] if k < len(ids) else np.arange(len(ids))
+        nearest = nearest[np.argsort(distances[nearest])]
+        voisins = []
+        for position in nearest:
+            if not np.isfinite(distances[position]):
+                continue
+            voisin = dict(details[position])
+            voisin['distance'] = round(float(distances[position]), 4)
+            voisins.append(voisin)
+        return voisins
+
+    def voisins(self, projet, k: Optional[int] = None) -> List[Dict]:
+        """
+        Projets terminés les plus proches de `projet` (le projet lui-même exclu),
+        au format attendu par MLPredictionService.generate_recommendations(historique=...)
+        """
+        from .models import ProjetFeatures
+        from .feature_store import calculer_features
+
+        k = k if k is not None else int(_get_setting('ML_SIMILARITY_K', DEFAULT_K))
+        self.synchroniser()
+
+        compteurs = ProjetFeatures.objects.filter(pk=projet.pk).values_list('nb_chantiers', 'nb_taches').first()
+        if compteurs is None:
+            features = calculer_features([projet.pk]).get(projet.pk, {})
+            compteurs = (features.get('nb_chantiers', 0), features.get('nb_taches', 0))
+        vector = similarity_vector(
+            projet.budget, projet.start_date, projet.end_date, projet.priority, compteurs[0], compteurs[1],
+        )
+        return self.rechercher(vector, k=k, exclude=projet.pk)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids = []
+            self._positions = {}
+            self._vectors = np.empty((0, len(FEATURE_NAMES)))
+            self._details = []
+            self._recalculer_normalisation()
+            self._built = False
+            self._dirty = set()
+
+
+# Index global (un par processus)
+similarity_index = SimilarityIndex()
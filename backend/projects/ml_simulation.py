@@ -0,0 +1,158 @@
+"""
+Simulation Monte Carlo de la date d'achèvement d'un projet
+
+Les tâches n'ont qu'une date de début et une date de fin prévues ; la fin réelle d'une
+tâche terminée est approchée par sa dernière modification (passage à 'Terminé').
+Le rapport durée réelle / durée prévue des tâches terminées du projet est ajusté par
+une loi log-normale (portefeuille entier si le projet a moins de MIN_HISTORY tâches
+terminées, loi par défaut sinon).
+
+Chaque itération tire un rapport par tâche restante (avec une part commune au projet,
+`correlation`, car les tâches d'un même chantier dérapent ensemble) et applique :
+    fin = max(début prévu, aujourd'hui) + travail restant x rapport
+où le travail restant est la durée prévue x (1 - progress). L'achèvement du projet est
+la fin la plus tardive. Toutes les itérations sont calculées par tableaux NumPy
+(n_itérations x n_tâches), par blocs pour borner la mémoire.
+"""
+import math
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+import numpy as np
+
+STATUT_TERMINE = 'Terminé'
+DEFAULT_ITERATIONS = 10000
+MAX_ITERATIONS = 200000
+DEFAULT_BINS = 20
+DEFAULT_CORRELATION = 0.3
+MIN_HISTORY = 5
+PORTFOLIO_HISTORY_LIMIT = 5000
+# Loi par défaut sans historique : dérapage médian de 10 %, dispersion modérée
+DEFAULT_MU = math.log(1.1)
+DEFAULT_SIGMA = 0.25
+# Nombre maximal de valeurs tirées par bloc (itérations x tâches)
+BLOCK_SIZE = 2_000_000
+PERCENTILES = (50, 80, 95)
+
+TASK_FIELDS = ('status', 'start_date', 'end_date', 'progress', 'updated_at', 'lot__start_date', 'lot__end_date')
+
+
+def _ratios_log(rows) -> np.ndarray:
+    """log(durée réelle / durée prévue) des tâches terminées datées"""
+    logs = []
+    for status, start, end, _progress, updated_at, _lot_start, _lot_end in rows:
+        if status != STATUT_TERMINE or not start or not end or not updated_at:
+            continue
+        prevue = max((end - start).days, 1)
+        reelle = max((updated_at.date() - start).days, 1)
+        logs.append(math.log(reelle / prevue))
+    return np.asarray(logs, dtype=np.float64)
+
+
+def fit_duration_ratio(projet, rows=None) -> Dict:
+    """Paramètres (mu, sigma) de la loi log-normale du rapport durée réelle / prévue"""
+    from .models import Tache
+
+    if rows is None:
+        rows = list(Tache.objects.filter(lot__chantier__projet=projet).values_list(*TASK_FIELDS))
+    logs = _ratios_log(rows)
+    source = 'projet'
+    if len(logs) < MIN_HISTORY:
+        portefeuille = Tache.objects.filter(
+            status=STATUT_TERMINE, start_date__isnull=False, end_date__isnull=False
+        ).order_by('-updated_at').values_list(*TASK_FIELDS)[:PORTFOLIO_HISTORY_LIMIT]
+        logs = _ratios_log(portefeuille)
+        source = 'portefeuille'
+    if len(logs) < MIN_HISTORY:
+        return {'mu': DEFAULT_MU, 'sigma': DEFAULT_SIGMA, 'source': 'défaut', 'n_samples': int(len(logs))}
+    sigma = float(np.std(logs, ddof=1)) if len(logs) > 1 else DEFAULT_SIGMA
+    return {
+        'mu': float(np.mean(logs)),
+        # Une dispersion nulle (historique uniforme) rendrait la simulation déterministe
+        'sigma': max(sigma, 0.01),
+        'source': source,
+        'n_samples': int(len(logs)),
+    }
+
+
+def remaining_work(rows, today: date):
+    """Début au plus tôt (jours depuis today) et travail restant (jours) des tâches non terminées"""
+    starts, remaining = [], []
+    for status, start, end, progress, _updated_at, lot_start, lot_end in rows:
+        if status == STATUT_TERMINE:
+            continue
+        start, end = start or lot_start, end or lot_end
+        if not start or not end:
+            continue
+        prevue = max((end - start).days, 1)
+        avancement = min(max(float(progress or 0), 0), 100) / 100
+        starts.append(max((start - today).days, 0))
+        remaining.append(prevue * (1 - avancement))
+    return np.asarray(starts, dtype=np.float64), np.asarray(remaining, dtype=np.float64)
+
+
+def simulate_completion(projet, iterations: int = DEFAULT_ITERATIONS, seed: Optional[int] = None,
+                        bins: int = DEFAULT_BINS, correlation: float = DEFAULT_CORRELATION,
+                        today: Optional[date] = None) -> Dict:
+    """
+    Distribution de la date d'achèvement du projet : percentiles P50/P80/P95, probabilité
+    de finir à l'échéance et histogramme. `seed` rend le résultat reproductible.
+    """
+    from .models import Tache
+
+    if not 1 <= iterations <= MAX_ITERATIONS:
+        raise ValueError(f"iterations doit être compris entre 1 et {MAX_ITERATIONS}")
+    if not 1 <= bins <= 200:
+        raise ValueError('bins doit être compris entre 1 et 200')
+    if not 0 <= correlation <= 1:
+        raise ValueError('correlation doit être comprise entre 0 et 1')
+
+    today = today or date.today()
+    rows = list(Tache.objects.filter(lot__chantier__projet=projet).values_list(*TASK_FIELDS))
+    loi = fit_duration_ratio(projet, rows)
+    starts, remaining = remaining_work(rows, today)
+
+    rng = np.random.default_rng(seed)
+    completion = np.zeros(iterations, dtype=np.float64)
+    if len(remaining):
+        mu, sigma = loi['mu'], loi['sigma']
+        commun, propre = math.sqrt(correlation), math.sqrt(1 - correlation)
+        block = max(BLOCK_SIZE // len(remaining), 1)
+        for debut in range(0, iterations, block):
+            n = min(block, iterations - debut)
+            z = commun * rng.standard_normal((n, 1)) + propre * rng.standard_normal((n, len(remaining)))
+            fins = starts + remaining * np.exp(mu + sigma * z)
+            completion[debut:debut + n] = fins.max(axis=1)
+    # Achèvement au plus tôt le jour même, arrondi au jour supérieur
+    completion = np.ceil(completion)
+
+    def en_date(jours) -> str:
+        return (today + timedelta(days=int(jours))).isoformat()
+
+    quantiles = np.percentile(completion, PERCENTILES)
+    resultat = {
+        'projet_id': str(projet.pk),
+        'iterations': iterations,
+        'seed': seed,
+        'remaining_tasks': int(len(remaining)),
+        'distribution': {
+            'mu': round(loi['mu'], 4), 'sigma': round(loi['sigma'], 4),
+            'source': loi['source'], 'n_samples': loi['n_samples'], 'correlation': correlation,
+        },
+        'percentiles': {f'p{p}': en_date(q) for p, q in zip(PERCENTILES, quantiles)},
+        'mean_date': en_date(math.ceil(float(completion.mean()))),
+    }
+
+    if projet.end_date:
+        echeance = (projet.end_date - today).days
+        resultat['planned_end_date'] = projet.end_date.isoformat()
+        resultat['probability_on_time'] = round(float(np.mean(completion <= echeance)), 4)
+        resultat['days_delay'] = {f'p{p}': max(int(q) - echeance, 0) for p, q in zip(PERCENTILES, quantiles)}
+
+    counts, edges = np.histogram(completion, bins=bins)
+    resultat['histogram'] = {
+        'bin_edges': [en_date(math.floor(edge)) for edge in edges],
+        'bin_edges_days': [round(float(edge), 2) for edge in edges],
+        'counts': counts.astype(int).tolist(),
+    }
+    return resultat
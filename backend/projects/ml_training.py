@@ -0,0 +1,232 @@
+"""
+Réentraînement des modèles ML sur les projets terminés de la base
+
+Les lignes d'entraînement sont lues en flux (values_list().iterator(), sans objets ORM)
+depuis Projet joint à ProjetFeatures. Les features et les cibles viennent de deux
+moments distincts, pour que les features ne contiennent pas le résultat à prédire :
+- features : celles de compute_ml_features, calculées à partir des agrégats du dernier
+  instantané RiskSnapshot pris pendant que le projet était en cours (date antérieure à
+  sa date de fin réelle), à la date de cet instantané. Un projet terminé sans instantané
+  en cours est ignoré ;
+- cibles : résultat réel à la date de fin réelle (Projet.date_fin_reelle, voir
+  ml_similarity.resultat_reel), budget consommé final lu dans ProjetFeatures.
+Les features sont écrites dans des tableaux NumPy préalloués.
+
+Cibles :
+- retard : jours de retard constatés (régression Ridge) ;
+- budget : dépassement du budget (classes 0 / 1, RandomForest) ;
+- risk : 2 si dépassement ou retard supérieur à RISK_DELAY_RATIO de la durée prévue, 1 sinon.
+
+Les trois modèles sont entraînés en parallèle puis exportés en artefact versionné
+(ml_artifact.export_models) avec leurs métriques sur un jeu de validation.
+"""
+import logging
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .ml_service import ProjectAggregates, compute_ml_features
+from .ml_similarity import STATUT_TERMINE, resultat_reel
+
+logger = logging.getLogger(__name__)
+
+# Mêmes colonnes que les modèles livrés dans buildflow_models.pkl
+ML_FEATURE_NAMES = [
+    'budget_prevu', 'duree_prevue', 'nb_ouvriers', 'incidents_chantier', 'experience_entreprise', 'retard_prevu',
+]
+FEATURE_NAMES = {
+    'budget': ML_FEATURE_NAMES,
+    'retard': ML_FEATURE_NAMES[:-1],
+    'risk': ML_FEATURE_NAMES,
+}
+RISK_DELAY_RATIO = 0.1
+
+ROW_FIELDS = [
+    'id', 'budget', 'priority', 'start_date', 'end_date', 'date_fin_reelle',
+    'features__nb_taches', 'features__budget_utilise',
+]
+
+
+class TrainingData:
+    """Matrice des features (colonnes ML_FEATURE_NAMES) et cibles des projets terminés"""
+
+    def __init__(self, n_rows: int):
+        self.X = np.empty((n_rows, len(ML_FEATURE_NAMES)), dtype=np.float64)
+        self.days_delay = np.empty(n_rows, dtype=np.float64)
+        self.budget_overrun = np.empty(n_rows, dtype=np.int64)
+        self.risk = np.empty(n_rows, dtype=np.int64)
+        self.size = 0
+
+    def truncate(self) -> 'TrainingData':
+        """Réduit les tableaux aux lignes effectivement remplies"""
+        self.X = self.X[:self.size]
+        self.days_delay = self.days_delay[:self.size]
+        self.budget_overrun = self.budget_overrun[:self.size]
+        self.risk = self.risk[:self.size]
+        return self
+
+    def features(self, kind: str):
+        columns = [ML_FEATURE_NAMES.index(name) for name in FEATURE_NAMES[kind]]
+        return self.X[:, columns]
+
+    def target(self, kind: str):
+        return {'budget': self.budget_overrun, 'retard': self.days_delay, 'risk': self.risk}[kind]
+
+
+def _completer_features(rows) -> None:
+    """Budget consommé final des projets sans ligne ProjetFeatures, calculé par requêtes groupées"""
+    manquants = [row['id'] for row in rows if row['features__nb_taches'] is None]
+    if not manquants:
+        return
+    from .feature_store import calculer_features
+    features = calculer_features(manquants)
+    for row in rows:
+        valeurs = features.get(row['id'])
+        if row['features__nb_taches'] is None and valeurs:
+            row['features__budget_utilise'] = valeurs['budget_utilise']
+
+
+def _instantanes_en_cours(rows) -> Dict:
+    """{projet_id: (date, agrégats)} du dernier RiskSnapshot antérieur à la fin réelle, en une requête"""
+    from .models import RiskSnapshot
+
+    fins = {row['id']: row['date_fin_reelle'] for row in rows if row['date_fin_reelle']}
+    instantanes = {}
+    snapshots = (
+        RiskSnapshot.objects.filter(projet_id__in=list(fins))
+        .exclude(features={})
+        .order_by('projet_id', '-date')
+        .values_list('projet_id', 'date', 'features')
+    )
+    for projet_id, snapshot_date, features in snapshots:
+        if projet_id not in instantanes and snapshot_date < fins[projet_id]:
+            instantanes[projet_id] = (snapshot_date, features)
+    return instantanes
+
+
+def _remplir(data: TrainingData, rows) -> int:
+    """Ajoute les projets de `rows` qui ont un instantané en cours ; retourne le nombre d'ignorés"""
+    _completer_features(rows)
+    instantanes = _instantanes_en_cours(rows)
+    ignores = 0
+    for row in rows:
+        instantane = instantanes.get(row['id'])
+        if instantane is None:
+            ignores += 1
+            continue
+        snapshot_date, valeurs = instantane
+        projet = SimpleNamespace(
+            budget=row['budget'], priority=row['priority'],
+            start_date=row['start_date'], end_date=row['end_date'],
+        )
+        features = compute_ml_features(projet, ProjectAggregates(**valeurs), today=snapshot_date)
+        resultat = resultat_reel(row)
+
+        i = data.size
+        data.X[i] = [features[name] for name in ML_FEATURE_NAMES]
+        data.days_delay[i] = resultat['days_delay']
+        data.budget_overrun[i] = int(resultat['budget_overrun'] > 0)
+        depasse_delai = resultat['days_delay'] > RISK_DELAY_RATIO * features['duree_prevue']
+        data.risk[i] = 2 if (data.budget_overrun[i] or depasse_delai) else 1
+        data.size += 1
+    return ignores
+
+
+def load_training_data(chunk_size: int = 2000) -> TrainingData:
+    """Lit en flux les projets terminés et remplit les tableaux préalloués"""
+    from .models import Projet
+
+    projets = Projet.objects.filter(status=STATUT_TERMINE).order_by('id')
+    data = TrainingData(projets.count())
+    rows = []
+    lus = ignores = 0
+    for values in projets.values_list(*ROW_FIELDS).iterator(chunk_size=chunk_size):
+        rows.append(dict(zip(ROW_FIELDS, values)))
+        lus += 1
+        if len(rows) >= chunk_size:
+            ignores += _remplir(data, rows)
+            rows = []
+        if lus >= len(data.X):
+            # Projets terminés entre le count() et la lecture : ignorés jusqu'au prochain entraînement
+            break
+    if rows:
+        ignores += _remplir(data, rows)
+    if ignores:
+        logger.info(f"{ignores} projets terminés sans instantané RiskSnapshot en cours, ignorés pour l'entraînement")
+    return data.truncate()
+
+
+def _fit(kind: str, X_train, y_train, X_test, y_test, n_jobs: int, random_state: int) -> Tuple[str, Dict, Dict]:
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import Ridge
+    from sklearn.metrics import accuracy_score, mean_absolute_error, r2_score, roc_auc_score
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler().fit(X_train)
+    X_train_scaled = scaler.transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+
+    if kind == 'retard':
+        model = Ridge(alpha=1.0).fit(X_train_scaled, y_train)
+        predicted = model.predict(X_test_scaled)
+        metrics = {
+            'mae': round(float(mean_absolute_error(y_test, predicted)), 4),
+            'r2': round(float(r2_score(y_test, predicted)), 4) if len(y_test) > 1 else None,
+        }
+    else:
+        model = RandomForestClassifier(n_estimators=100, random_state=random_state, n_jobs=n_jobs)
+        model.fit(X_train_scaled, y_train)
+        proba = model.predict_proba(X_test_scaled)
+        metrics = {
+            'accuracy': round(float(accuracy_score(y_test, model.classes_.take(proba.argmax(axis=1)))), 4),
+            'roc_auc': round(float(roc_auc_score(y_test, proba[:, 1])), 4) if len(np.unique(y_test)) > 1 else None,
+            'positive_rate': round(float(np.mean(y_train == model.classes_[-1])), 4),
+        }
+    metrics.update({'n_train': int(len(y_train)), 'n_test': int(len(y_test))})
+    return kind, {f'{kind}_model': model, f'scaler_{kind}': scaler, f'feature_names_{kind}': list(FEATURE_NAMES[kind])}, metrics
+
+
+def train_models(data: TrainingData, n_jobs: int = -1, test_size: float = 0.2,
+                 random_state: int = 42) -> Tuple[Dict, Dict]:
+    """
+    Entraîne budget, retard et risk en parallèle (un thread par modèle, arbres répartis sur n_jobs).
+    Retourne (models au format buildflow_models.pkl, métriques de validation par modèle).
+    """
+    from joblib import Parallel, delayed
+    from sklearn.model_selection import train_test_split
+
+    for kind in ('budget', 'risk'):
+        if len(np.unique(data.target(kind))) < 2:
+            raise ValueError(f"Cible '{kind}' à une seule classe sur {data.size} projets terminés : entraînement impossible")
+
+    indices = np.arange(data.size)
+    train_idx, test_idx = train_test_split(indices, test_size=test_size, random_state=random_state)
+    jobs = []
+    for kind in FEATURE_NAMES:
+        X, y = data.features(kind), data.target(kind)
+        jobs.append(delayed(_fit)(kind, X[train_idx], y[train_idx], X[test_idx], y[test_idx], n_jobs, random_state))
+
+    models, metrics = {}, {}
+    for kind, fitted, kind_metrics in Parallel(n_jobs=len(jobs), prefer='threads')(jobs):
+        models.update(fitted)
+        metrics[kind] = kind_metrics
+    return models, metrics
+
+
+def default_version() -> str:
+    return datetime.utcnow().strftime('train-%Y%m%d%H%M%S')
+
+
+def train_and_export(output_dir, version: Optional[str] = None, n_jobs: int = -1, chunk_size: int = 2000,
+                     min_samples: int = 50, publish: bool = True) -> Dict:
+    """Charge les données, entraîne et écrit l'artefact ; retourne le manifeste (métriques incluses)"""
+    from .ml_artifact import export_models
+
+    data = load_training_data(chunk_size)
+    if data.size < min_samples:
+        raise ValueError(f"{data.size} projets terminés, au moins {min_samples} requis pour l'entraînement")
+    models, metrics = train_models(data, n_jobs=n_jobs)
+    metrics['n_samples'] = int(data.size)
+    return export_models(models, output_dir, version=version or default_version(), metrics=metrics, publish=publish)
@@ -0,0 +1,152 @@
+"""
+Simulation « what-if » : surface de risque d'un projet sur une grille de budgets et de délais
+
+Avant de modifier le budget ou l'échéance d'un projet (maitre_ouvrage_definir_budget,
+maitre_ouvrage_definir_delais), on score d'un coup tous les scénarios d'une grille :
+variations du budget en % x décalages de la date de fin en jours.
+
+Les agrégats du projet sont lus une fois ; les features qui dépendent du budget ou de
+la durée (budget_prevu, duree_prevue, retard_prevu) sont recalculées par broadcasting
+sur les deux axes avec les mêmes formules que compute_ml_features, les autres sont
+communes à tous les scénarios. La matrice obtenue est scorée en un appel par modèle.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .ml_inference import predict_rows
+from .ml_service import compute_ml_features
+
+DEFAULT_BUDGET_CHANGES = [-50, -30, -10, 0, 10, 30, 50]
+DEFAULT_DURATION_CHANGES = [-180, -90, -30, 0, 30, 90, 180]
+MAX_SCENARIOS = 2500
+
+
+def _niveau(score: np.ndarray) -> np.ndarray:
+    return np.where(score >= 0.7, 'élevé', np.where(score >= 0.4, 'moyen', 'faible'))
+
+
+def scenario_features(projet, aggregates, budget_changes: Sequence[float], duration_changes: Sequence[int],
+                      feature_names: Sequence[str], today=None) -> np.ndarray:
+    """
+    Tableau des features (n_budget, n_durée, n_features) des scénarios, colonnes dans l'ordre
+    de `feature_names`. Le scénario (0 %, 0 jour) est identique à compute_ml_features.
+    """
+    today = today or datetime.now().date()
+    base = compute_ml_features(projet, aggregates, today=today)
+    budget_factors = 1 + np.asarray(budget_changes, dtype=np.float64)[:, np.newaxis] / 100.0
+    deltas = np.asarray(duration_changes, dtype=np.float64)[np.newaxis, :]
+    shape = (budget_factors.shape[0], deltas.shape[1])
+
+    budget_total = float(projet.budget) if projet.budget else 0
+    budget_prevu = np.broadcast_to(np.maximum(budget_total * budget_factors, 1), shape)
+
+    avancement = aggregates.avancement
+    if projet.start_date and projet.end_date:
+        duree = np.maximum((projet.end_date - projet.start_date).days + deltas, 1)
+        jours_ecoules = (today - projet.start_date).days
+        pourcentage = np.minimum(jours_ecoules / duree, 1.0)
+        retard_avancement = pourcentage - avancement / 100
+        jours_restants = duree - jours_ecoules
+        tendance = np.where(
+            (avancement < 50) & (pourcentage > 0.5),
+            np.maximum(np.trunc((0.5 - avancement / 100) * jours_restants), 0),
+            0,
+        )
+        retard = np.where(retard_avancement > 0, np.trunc(retard_avancement * duree), tendance)
+        retard = np.maximum(retard, 0)
+    else:
+        # Sans dates, compute_ml_features prend 365 jours et aucun retard prévu
+        duree = np.maximum(365 + deltas, 1)
+        retard = np.zeros_like(duree)
+
+    varying = {
+        'budget_prevu': budget_prevu,
+        'duree_prevue': np.broadcast_to(duree, shape),
+        'retard_prevu': np.broadcast_to(retard, shape),
+    }
+    X = np.empty(shape + (len(feature_names),), dtype=np.float64)
+    for j, name in enumerate(feature_names):
+        X[..., j] = varying[name] if name in varying else base.get(name, 0)
+    return X
+
+
+def what_if(service, projet, budget_changes: Optional[Sequence[float]] = None,
+            duration_changes: Optional[Sequence[int]] = None, aggregates=None) -> Dict:
+    """
+    Surface de risque du projet : pour chaque modèle, une matrice [variation de budget][décalage de délai].
+    Lève ValueError si la grille est vide ou dépasse MAX_SCENARIOS, RuntimeError sans modèles ML.
+    """
+    budget_changes = list(DEFAULT_BUDGET_CHANGES if budget_changes is None else budget_changes)
+    duration_changes = list(DEFAULT_DURATION_CHANGES if duration_changes is None else duration_changes)
+    if not budget_changes or not duration_changes:
+        raise ValueError('Les axes budget_changes et duration_changes ne doivent pas être vides')
+    if len(budget_changes) * len(duration_changes) > MAX_SCENARIOS:
+        raise ValueError(f"Grille trop grande ({len(budget_changes)} x {len(duration_changes)}), maximum {MAX_SCENARIOS} scénarios")
+    if any(change <= -100 for change in budget_changes):
+        raise ValueError('Une variation de budget doit être supérieure à -100 %')
+
+    bundle = service._current_bundle()
+    if not bundle.loaded:
+        raise RuntimeError('Modèles ML non chargés : simulation impossible')
+    aggregates = aggregates or service._aggregates(projet)
+    models = bundle.models
+    today = datetime.now().date()
+    shape = (len(budget_changes), len(duration_changes))
+
+    # Une seule matrice de scénarios pour toutes les colonnes utilisées par les trois modèles
+    feature_names = list(dict.fromkeys(
+        name for kind in ('retard', 'budget', 'risk') for name in models[f'feature_names_{kind}']
+    ))
+    X = scenario_features(projet, aggregates, budget_changes, duration_changes, feature_names, today)
+    X = X.reshape(-1, len(feature_names))
+
+    def colonnes(kind):
+        return X[:, [feature_names.index(name) for name in models[f'feature_names_{kind}']]]
+
+    days_delay = np.maximum(np.trunc(predict_rows(models, 'retard', colonnes('retard'))), 0).reshape(shape)
+    duree = X[:, feature_names.index('duree_prevue')].reshape(shape)
+    surfaces = {
+        'days_delay': days_delay,
+        'delay_risk': np.minimum(days_delay / duree, 1.0),
+    }
+    for kind, surface in (('budget', 'budget_risk'), ('risk', 'risk')):
+        proba = predict_rows(models, kind, colonnes(kind))
+        surfaces[surface] = (proba[:, 1] if proba.shape[1] > 1 else proba[:, 0]).reshape(shape)
+
+    base_i, base_j = _indice_base(budget_changes), _indice_base(duration_changes)
+    return {
+        'projet_id': str(projet.pk),
+        'model_version': bundle.version,
+        'budget_changes': budget_changes,
+        'duration_changes': duration_changes,
+        'scenarios': shape[0] * shape[1],
+        'days_delay': surfaces['days_delay'].astype(int).tolist(),
+        'delay_risk': np.round(surfaces['delay_risk'], 3).tolist(),
+        'budget_risk': np.round(surfaces['budget_risk'], 3).tolist(),
+        'risk': np.round(surfaces['risk'], 3).tolist(),
+        'risk_level': _niveau(surfaces['risk']).tolist(),
+        'baseline': None if base_i is None or base_j is None else {
+            'days_delay': int(surfaces['days_delay'][base_i, base_j]),
+            'delay_risk': round(float(surfaces['delay_risk'][base_i, base_j]), 3),
+            'budget_risk': round(float(surfaces['budget_risk'][base_i, base_j]), 3),
+            'risk': round(float(surfaces['risk'][base_i, base_j]), 3),
+        },
+    }
+
+
+def _indice_base(changes: List) -> Optional[int]:
+    for i, change in enumerate(changes):
+        if change == 0:
+            return i
+    return None
+
+
+def parse_axis(value, cast=float) -> Optional[List]:
+    """Lit un axe de la grille (liste de nombres) ; None si absent, ValueError si invalide"""
+    if value in (None, ''):
+        return None
+    if not isinstance(value, (list, tuple)):
+        raise ValueError('Un axe doit être une liste de nombres')
+    return [cast(v) for v in value]
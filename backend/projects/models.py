@@ -1,8 +1,23 @@
+import logging
 import uuid
+from datetime import date
+from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from django.contrib.auth.hashers import make_password, check_password
+import hmac
+from django.contrib.auth.hashers import make_password, check_password, identify_hasher
+
+logger = logging.getLogger(__name__)
+
+
+def _mot_de_passe_hashe(valeur: str) -> bool:
+    """Valeur déjà hashée par l'un des PASSWORD_HASHERS (quel que soit l'algorithme)"""
+    try:
+        identify_hasher(valeur)
+        return True
+    except ValueError:
+        return False
 
 
 class TimeStampedModel(models.Model):
@@ -13,7 +28,76 @@ class TimeStampedModel(models.Model):
         abstract = True
 
 
-class Projet(TimeStampedModel):
+class SuiviModificationsMixin:
+    """
+    Suivi des champs modifiés depuis le chargement de l'instance (ou son dernier
+    enregistrement), pour ne lancer les recalculs en cascade que si un champ utile a changé.
+    Après save(), `champs_enregistres` contient les champs modifiés par cet enregistrement et
+    valeur_precedente() leur valeur d'avant.
+    """
+    champs_enregistres = frozenset()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._photographier()
+        return instance
+
+    def _photographier(self, champs=None) -> None:
+        differes = self.get_deferred_fields()
+        valeurs = getattr(self, '_valeurs_initiales', None) or {}
+        for field in self._meta.concrete_fields:
+            if field.attname in differes or (champs is not None and field.name not in champs):
+                continue
+            valeurs[field.attname] = getattr(self, field.attname)
+        self._valeurs_initiales = valeurs
+
+    def champs_modifies(self) -> set:
+        """Noms des champs modifiés en mémoire (tous pour un objet pas encore enregistré)"""
+        initiales = getattr(self, '_valeurs_initiales', None)
+        if self._state.adding or initiales is None:
+            return {field.name for field in self._meta.concrete_fields}
+        modifies = set()
+        for field in self._meta.concrete_fields:
+            if field.attname not in initiales:
+                continue
+            avant, apres = initiales[field.attname], getattr(self, field.attname)
+            try:
+                # Valeurs comparées telles qu'envoyées à la base (50.0 et 50 pour un IntegerField)
+                identiques = field.get_prep_value(avant) == field.get_prep_value(apres)
+            except (TypeError, ValueError, ValidationError):
+                identiques = avant == apres
+            if not identiques:
+                modifies.add(field.name)
+        return modifies
+
+    def a_change(self, *champs: str) -> bool:
+        """Un des champs a été modifié par le dernier enregistrement"""
+        return bool(self.champs_enregistres.intersection(champs))
+
+    def valeur_precedente(self, champ: str):
+        """Valeur (attname pour une clé étrangère) d'un champ avant le dernier enregistrement"""
+        field = self._meta.get_field(champ)
+        return getattr(self, '_valeurs_precedentes', {}).get(field.attname, getattr(self, field.attname))
+
+    def save(self, *args, **kwargs):
+        modifies = self.champs_modifies()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            noms = {self._meta.get_field(nom).name for nom in update_fields}
+            modifies &= noms
+        # Connus avant l'enregistrement : les signaux post_save les lisent
+        self._valeurs_precedentes = dict(getattr(self, '_valeurs_initiales', None) or {})
+        self.champs_enregistres = modifies
+        super().save(*args, **kwargs)
+        self._photographier(None if update_fields is None else noms)
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._photographier()
+
+
+class Projet(SuiviModificationsMixin, TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -24,10 +108,21 @@ class Projet(TimeStampedModel):
     end_date = models.DateField(null=True, blank=True)
     location = models.CharField(max_length=255, blank=True)
     manager = models.CharField(max_length=255, blank=True)
+    # Renseignée au passage à 'Terminé', effacée si le projet est rouvert
+    date_fin_reelle = models.DateField(null=True, blank=True)
 
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs):
+        termine = self.status == 'Terminé'
+        if termine != (self.date_fin_reelle is not None):
+            self.date_fin_reelle = date.today() if termine else None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = list(update_fields) + ['date_fin_reelle']
+        super().save(*args, **kwargs)
+
     @property
     def avancement_calcule(self):
         """Calculate project advancement based on chantiers"""
@@ -83,7 +178,7 @@ class Projet(TimeStampedModel):
             return self.status if self.status else 'Planifié'
 
 
-class Chantier(TimeStampedModel):
+class Chantier(SuiviModificationsMixin, TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     projet = models.ForeignKey(Projet, related_name='chantiers', on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
@@ -155,7 +250,7 @@ class Chantier(TimeStampedModel):
             return self.status if self.status else 'Planifié'
 
 
-class Lot(TimeStampedModel):
+class Lot(SuiviModificationsMixin, TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     chantier = models.ForeignKey(Chantier, related_name='lots', on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
@@ -220,7 +315,7 @@ class Lot(TimeStampedModel):
             return self.status if self.status else 'Planifié'
 
 
-class Tache(TimeStampedModel):
+class Tache(SuiviModificationsMixin, TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     lot = models.ForeignKey(Lot, related_name='taches', on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
@@ -238,6 +333,37 @@ class Tache(TimeStampedModel):
         return self.name
 
 
+class TacheDependance(TimeStampedModel):
+    """
+    Lien fin-début entre deux tâches d'un même projet : le successeur ne peut commencer
+    qu'après la fin du prédécesseur, plus `decalage` jours (négatif pour un chevauchement).
+    Le projet du successeur est recopié à l'enregistrement pour lire toutes les dépendances
+    d'un projet sans jointure (voir scheduling).
+    """
+    id = models.BigAutoField(primary_key=True)
+    projet = models.ForeignKey(Projet, related_name='dependances_taches', on_delete=models.CASCADE, editable=False)
+    predecesseur = models.ForeignKey(Tache, related_name='dependances_sortantes', on_delete=models.CASCADE)
+    successeur = models.ForeignKey(Tache, related_name='dependances_entrantes', on_delete=models.CASCADE)
+    decalage = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['predecesseur', 'successeur'], name='unique_tache_dependance'),
+            models.CheckConstraint(check=~models.Q(predecesseur=models.F('successeur')), name='tache_dependance_distincte'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.predecesseur_id} -> {self.successeur_id}"
+
+    def save(self, *args, **kwargs):
+        self.projet_id = Tache.objects.filter(pk=self.successeur_id).values_list(
+            'lot__chantier__projet_id', flat=True
+        ).first()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'projet'}
+        super().save(*args, **kwargs)
+
+
 class Utilisateur(TimeStampedModel):
     ROLE_CHOICES = [
         ('ADMINISTRATEUR', 'Administrateur'),
@@ -260,32 +386,36 @@ class Utilisateur(TimeStampedModel):
     def save(self, *args, **kwargs):
         """Override save pour hasher le mot de passe avant la sauvegarde"""
         # Si le mot de passe est défini et n'est pas déjà hashé
-        if self.mot_de_passe and not self.mot_de_passe.startswith('pbkdf2_sha256$'):
+        if self.mot_de_passe and not _mot_de_passe_hashe(self.mot_de_passe):
             self.mot_de_passe = make_password(self.mot_de_passe)
         super().save(*args, **kwargs)
     
     def check_password(self, raw_password):
-        """Vérifie si le mot de passe en clair correspond au hash stocké"""
+        """
+        Vérifie si le mot de passe en clair correspond au hash stocké.
+        Un hash d'un autre algorithme ou d'un nombre d'itérations différent de PASSWORD_HASHERS
+        est recalculé après une vérification réussie.
+        """
         try:
             # Vérifier que les mots de passe sont valides
             if not raw_password or not self.mot_de_passe:
                 return False
             
+            def rehash(password):
+                self.mot_de_passe = make_password(password)
+                self.save(update_fields=['mot_de_passe'])
+            
             # Si le mot de passe stocké est déjà hashé, utiliser check_password de Django
-            if self.mot_de_passe.startswith('pbkdf2_sha256$'):
-                return check_password(raw_password, self.mot_de_passe)
+            if _mot_de_passe_hashe(self.mot_de_passe):
+                return check_password(raw_password, self.mot_de_passe, setter=rehash)
             
             # Sinon, pour la migration des anciens mots de passe en clair, comparer directement
-            # Après la première connexion réussie, le mot de passe sera hashé au prochain save()
-            if raw_password == self.mot_de_passe:
+            if hmac.compare_digest(raw_password.encode('utf-8'), self.mot_de_passe.encode('utf-8')):
                 # Hasher le mot de passe pour la prochaine fois (migration automatique)
-                self.mot_de_passe = make_password(raw_password)
-                self.save(update_fields=['mot_de_passe'])
+                rehash(raw_password)
                 return True
             return False
         except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
             logger.error(f"Erreur dans check_password: {str(e)}")
             return False
 
@@ -298,11 +428,15 @@ class IA(TimeStampedModel):
     def __str__(self) -> str:
         return self.modele
     
-    def predict_delay_risk(self, projet):
+    def get_ml_service(self):
+        """Service ML de la variante de modèle de cette IA (voir ml_registry)"""
+        from .ml_registry import registry
+        return registry.get_service(self.modele)
+    
+    def predict_delay_risk(self, projet, explain=False):
         """Utilise le service ML pour prédire le risque de retard"""
         try:
-            from .ml_service import ml_service
-            return ml_service.predict_delay_risk(projet)
+            return self.get_ml_service().predict_delay_risk(projet, explain=explain)
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -315,16 +449,15 @@ class IA(TimeStampedModel):
                 'error': str(e)
             }
     
-    def predict_budget_overrun(self, projet):
+    def predict_budget_overrun(self, projet, explain=False):
         """Utilise le service ML pour prédire le dépassement budgétaire"""
         try:
-            from .ml_service import ml_service
             budget = None
             try:
                 budget = projet.budget_detail
             except Exception:
                 pass
-            return ml_service.predict_budget_overrun(projet, budget=budget)
+            return self.get_ml_service().predict_budget_overrun(projet, budget=budget, explain=explain)
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -341,12 +474,21 @@ class IA(TimeStampedModel):
     def generate_recommendations(self, projet, delay_prediction=None, budget_prediction=None):
         """Génère des recommandations automatiques pour un projet"""
         try:
-            from .ml_service import ml_service
             if delay_prediction is None:
                 delay_prediction = self.predict_delay_risk(projet)
             if budget_prediction is None:
                 budget_prediction = self.predict_budget_overrun(projet)
-            return ml_service.generate_recommendations(projet, delay_prediction, budget_prediction)
+            historique = None
+            try:
+                from .ml_similarity import similarity_index
+                historique = similarity_index.voisins(projet)
+            except Exception as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Historique des projets similaires indisponible: {str(e)}")
+            return self.get_ml_service().generate_recommendations(
+                projet, delay_prediction, budget_prediction, historique=historique
+            )
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -405,11 +547,7 @@ class IA(TimeStampedModel):
             budget_score = float(budget_pred.get('risk_score', 0))
             global_score = max(0.0, min(1.0, (delay_score + budget_score) / 2.0))
 
-            niveau = 'faible'
-            if global_score > 0.7:
-                niveau = 'élevé'
-            elif global_score > 0.4:
-                niveau = 'moyen'
+            niveau = _niveau_risque_global(global_score)
 
             return {
                 'global_risk_score': round(global_score, 2),
@@ -429,17 +567,23 @@ class IA(TimeStampedModel):
 
     def genererAlertes(self, projet):
         """Génère des alertes automatiquement selon le seuil de confiance (seuil_confiance).
-        Crée des objets Alerte si le risque global dépasse le seuil.
+        Crée des objets Alerte si le risque global dépasse le seuil, sauf si une alerte
+        ouverte de même empreinte (projet, type, niveau de risque) existe déjà.
         """
         try:
             resultats = self.predireRisques(projet)
             score = float(resultats.get('global_risk_score', 0))
             if score >= float(self.seuil_confiance or 0.5):
-                # Déterminer type/severité
-                type_alerte = 'WARNING'
-                description = f"Risque global {resultats.get('global_risk_level', 'moyen')} (score {score}) détecté par l'IA."
-                if score > 0.7:
-                    type_alerte = 'CRITICAL'
+                type_alerte, niveau, description = _decrire_alerte(score)
+                fingerprint = Alerte.make_fingerprint(projet.id, type_alerte, niveau)
+
+                if Alerte.empreintes_ouvertes([fingerprint]):
+                    return {
+                        'created': False,
+                        'reason': 'duplicate',
+                        'type': type_alerte,
+                        'risk_score': score,
+                    }
 
                 # Créer une alerte reliée au projet et à cette IA
                 try:
@@ -449,6 +593,7 @@ class IA(TimeStampedModel):
                         statut='NOUVELLE',
                         projet=projet,
                         ia=self,
+                        fingerprint=fingerprint,
                     )
                 except Exception:
                     # Au cas où la FK IA/projet poserait problème, ne pas planter
@@ -478,6 +623,78 @@ class IA(TimeStampedModel):
                 'error': str(e)
             }
 
+    @classmethod
+    def genererAlertesEnLot(cls, projets=None, ias=None, chunk_size=100):
+        """Version portefeuille de genererAlertes.
+
+        Score chaque projet une seule fois par variante de modèle (par paquets), compare
+        le score global au seuil de chaque IA, écarte les empreintes ayant déjà une alerte
+        ouverte et écrit les nouvelles alertes avec un seul bulk_create.
+        Par défaut : tous les projets actifs et toutes les IA.
+        """
+        from .portfolio import iter_chunks, projets_actifs_ids, score_projets
+
+        projet_ids = [p.id for p in projets] if projets is not None else projets_actifs_ids()
+        ias = list(ias) if ias is not None else list(cls.objects.all())
+        rapport = {'scored': 0, 'created': 0, 'suppressed': 0, 'below_threshold': 0, 'alerte_ids': []}
+
+        # Les IA partageant la même variante de modèle partagent le scoring
+        groupes = {}
+        for ia in ias:
+            service = ia.get_ml_service()
+            groupes.setdefault(id(service), (service, []))[1].append(ia)
+
+        candidates = {}
+        for chunk in iter_chunks(projet_ids, chunk_size):
+            for service, ias_groupe in groupes.values():
+                # Score global = moyenne retard / budget : le modèle de risque n'est pas appelé
+                for resultat in score_projets(chunk, service=service, include_risk=False):
+                    rapport['scored'] += 1
+                    score = round(max(0.0, min(1.0, (resultat['delay_score'] + resultat['budget_score']) / 2.0)), 2)
+                    for ia in ias_groupe:
+                        if score < float(ia.seuil_confiance or 0.5):
+                            rapport['below_threshold'] += 1
+                            continue
+                        type_alerte, niveau, description = _decrire_alerte(score)
+                        fingerprint = Alerte.make_fingerprint(resultat['projet_id'], type_alerte, niveau)
+                        if fingerprint in candidates:
+                            # Plusieurs IA déclenchent la même alerte : une seule est créée
+                            rapport['suppressed'] += 1
+                            continue
+                        candidates[fingerprint] = Alerte(
+                            type=type_alerte,
+                            description=description,
+                            statut='NOUVELLE',
+                            projet_id=resultat['projet_id'],
+                            ia=ia,
+                            fingerprint=fingerprint,
+                        )
+
+        deja_ouvertes = Alerte.empreintes_ouvertes(candidates.keys()) if candidates else set()
+        nouvelles = [alerte for fingerprint, alerte in candidates.items() if fingerprint not in deja_ouvertes]
+        rapport['suppressed'] += len(candidates) - len(nouvelles)
+        if nouvelles:
+            Alerte.objects.bulk_create(nouvelles, batch_size=500)
+        rapport['created'] = len(nouvelles)
+        rapport['alerte_ids'] = [str(alerte.id) for alerte in nouvelles]
+        return rapport
+
+
+def _niveau_risque_global(score: float) -> str:
+    if score > 0.7:
+        return 'élevé'
+    if score > 0.4:
+        return 'moyen'
+    return 'faible'
+
+
+def _decrire_alerte(score: float):
+    """Retourne (type, niveau, description) d'une alerte IA pour un score global"""
+    niveau = _niveau_risque_global(score)
+    type_alerte = 'CRITICAL' if score > 0.7 else 'WARNING'
+    description = f"Risque global {niveau} (score {score}) détecté par l'IA."
+    return type_alerte, niveau, description
+
 
 class Fournisseur(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -523,64 +740,72 @@ class RessourceMaterielle(Ressource):
 
 # ====== Signals pour synchroniser l'avancement des lots/chantier/projet quand les tâches changent ======
 
+# Champs dont la modification relance les recalculs en cascade (lot -> chantier -> projet)
+CHAMPS_CASCADE_TACHE = ('status', 'progress', 'lot', 'cost')
+CHAMPS_CASCADE_LOT = ('status', 'progress', 'chantier')
+CHAMPS_CASCADE_CHANTIER = ('status', 'progress', 'projet')
+
+
 def _mettre_a_jour_lot_et_hierarchie(lot: 'Lot') -> None:
+    # Lot, chantier et projet passent par la carte d'identité de la requête : chargés une
+    # fois, enregistrés une fois (colonnes modifiées) à la fin de l'unité de travail
+    from .identity_map import unite_de_travail
+    if lot is None:
+        return
     try:
-        # Mettre à jour l'avancement du lot
-        try:
-            nouveau_progress = lot.calculer_avancement()
-        except Exception:
-            nouveau_progress = getattr(lot, 'progress', 0)
-
-        if nouveau_progress is not None:
+        with unite_de_travail() as carte:
+            lot = carte.ajouter(lot)
+            # Mettre à jour l'avancement du lot
             try:
-                lot.progress = float(nouveau_progress)
+                nouveau_progress = lot.calculer_avancement()
             except Exception:
-                pass
-
-        # Mettre à jour le statut du lot en fonction des tâches
-        try:
-            taches_qs = lot.taches.all()
-            if taches_qs.exists():
-                if all((t.status == 'Terminé') for t in taches_qs):
-                    lot.status = 'Terminé'
-                elif any((t.status == 'En cours') for t in taches_qs):
-                    lot.status = 'En cours'
-                else:
-                    lot.status = 'En attente'
-        except Exception:
-            pass
+                nouveau_progress = getattr(lot, 'progress', 0)
 
-        lot.save(update_fields=['progress', 'status', 'updated_at'])
-
-        # Mettre à jour le chantier parent
-        try:
-            chantier = lot.chantier
-            if chantier:
-                try:
-                    chantier_progress = chantier.calculer_avancement()
-                    chantier.progress = float(chantier_progress or 0)
-                except Exception:
-                    pass
+            if nouveau_progress is not None:
                 try:
-                    chantier.status = chantier.synchroniser_statut()
+                    lot.progress = float(nouveau_progress)
                 except Exception:
                     pass
-                chantier.save(update_fields=['progress', 'status', 'updated_at'])
 
-                # Mettre à jour le projet parent
-                try:
-                    projet = chantier.projet
-                    if projet:
-                        try:
-                            # avancement_calcule est une propriété, pas stockée; on peut synchroniser le statut
-                            projet.status = projet.synchroniser_statut()
-                        except Exception:
-                            pass
-                        projet.save(update_fields=['status', 'updated_at'])
-                except Exception:
-                    pass
-        except Exception:
-            pass
+            # Mettre à jour le statut du lot en fonction des tâches (même règle que l'API)
+            try:
+                lot.status = lot.synchroniser_statut()
+            except Exception:
+                pass
+
+            carte.marquer(lot, 'progress', 'status')
+
+            # Mettre à jour le chantier parent
+            try:
+                chantier = carte.parent(lot, 'chantier')
+                if chantier:
+                    carte.enfants(chantier, 'lots')
+                    try:
+                        chantier_progress = chantier.calculer_avancement()
+                        chantier.progress = float(chantier_progress or 0)
+                    except Exception:
+                        pass
+                    try:
+                        chantier.status = chantier.synchroniser_statut()
+                    except Exception:
+                        pass
+                    carte.marquer(chantier, 'progress', 'status')
+
+                    # Mettre à jour le projet parent
+                    try:
+                        projet = carte.parent(chantier, 'projet')
+                        if projet:
+                            carte.enfants(projet, 'chantiers')
+                            try:
+                                # avancement_calcule est une propriété, pas stockée; on peut synchroniser le statut
+                                projet.status = projet.synchroniser_statut()
+                            except Exception:
+                                pass
+                            carte.marquer(projet, 'status')
+                    except Exception:
+                        pass
+            except Exception:
+                pass
     except Exception:
         # Ne pas faire planter un signal
         pass
@@ -589,8 +814,15 @@ def _mettre_a_jour_lot_et_hierarchie(lot: 'Lot') -> None:
 @receiver(post_save, sender=Tache)
 def tache_post_save(sender, instance: 'Tache', **kwargs):
     try:
-        if instance and instance.lot:
-            _mettre_a_jour_lot_et_hierarchie(instance.lot)
+        # Description, assignation, dates... ne changent ni l'avancement ni les statuts
+        if instance and instance.lot_id and instance.a_change(*CHAMPS_CASCADE_TACHE):
+            from .identity_map import unite_de_travail
+            with unite_de_travail() as carte:
+                _mettre_a_jour_lot_et_hierarchie(carte.parent(instance, 'lot'))
+                ancien_lot_id = instance.valeur_precedente('lot')
+                if ancien_lot_id and ancien_lot_id != instance.lot_id:
+                    # Tâche déplacée : l'ancien lot perd une tâche
+                    _mettre_a_jour_lot_et_hierarchie(carte.get(Lot, ancien_lot_id))
     except Exception:
         pass
 
@@ -598,12 +830,154 @@ def tache_post_save(sender, instance: 'Tache', **kwargs):
 @receiver(post_delete, sender=Tache)
 def tache_post_delete(sender, instance: 'Tache', **kwargs):
     try:
-        if instance and instance.lot:
-            _mettre_a_jour_lot_et_hierarchie(instance.lot)
+        if instance and instance.lot_id:
+            from .identity_map import unite_de_travail
+            with unite_de_travail() as carte:
+                _mettre_a_jour_lot_et_hierarchie(carte.parent(instance, 'lot'))
     except Exception:
         pass
 
 
+@receiver(post_delete, sender=Lot)
+@receiver(post_delete, sender=Chantier)
+@receiver(post_delete, sender=Projet)
+def hierarchie_post_delete(sender, instance, **kwargs):
+    # Objet supprimé : plus rien à enregistrer pour lui dans la carte de la requête
+    from .identity_map import carte_courante
+    carte = carte_courante()
+    if carte is not None:
+        carte.oublier(instance)
+
+
+# ====== Feature store ML (ProjetFeatures) : deltas appliqués depuis les tâches et chantiers ======
+
+@receiver(pre_save, sender=Tache)
+def tache_features_pre_save(sender, instance: 'Tache', update_fields=None, **kwargs):
+    try:
+        from .feature_store import memoriser_tache
+        memoriser_tache(instance, update_fields)
+    except Exception as e:
+        logger.error(f"Erreur feature store (pre_save tâche): {str(e)}")
+
+
+@receiver(post_save, sender=Tache)
+def tache_features_post_save(sender, instance: 'Tache', created=False, update_fields=None, **kwargs):
+    try:
+        from .feature_store import tache_enregistree
+        tache_enregistree(instance, created, update_fields)
+    except Exception as e:
+        logger.error(f"Erreur feature store (tâche {instance.pk}): {str(e)}")
+
+
+@receiver(post_delete, sender=Tache)
+def tache_features_post_delete(sender, instance: 'Tache', origin=None, **kwargs):
+    try:
+        from .feature_store import tache_supprimee
+        tache_supprimee(instance, origin)
+    except Exception as e:
+        logger.error(f"Erreur feature store (suppression tâche {instance.pk}): {str(e)}")
+
+
+@receiver(pre_save, sender=Lot)
+def lot_features_pre_save(sender, instance: 'Lot', update_fields=None, **kwargs):
+    try:
+        from .feature_store import memoriser_lot
+        memoriser_lot(instance, update_fields)
+    except Exception as e:
+        logger.error(f"Erreur feature store (pre_save lot): {str(e)}")
+
+
+@receiver(post_save, sender=Lot)
+def lot_features_post_save(sender, instance: 'Lot', created=False, update_fields=None, **kwargs):
+    try:
+        from .feature_store import lot_enregistre
+        lot_enregistre(instance, created, update_fields)
+    except Exception as e:
+        logger.error(f"Erreur feature store (lot {instance.pk}): {str(e)}")
+
+
+@receiver(post_delete, sender=Lot)
+def lot_features_post_delete(sender, instance: 'Lot', origin=None, **kwargs):
+    try:
+        from .feature_store import lot_supprime
+        lot_supprime(instance, origin)
+    except Exception as e:
+        logger.error(f"Erreur feature store (suppression lot {instance.pk}): {str(e)}")
+
+
+@receiver(pre_save, sender=Chantier)
+def chantier_features_pre_save(sender, instance: 'Chantier', update_fields=None, **kwargs):
+    try:
+        from .feature_store import memoriser_chantier
+        memoriser_chantier(instance, update_fields)
+    except Exception as e:
+        logger.error(f"Erreur feature store (pre_save chantier): {str(e)}")
+
+
+@receiver(post_save, sender=Chantier)
+def chantier_features_post_save(sender, instance: 'Chantier', created=False, update_fields=None, **kwargs):
+    try:
+        from .feature_store import chantier_enregistre
+        chantier_enregistre(instance, created, update_fields)
+    except Exception as e:
+        logger.error(f"Erreur feature store (chantier {instance.pk}): {str(e)}")
+
+
+@receiver(post_delete, sender=Chantier)
+def chantier_features_post_delete(sender, instance: 'Chantier', origin=None, **kwargs):
+    try:
+        from .feature_store import chantier_supprime
+        chantier_supprime(instance, origin)
+    except Exception as e:
+        logger.error(f"Erreur feature store (suppression chantier {instance.pk}): {str(e)}")
+
+
+@receiver(post_save, sender=Projet)
+def projet_features_post_save(sender, instance: 'Projet', created=False, **kwargs):
+    if not created:
+        return
+    try:
+        from .feature_store import rafraichir
+        rafraichir([instance.pk])
+    except Exception as e:
+        logger.error(f"Erreur feature store (projet {instance.pk}): {str(e)}")
+
+
+# ====== Index de similarité des projets terminés (historique des recommandations) ======
+
+@receiver(post_save, sender=Projet)
+def projet_similarite_post_save(sender, instance: 'Projet', **kwargs):
+    try:
+        from .ml_similarity import STATUT_TERMINE, similarity_index
+        if instance.status == STATUT_TERMINE or similarity_index.contient(instance.pk):
+            similarity_index.marquer(instance.pk)
+    except Exception as e:
+        logger.error(f"Erreur index de similarité (projet {instance.pk}): {str(e)}")
+
+
+@receiver(post_delete, sender=Projet)
+def projet_similarite_post_delete(sender, instance: 'Projet', **kwargs):
+    try:
+        from .ml_similarity import similarity_index
+        if similarity_index.contient(instance.pk):
+            similarity_index.marquer(instance.pk)
+    except Exception as e:
+        logger.error(f"Erreur index de similarité (suppression projet {instance.pk}): {str(e)}")
+
+
+
+# ====== Cache d'authentification (Utilisateur chargé depuis le jeton JWT) ======
+
+@receiver(post_save, sender=Utilisateur)
+@receiver(post_delete, sender=Utilisateur)
+def utilisateur_cache_auth(sender, instance: 'Utilisateur', **kwargs):
+    try:
+        from .authentication import oublier_utilisateur
+        oublier_utilisateur(instance.pk)
+    except Exception as e:
+        logger.error(f"Erreur cache d'authentification (utilisateur {instance.pk}): {str(e)}")
+
+
 class Budget(TimeStampedModel):
     id = models.BigAutoField(primary_key=True)
     montant_prev = models.DecimalField(max_digits=15, decimal_places=2, default=0)
@@ -624,12 +998,17 @@ class Alerte(TimeStampedModel):
         ('WARNING', 'Warning'),
         ('CRITICAL', 'Critical'),
     ]
+    STATUT_CHOICES = [
+        ('NOUVELLE', 'Nouvelle'),
+        ('EN_COURS', 'En cours de traitement'),
+        ('RESOLUE', 'Résolue'),
+    ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     type = models.CharField(max_length=16, choices=TYPE_CHOICES)
     description = models.TextField()
     date = models.DateField(auto_now_add=True)
-    statut = models.CharField(max_length=50, default='NOUVELLE')
+    statut = models.CharField(max_length=50, choices=STATUT_CHOICES, default='NOUVELLE')
     projet = models.ForeignKey(
         Projet, 
         related_name='alertes', 
@@ -642,10 +1021,41 @@ class Alerte(TimeStampedModel):
         null=True, 
         blank=True
     )
+    # Empreinte (projet, type, niveau de risque) des alertes générées par l'IA, pour la déduplication
+    fingerprint = models.CharField(max_length=128, blank=True, db_index=True)
+
+    # Statuts considérés comme clos : une alerte dans un autre statut est encore ouverte
+    # (et empêche la création d'une alerte IA de même empreinte)
+    STATUTS_CLOS = ('RESOLUE',)
 
     def __str__(self) -> str:
         return f"{self.type} - {self.projet.name}"
 
+    @property
+    def est_ouverte(self) -> bool:
+        return self.statut not in self.STATUTS_CLOS
+
+    def resoudre(self) -> bool:
+        """Clôt l'alerte (statut RESOLUE) ; False si elle l'était déjà"""
+        if not self.est_ouverte:
+            return False
+        self.statut = 'RESOLUE'
+        self.save(update_fields=['statut', 'updated_at'])
+        return True
+
+    @staticmethod
+    def make_fingerprint(projet_id, type_alerte: str, niveau: str) -> str:
+        return f"{projet_id}:{type_alerte}:{niveau}"
+
+    @classmethod
+    def empreintes_ouvertes(cls, fingerprints) -> set:
+        """Empreintes parmi `fingerprints` qui ont déjà une alerte ouverte"""
+        return set(
+            cls.objects.filter(fingerprint__in=list(fingerprints))
+            .exclude(statut__in=cls.STATUTS_CLOS)
+            .values_list('fingerprint', flat=True)
+        )
+
 
 class Rapport(TimeStampedModel):
     id = models.BigAutoField(primary_key=True)
@@ -662,6 +1072,106 @@ class Rapport(TimeStampedModel):
         return self.titre
 
 
+class RiskSnapshot(models.Model):
+    """Score de risque d'un projet à une date donnée (écrit par la commande score_portfolio)"""
+    id = models.BigAutoField(primary_key=True)
+    projet = models.ForeignKey(
+        Projet,
+        related_name='risk_snapshots',
+        on_delete=models.CASCADE
+    )
+    date = models.DateField()
+    delay_score = models.FloatField()
+    days_delay = models.IntegerField(default=0)
+    budget_score = models.FloatField()
+    risk_score = models.FloatField()
+    risk_level = models.CharField(max_length=16)
+    model_version = models.CharField(max_length=64, blank=True)
+    # Agrégats du projet à la date de l'instantané (ProjectAggregates.as_dict), features
+    # d'entraînement d'un projet en cours (voir ml_training)
+    features = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['projet', 'date'], name='unique_risk_snapshot_per_day'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.projet_id} - {self.date} ({self.risk_level})"
+
+
+class ProjetFeatures(models.Model):
+    """
+    Agrégats d'un projet utilisés par le scoring ML (feature store).
+    Tenus à jour par deltas depuis les signaux Tache/Chantier (voir feature_store) ;
+    nb_taches_en_retard dépend de la date : il est calculé pour date_reference et
+    recalculé par la commande quotidienne refresh_project_features.
+    """
+    projet = models.OneToOneField(
+        Projet,
+        related_name='features',
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    nb_chantiers = models.IntegerField(default=0)
+    nb_taches = models.IntegerField(default=0)
+    nb_taches_terminees = models.IntegerField(default=0)
+    nb_taches_en_retard = models.IntegerField(default=0)
+    budget_utilise = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    avancement = models.FloatField(default=0)
+    date_reference = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"Features {self.projet_id} ({self.date_reference})"
+
+    @property
+    def nb_taches_actives(self) -> int:
+        return self.nb_taches - self.nb_taches_terminees
+
+
+class AnalysisJob(models.Model):
+    """
+    Analyse complète d'un projet exécutée en arrière-plan (IAViewSet.full_analysis en mode
+    asynchrone, voir analysis_jobs). `cle` identifie l'IA, le projet dans sa version et les
+    paramètres : une seule analyse active par clé, un résultat réutilisé jusqu'à expires_at.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('succeeded', 'Terminée'),
+        ('failed', 'Échec'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    ia = models.ForeignKey(IA, related_name='analysis_jobs', on_delete=models.CASCADE)
+    projet = models.ForeignKey(Projet, related_name='analysis_jobs', on_delete=models.CASCADE)
+    cle = models.CharField(max_length=64, db_index=True)
+    parametres = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='pending')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cle'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='unique_analysis_job_actif',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.projet_id} - {self.status} ({self.created_at})"
+
+
 class ContactMessage(TimeStampedModel):
     """Modèle pour stocker les messages de contact"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -0,0 +1,44 @@
+"""
+Permissions par rôle des acteurs (endpoints de views_acteurs)
+
+Le rôle est lu dans le principal construit depuis le jeton JWT par
+JWTPrincipalAuthentication (request.user) : la vérification ne fait aucune requête.
+Sans jeton valide, DRF répond 401 ; avec un autre rôle ou un compte non validé, 403.
+Les messages sont au format {'error': ...} des autres réponses de l'API.
+"""
+from rest_framework.permissions import BasePermission
+
+from .authentication import JWTPrincipal
+
+
+class RolePermission(BasePermission):
+    """Accès réservé aux utilisateurs authentifiés dont le rôle est `role`"""
+    role = None
+    message = {'error': 'Accès refusé'}
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not isinstance(user, JWTPrincipal) or user.role != self.role:
+            return False
+        # Les administrateurs n'ont pas besoin de validation
+        return user.is_admin or user.is_approved
+
+
+class EstAdministrateur(RolePermission):
+    role = 'ADMINISTRATEUR'
+    message = {'error': 'Accès refusé. Réservé aux administrateurs.'}
+
+
+class EstMaitreOuvrage(RolePermission):
+    role = 'MAITRE_OUVRAGE'
+    message = {'error': 'Accès refusé. Réservé aux maîtres d\'ouvrage.'}
+
+
+class EstChefDeProjet(RolePermission):
+    role = 'CHEF_DE_PROJET'
+    message = {'error': 'Accès refusé. Réservé aux chefs de projet.'}
+
+
+class EstMembreTechnique(RolePermission):
+    role = 'MEMBRE_TECHNIQUE'
+    message = {'error': 'Accès refusé. Réservé aux membres techniques.'}
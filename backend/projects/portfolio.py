@@ -0,0 +1,119 @@
+"""
+Scoring de portefeuille : calcule les scores retard / budget / risque de nombreux projets
+en une passe, par paquets, éventuellement répartis sur un pool de processus.
+Utilisé par la commande score_portfolio (instantanés RiskSnapshot).
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List
+
+from django.db import connections
+from django.db.models import prefetch_related_objects
+
+from .models import Projet
+
+logger = logging.getLogger(__name__)
+
+STATUTS_INACTIFS = ('Terminé', 'Annulé')
+
+
+def projets_actifs_ids() -> List:
+    """Identifiants des projets actifs (ni terminés ni annulés)"""
+    return list(
+        Projet.objects.exclude(status__in=STATUTS_INACTIFS).order_by('created_at').values_list('id', flat=True)
+    )
+
+
+def iter_chunks(items: List, chunk_size: int) -> Iterator[List]:
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+
+def _collecter_taches(chantiers) -> List:
+    taches = []
+    for chantier in chantiers:
+        for lot in chantier.lots.all():
+            taches.extend(lot.taches.all())
+    return taches
+
+
+def score_projets(projet_ids: Iterable, service=None, include_risk: bool = True) -> List[Dict]:
+    """
+    Score une liste de projets avec le service ML (par défaut le service global).
+    Sans `include_risk`, seuls les modèles de retard et de budget sont appelés
+    (pas de risk_score / risk_level dans les résultats).
+    Les agrégats sont lus dans ProjetFeatures en une requête pour tout le paquet ;
+    seuls les projets absents du feature store chargent leur arborescence
+    chantiers → lots → tâches (préchargée en 3 requêtes).
+    """
+    from .ml_service import ProjectAggregates
+    from .models import ProjetFeatures
+
+    if service is None:
+        from .ml_service import ml_service as service
+
+    resultats = []
+    # Une seule version de modèles pour tout le paquet, même si un rechargement à chaud intervient
+    bundle = service._current_bundle()
+    projets = list(Projet.objects.filter(id__in=list(projet_ids)))
+    stockes = ProjetFeatures.objects.in_bulk([projet.id for projet in projets])
+    prefetch_related_objects([projet for projet in projets if projet.id not in stockes], 'chantiers__lots__taches')
+    for projet in projets:
+        try:
+            if projet.id in stockes:
+                aggregates = ProjectAggregates.from_store(stockes[projet.id])
+            else:
+                chantiers = list(projet.chantiers.all())
+                aggregates = ProjectAggregates.from_tree(projet, chantiers, _collecter_taches(chantiers))
+            try:
+                budget = projet.budget_detail
+            except Exception:
+                budget = None
+
+            delay = service.predict_delay_risk(projet, bundle=bundle, aggregates=aggregates)
+            budget_pred = service.predict_budget_overrun(projet, budget=budget, bundle=bundle, aggregates=aggregates)
+            resultat = {
+                'projet_id': projet.id,
+                'delay_score': float(delay.get('risk_score', 0.5)),
+                'days_delay': int(delay.get('days_delay', 0) or 0),
+                'budget_score': float(budget_pred.get('risk_score', 0.5)),
+                'model_version': bundle.version or '',
+                'features': aggregates.as_dict(),
+            }
+            if include_risk:
+                risk = service.predict_risk(projet, bundle=bundle, aggregates=aggregates)
+                resultat['risk_score'] = float(risk.get('risk_score', 0.5))
+                resultat['risk_level'] = risk.get('risk_level', 'moyen')
+            resultats.append(resultat)
+        except Exception as e:
+            logger.error(f"Erreur lors du scoring du projet {projet.id}: {str(e)}")
+    return resultats
+
+
+def _score_chunk_in_worker(projet_ids: List) -> List[Dict]:
+    try:
+        return score_projets(projet_ids)
+    finally:
+        # Chaque processus du pool ouvre ses propres connexions : les refermer après chaque paquet
+        connections.close_all()
+
+
+def score_portfolio(projet_ids: List, chunk_size: int = 50, workers: int = 1) -> Iterator[List[Dict]]:
+    """
+    Score les projets par paquets et produit les résultats paquet par paquet.
+    Avec workers > 1, les paquets sont répartis sur un ProcessPoolExecutor.
+    """
+    chunks = list(iter_chunks(list(projet_ids), chunk_size))
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield score_projets(chunk)
+        return
+
+    # Charger les modèles avant le fork : les processus du pool partagent ces pages mémoire
+    from .ml_service import ml_service  # noqa: F401
+
+    # Les connexions ouvertes ne doivent pas être partagées avec les processus forkés
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for resultats in executor.map(_score_chunk_in_worker, chunks):
+            yield resultats
@@ -0,0 +1,476 @@
+"""
+Ordonnancement des tâches d'un projet : méthode du chemin critique (CPM)
+
+Les dépendances (TacheDependance, liens fin-début avec décalage) sont stockées sous
+forme compacte : tâches numérotées 0..n-1 et arcs en CSR (indptr / indices / décalages,
+tableaux NumPy), dans le sens des successeurs et dans celui des prédécesseurs. L'ordre
+topologique est obtenu par l'algorithme de Kahn ; la passe avant (début et fin au plus
+tôt) puis la passe arrière (début et fin au plus tard) suivent cet ordre, en O(V + E).
+
+Durée d'une tâche : jours entre ses dates de début et de fin prévues (0 sans dates). La
+date de début prévue est une contrainte « pas avant » :
+    début au plus tôt = max(début prévu, fin au plus tôt des prédécesseurs + décalage)
+La fin du projet est la plus tardive des fins au plus tôt ; marge = début au plus tard -
+début au plus tôt, et les tâches de marge nulle forment le chemin critique.
+
+Les calculs sont gardés en mémoire par projet avec sa version (nombre et dernière
+modification des tâches et des dépendances, une requête agrégée chacun) :
+- version inchangée : résultat servi tel quel ;
+- seules des tâches existantes ont été modifiées : elles sont relues et seules les tâches
+  dont les valeurs changent sont recalculées (en aval pour la passe avant, en amont pour
+  la passe arrière) ;
+- tâches ou dépendances ajoutées / supprimées : graphe reconstruit.
+"""
+import heapq
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 32
+TASK_FIELDS = ('cle', 'name', 'start_date', 'end_date')
+# Marge pour les enregistrements concurrents de la version précédente
+VERSION_MARGIN = timedelta(seconds=1)
+
+
+def _get_setting(name, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+class CycleError(ValueError):
+    """Les dépendances du projet forment un cycle"""
+
+    def __init__(self, task_ids: Iterable):
+        self.task_ids = list(task_ids)
+        super().__init__(f"Dépendances circulaires : {len(self.task_ids)} tâches n'ont pas d'ordre possible")
+
+
+def build_csr(sources: np.ndarray, targets: np.ndarray, weights: np.ndarray, n: int):
+    """Arcs sources -> targets en CSR : voisins de i dans indices[indptr[i]:indptr[i + 1]]"""
+    order = np.argsort(sources, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+    return indptr, targets[order].astype(np.int32), weights[order].astype(np.int64)
+
+
+def topological_order(indptr: List[int], indices: List[int], n: int) -> List[int]:
+    """Ordre topologique (Kahn) ; lève CycleError (indices des tâches non ordonnées) si le graphe a un cycle"""
+    in_degree = [0] * n
+    for v in indices:
+        in_degree[v] += 1
+    order = [v for v in range(n) if in_degree[v] == 0]
+    head = 0
+    while head < len(order):
+        u = order[head]
+        head += 1
+        for k in range(indptr[u], indptr[u + 1]):
+            v = indices[k]
+            in_degree[v] -= 1
+            if in_degree[v] == 0:
+                order.append(v)
+    if len(order) < n:
+        raise CycleError(v for v in range(n) if in_degree[v] > 0)
+    return order
+
+
+class ProjectSchedule:
+    """
+    Graphe des tâches d'un projet et dates au plus tôt / au plus tard (en jours depuis `origin`).
+    Les tâches sont identifiées par leur clé brute (UUID converti en texte par la base, voir
+    _cles) : un dictionnaire de chaînes est bien plus rapide à construire et à interroger
+    que des objets UUID, dont la conversion et le hachage sont faits en Python.
+    """
+
+    def __init__(self, rows: List[Tuple], edges: List[Tuple], version=None, origin: Optional[date] = None):
+        self.version = version
+        self.ids = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.index = {cle: i for i, cle in enumerate(self.ids)}
+        self._str_ids = None
+        n = len(self.ids)
+        starts = [row[2] for row in rows if row[2]]
+        self.origin = origin or (min(starts) if starts else date.today())
+        self.dated = [False] * n
+        self.release = [0] * n
+        self.duration = [0] * n
+        for i, row in enumerate(rows):
+            self._dater(i, row[2], row[3])
+
+        position = self.index.get
+        sources, targets, lags = [], [], []
+        for predecesseur, successeur, decalage in edges:
+            u, v = position(predecesseur), position(successeur)
+            if u is not None and v is not None:
+                sources.append(u)
+                targets.append(v)
+                lags.append(decalage)
+        sources = np.array(sources, dtype=np.int64)
+        targets = np.array(targets, dtype=np.int64)
+        lags = np.array(lags, dtype=np.int64)
+        self.successors = build_csr(sources, targets, lags, n)
+        self.predecessors = build_csr(targets, sources, lags, n)
+        # Copies en listes Python : accès élément par élément bien plus rapides que sur NumPy
+        self._succ = tuple(array.tolist() for array in self.successors)
+        self._pred = tuple(array.tolist() for array in self.predecessors)
+
+        try:
+            self.order = topological_order(self._succ[0], self._succ[1], n)
+        except CycleError as e:
+            raise CycleError(str(uuid.UUID(self.ids[i])) for i in e.task_ids) from None
+        self.position = [0] * n
+        for p, v in enumerate(self.order):
+            self.position[v] = p
+
+        self.lock = threading.Lock()
+        self._resultats = {}
+        self._passe_avant()
+        self._passe_arriere()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def contient(self, cle) -> bool:
+        return cle in self.index
+
+    @property
+    def str_ids(self) -> List[str]:
+        """Identifiants des tâches au format UUID standard (convertis une fois par graphe)"""
+        if self._str_ids is None:
+            self._str_ids = [str(uuid.UUID(cle)) for cle in self.ids]
+        return self._str_ids
+
+    @property
+    def nb_dependances(self) -> int:
+        return len(self._succ[1])
+
+    def _dater(self, i: int, start: Optional[date], end: Optional[date]) -> None:
+        self.dated[i] = bool(start and end)
+        self.release[i] = (start - self.origin).days if start else 0
+        self.duration[i] = max((end - start).days, 0) if start and end else 0
+
+    # ----- Calcul complet -----
+
+    def _passe_avant(self) -> None:
+        indptr, indices, lags = self._pred
+        release, duration = self.release, self.duration
+        es, ef = [0] * len(self), [0] * len(self)
+        for v in self.order:
+            debut = release[v]
+            for k in range(indptr[v], indptr[v + 1]):
+                candidat = ef[indices[k]] + lags[k]
+                if candidat > debut:
+                    debut = candidat
+            es[v] = debut
+            ef[v] = debut + duration[v]
+        self.es, self.ef = es, ef
+        self.finish = max(ef) if ef else 0
+
+    def _passe_arriere(self) -> None:
+        indptr, indices, lags = self._succ
+        duration, finish = self.duration, self.finish
+        ls, lf = [0] * len(self), [0] * len(self)
+        for v in reversed(self.order):
+            fin = finish
+            for k in range(indptr[v], indptr[v + 1]):
+                candidat = ls[indices[k]] - lags[k]
+                if candidat < fin:
+                    fin = candidat
+            lf[v] = fin
+            ls[v] = fin - duration[v]
+        self.ls, self.lf = ls, lf
+
+    # ----- Mise à jour incrémentale -----
+
+    def mettre_a_jour(self, changes: Dict) -> int:
+        """
+        Applique de nouvelles dates {clé: (name, start_date, end_date)} et ne recalcule que
+        les tâches affectées. Retourne le nombre de tâches recalculées.
+        """
+        modifiees, durees_modifiees = [], []
+        for cle, (name, start, end) in changes.items():
+            i = self.index[cle]
+            self.names[i] = name
+            avant = (self.dated[i], self.release[i], self.duration[i])
+            self._dater(i, start, end)
+            if (self.dated[i], self.release[i], self.duration[i]) != avant:
+                modifiees.append(i)
+                if self.duration[i] != avant[2]:
+                    durees_modifiees.append(i)
+        self._resultats = {}
+        if not modifiees:
+            return 0
+
+        recalculees = self._propager_avant(modifiees)
+        finish = max(self.ef)
+        if finish != self.finish:
+            # Toutes les fins au plus tard dépendent de la fin du projet
+            self.finish = finish
+            self._passe_arriere()
+            return len(self)
+        return recalculees + self._propager_arriere(durees_modifiees)
+
+    def _propager_avant(self, seeds: List[int]) -> int:
+        indptr, indices, lags = self._pred
+        succ_ptr, succ_idx, _ = self._succ
+        es, ef, position, order = self.es, self.ef, self.position, self.order
+        heap = [position[v] for v in seeds]
+        heapq.heapify(heap)
+        queued = set(seeds)
+        recalculees = 0
+        while heap:
+            v = order[heapq.heappop(heap)]
+            recalculees += 1
+            debut = self.release[v]
+            for k in range(indptr[v], indptr[v + 1]):
+                candidat = ef[indices[k]] + lags[k]
+                if candidat > debut:
+                    debut = candidat
+            fin = debut + self.duration[v]
+            es[v] = debut
+            if fin != ef[v]:
+                ef[v] = fin
+                for k in range(succ_ptr[v], succ_ptr[v + 1]):
+                    w = succ_idx[k]
+                    if w not in queued:
+                        queued.add(w)
+                        heapq.heappush(heap, position[w])
+        return recalculees
+
+    def _propager_arriere(self, seeds: List[int]) -> int:
+        indptr, indices, lags = self._succ
+        pred_ptr, pred_idx, _ = self._pred
+        ls, lf, position, order = self.ls, self.lf, self.position, self.order
+        heap = [-position[v] for v in seeds]
+        heapq.heapify(heap)
+        queued = set(seeds)
+        recalculees = 0
+        while heap:
+            v = order[-heapq.heappop(heap)]
+            recalculees += 1
+            fin = self.finish
+            for k in range(indptr[v], indptr[v + 1]):
+                candidat = ls[indices[k]] - lags[k]
+                if candidat < fin:
+                    fin = candidat
+            lf[v] = fin
+            debut = fin - self.duration[v]
+            if debut != ls[v]:
+                ls[v] = debut
+                for k in range(pred_ptr[v], pred_ptr[v + 1]):
+                    u = pred_idx[k]
+                    if u not in queued:
+                        queued.add(u)
+                        heapq.heappush(heap, -position[u])
+        return recalculees
+
+    # ----- Résultat -----
+
+    def resultat(self, critical_only: bool = False) -> Dict:
+        """Dates au plus tôt / au plus tard, marges et chemin critique (tâches triées par début au plus tôt)"""
+        if critical_only in self._resultats:
+            return self._resultats[critical_only]
+        es, ef = np.asarray(self.es, dtype=np.int64), np.asarray(self.ef, dtype=np.int64)
+        ls, lf = np.asarray(self.ls, dtype=np.int64), np.asarray(self.lf, dtype=np.int64)
+        slack = ls - es
+        critical = slack == 0
+
+        chemin = np.flatnonzero(critical)
+        chemin = chemin[np.lexsort((ef[chemin], es[chemin]))]
+        selection = chemin if critical_only else np.lexsort((ef, es))
+
+        # Dates au format ISO lues dans une table couvrant [début au plus tôt, fin au plus tard]
+        premier = int(min(es.min(), ls.min())) if len(self) else 0
+        dernier = int(max(ef.max(), lf.max())) if len(self) else 0
+        origin = self.origin + timedelta(days=premier)
+        table = [(origin + timedelta(days=jour)).isoformat() for jour in range(dernier - premier + 1)]
+        colonnes = {
+            name: [table[jour] for jour in (values[selection] - premier).tolist()]
+            for name, values in (('early_start', es), ('early_finish', ef), ('late_start', ls), ('late_finish', lf))
+        }
+        slack_selection = slack[selection].tolist()
+        critical_selection = critical[selection].tolist()
+        ids, names, duration, dated = self.str_ids, self.names, self.duration, self.dated
+        taches = []
+        for j, i in enumerate(selection.tolist()):
+            taches.append({
+                'id': ids[i],
+                'name': names[i],
+                'duration': duration[i],
+                'dated': dated[i],
+                'early_start': colonnes['early_start'][j],
+                'early_finish': colonnes['early_finish'][j],
+                'late_start': colonnes['late_start'][j],
+                'late_finish': colonnes['late_finish'][j],
+                'slack': slack_selection[j],
+                'critical': critical_selection[j],
+            })
+        resultat = {
+            'start_date': self.origin.isoformat() if len(self) else None,
+            'finish_date': (self.origin + timedelta(days=self.finish)).isoformat() if len(self) else None,
+            'duration': self.finish - (min(self.es) if len(self) else 0),
+            'task_count': len(self),
+            'dependency_count': self.nb_dependances,
+            'critical_path': [ids[i] for i in chemin.tolist()],
+            'tasks': taches,
+        }
+        self._resultats[critical_only] = resultat
+        return resultat
+
+
+def _cles(queryset, **champs):
+    """Annote les UUID `champs` convertis en texte par la base (aucune conversion en objets UUID)"""
+    from django.db.models import CharField
+    from django.db.models.functions import Cast
+
+    return queryset.annotate(**{nom: Cast(champ, output_field=CharField()) for nom, champ in champs.items()})
+
+
+def _charger(projet_id) -> Tuple[List[Tuple], List[Tuple]]:
+    from .models import Tache, TacheDependance
+
+    taches = Tache.objects.filter(lot__chantier__projet_id=projet_id).order_by('id')
+    rows = list(_cles(taches, cle='id').values_list(*TASK_FIELDS))
+    edges = list(
+        _cles(TacheDependance.objects.filter(projet_id=projet_id), cle_predecesseur='predecesseur_id', cle_successeur='successeur_id')
+        .values_list('cle_predecesseur', 'cle_successeur', 'decalage')
+    )
+    return rows, edges
+
+
+def project_version(projet_id) -> Tuple:
+    """(nombre de tâches, dernière modification, nombre de dépendances, dernière modification)"""
+    from django.db.models import Count, Max
+    from .models import Tache, TacheDependance
+
+    taches = Tache.objects.filter(lot__chantier__projet_id=projet_id).aggregate(n=Count('id'), last=Max('updated_at'))
+    dependances = TacheDependance.objects.filter(projet_id=projet_id).aggregate(n=Count('id'), last=Max('updated_at'))
+    return taches['n'], taches['last'], dependances['n'], dependances['last']
+
+
+class ScheduleCache:
+    """Ordonnancements des projets récemment consultés (LRU), tenus à jour par version"""
+
+    def __init__(self, max_size: Optional[int] = None):
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._schedules = OrderedDict()
+
+    @property
+    def max_size(self) -> int:
+        if self._max_size is not None:
+            return self._max_size
+        return int(_get_setting('SCHEDULING_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+
+    def _stocker(self, projet_id, schedule: ProjectSchedule) -> None:
+        with self._lock:
+            self._schedules[projet_id] = schedule
+            self._schedules.move_to_end(projet_id)
+            while len(self._schedules) > self.max_size:
+                self._schedules.popitem(last=False)
+
+    def _incremental(self, projet_id, schedule: ProjectSchedule, version) -> Optional[int]:
+        """Relit les tâches modifiées depuis la version en cache ; None si le graphe doit être reconstruit"""
+        from .models import Tache
+
+        ancienne = schedule.version
+        if ancienne[0] != version[0] or ancienne[2:] != version[2:] or ancienne[1] is None:
+            return None
+        taches = Tache.objects.filter(lot__chantier__projet_id=projet_id, updated_at__gte=ancienne[1] - VERSION_MARGIN)
+        changes = {}
+        for cle, name, start, end in _cles(taches, cle='id').values_list(*TASK_FIELDS):
+            if not schedule.contient(cle):
+                # Tâche ajoutée et une autre supprimée : même nombre, graphe différent
+                return None
+            changes[cle] = (name, start, end)
+        recalculees = schedule.mettre_a_jour(changes)
+        schedule.version = version
+        return recalculees
+
+    def get(self, projet_id) -> Tuple[ProjectSchedule, Dict]:
+        """Ordonnancement à jour du projet et informations sur le calcul (mode, durée)"""
+        start = time.perf_counter()
+        version = project_version(projet_id)
+        with self._lock:
+            schedule = self._schedules.get(projet_id)
+            if schedule is not None:
+                self._schedules.move_to_end(projet_id)
+
+        info = {'mode': 'cache', 'recomputed_tasks': 0}
+        if schedule is not None:
+            with schedule.lock:
+                if schedule.version != version:
+                    recalculees = self._incremental(projet_id, schedule, version)
+                    if recalculees is not None:
+                        info = {'mode': 'incremental', 'recomputed_tasks': recalculees}
+                    else:
+                        schedule = None
+        if schedule is None:
+            rows, edges = _charger(projet_id)
+            schedule = ProjectSchedule(rows, edges, version=version)
+            self._stocker(projet_id, schedule)
+            info = {'mode': 'full', 'recomputed_tasks': len(schedule)}
+        info['computed_in_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return schedule, info
+
+    def invalider(self, projet_id=None) -> None:
+        with self._lock:
+            if projet_id is None:
+                self._schedules.clear()
+            else:
+                self._schedules.pop(projet_id, None)
+
+
+def compute_critical_path(projet, critical_only: bool = False) -> Dict:
+    """Chemin critique du projet ; lève CycleError si les dépendances forment un cycle"""
+    schedule, info = schedule_cache.get(projet.pk)
+    with schedule.lock:
+        resultat = dict(schedule.resultat(critical_only))
+    resultat.update({
+        'projet_id': str(projet.pk),
+        'planned_end_date': projet.end_date.isoformat() if projet.end_date else None,
+        'computation': info,
+    })
+    if projet.end_date and resultat['finish_date']:
+        resultat['days_beyond_planned_end'] = max(
+            (date.fromisoformat(resultat['finish_date']) - projet.end_date).days, 0
+        )
+    return resultat
+
+
+def creerait_cycle(predecesseur_id, successeur_id, projet_id, exclude_id=None) -> bool:
+    """Vrai si le lien predecesseur -> successeur fermerait un cycle (successeur mène déjà au prédécesseur)"""
+    from .models import TacheDependance
+
+    if predecesseur_id == successeur_id:
+        return True
+    liens = TacheDependance.objects.filter(projet_id=projet_id)
+    if exclude_id is not None:
+        liens = liens.exclude(id=exclude_id)
+    successeurs = {}
+    for p, s in liens.values_list('predecesseur_id', 'successeur_id'):
+        successeurs.setdefault(p, []).append(s)
+    pile, vus = [successeur_id], {successeur_id}
+    while pile:
+        u = pile.pop()
+        for v in successeurs.get(u, ()):
+            if v == predecesseur_id:
+                return True
+            if v not in vus:
+                vus.add(v)
+                pile.append(v)
+    return False
+
+
+# Cache global (un par processus)
+schedule_cache = ScheduleCache()
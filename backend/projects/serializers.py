@@ -4,6 +4,7 @@ from .models import (
     Chantier,
     Lot,
     Tache,
+    TacheDependance,
     Utilisateur,
     IA,
     Alerte,
@@ -14,6 +15,8 @@ from .models import (
     RessourceMaterielle,
     Fournisseur,
     ContactMessage,
+    RiskSnapshot,
+    AnalysisJob,
 )
 
 
@@ -80,7 +83,7 @@ class ProjetSerializer(serializers.ModelSerializer):
     class Meta:
         model = Projet
         fields = '__all__'
-        read_only_fields = ('created_at', 'updated_at', 'id')
+        read_only_fields = ('created_at', 'updated_at', 'id', 'date_fin_reelle')
 
 
 class ChantierSerializer(serializers.ModelSerializer):
@@ -325,6 +328,32 @@ class TacheSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'updated_at', 'id')
 
 
+class TacheDependanceSerializer(serializers.ModelSerializer):
+    predecesseur_name = serializers.CharField(source='predecesseur.name', read_only=True)
+    successeur_name = serializers.CharField(source='successeur.name', read_only=True)
+
+    def validate(self, attrs):
+        from .scheduling import creerait_cycle
+
+        predecesseur = attrs.get('predecesseur', getattr(self.instance, 'predecesseur', None))
+        successeur = attrs.get('successeur', getattr(self.instance, 'successeur', None))
+        if predecesseur is None or successeur is None:
+            return attrs
+        if predecesseur.pk == successeur.pk:
+            raise serializers.ValidationError({'successeur': 'Une tâche ne peut pas dépendre d\'elle-même.'})
+        projet_id = successeur.lot.chantier.projet_id
+        if predecesseur.lot.chantier.projet_id != projet_id:
+            raise serializers.ValidationError({'predecesseur': 'Les deux tâches doivent appartenir au même projet.'})
+        if creerait_cycle(predecesseur.pk, successeur.pk, projet_id, exclude_id=getattr(self.instance, 'pk', None)):
+            raise serializers.ValidationError({'predecesseur': 'Cette dépendance créerait un cycle entre les tâches.'})
+        return attrs
+
+    class Meta:
+        model = TacheDependance
+        fields = '__all__'
+        read_only_fields = ('created_at', 'updated_at', 'id')
+
+
 class UtilisateurSerializer(serializers.ModelSerializer):
     mot_de_passe = serializers.CharField(write_only=True, required=False)
     
@@ -492,7 +521,7 @@ class AlerteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Alerte
         fields = '__all__'
-        read_only_fields = ('created_at', 'updated_at', 'id')
+        read_only_fields = ('created_at', 'updated_at', 'id', 'fingerprint')
 
 
 class BudgetSerializer(serializers.ModelSerializer):
@@ -698,3 +727,39 @@ class ContactMessageSerializer(serializers.ModelSerializer):
         model = ContactMessage
         fields = ['id', 'first_name', 'last_name', 'email', 'phone', 'organization', 'subject', 'message', 'is_read', 'created_at']
         read_only_fields = ['id', 'is_read', 'created_at']
+
+
+class RiskSnapshotSerializer(serializers.ModelSerializer):
+    projet_id = serializers.UUIDField(read_only=True)
+    projet_name = serializers.CharField(source='projet.name', read_only=True)
+
+    class Meta:
+        model = RiskSnapshot
+        fields = (
+            'projet_id', 'projet_name', 'date', 'delay_score', 'days_delay',
+            'budget_score', 'risk_score', 'risk_level', 'model_version',
+        )
+        read_only_fields = fields
+
+
+class AnalysisJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id', read_only=True)
+    projet_id = serializers.UUIDField(read_only=True)
+    ia_id = serializers.UUIDField(read_only=True)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Résultat seulement une fois terminé, erreur seulement en cas d'échec
+        if instance.status != 'succeeded':
+            data.pop('result')
+        if instance.status != 'failed':
+            data.pop('error')
+        return data
+
+    class Meta:
+        model = AnalysisJob
+        fields = (
+            'job_id', 'ia_id', 'projet_id', 'status', 'parametres', 'result', 'error',
+            'created_at', 'started_at', 'finished_at', 'expires_at',
+        )
+        read_only_fields = fields
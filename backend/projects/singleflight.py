@@ -0,0 +1,127 @@
+"""
+Single-flight : regroupe les calculs identiques concurrents
+
+Quand plusieurs requêtes identiques (même action IA, même IA, même projet) arrivent
+en même temps, une seule effectue le calcul et les autres attendent son résultat :
+- dans un worker, via un Future partagé par clé ;
+- entre workers, via un verrou et un résultat temporaires dans le cache 'shared'
+  (DatabaseCache, voir settings.CACHES).
+Un suiveur n'accepte qu'un résultat terminé après son arrivée : ce n'est pas un
+cache, un appel qui arrive après la fin du calcul recalcule.
+Si le cache partagé est indisponible, seule la déduplication dans le worker s'applique.
+Un suiveur qui attend plus de SINGLEFLIGHT_TIMEOUT secondes calcule lui-même.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Hashable
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_ALIAS = 'shared'
+POLL_INTERVAL = 0.025
+
+
+def _shared_cache():
+    try:
+        return caches[SHARED_CACHE_ALIAS]
+    except InvalidCacheBackendError:
+        return None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    @property
+    def timeout(self) -> float:
+        return float(getattr(settings, 'SINGLEFLIGHT_TIMEOUT', 30))
+
+    def do(self, key: Hashable, fn: Callable):
+        """Exécute fn() une seule fois pour tous les appels concurrents de même clé"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = Future()
+                self._calls[key] = call
+
+        if not leader:
+            try:
+                return call.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                # Le meneur est bloqué : même repli que l'attente entre workers
+                logger.warning(f"Attente single-flight expirée pour {key!r}, calcul local")
+                return fn()
+
+        try:
+            value = self._do_shared(key, fn)
+            call.set_result(value)
+            return value
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _do_shared(self, key: Hashable, fn: Callable):
+        """Coordination entre workers : le premier qui pose le verrou calcule, les autres attendent"""
+        cache = _shared_cache()
+        if cache is None:
+            return fn()
+
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        lock_key = f'singleflight:lock:{digest}'
+        result_key = f'singleflight:result:{digest}'
+        arrived_at = time.time()
+        deadline = time.monotonic() + self.timeout
+        token = uuid.uuid4().hex
+
+        while True:
+            try:
+                acquired = cache.add(lock_key, token, timeout=self.timeout)
+            except Exception as e:
+                logger.warning(f"Cache partagé indisponible pour le single-flight: {str(e)}")
+                return fn()
+
+            if acquired:
+                try:
+                    value = fn()
+                    try:
+                        cache.set(result_key, {'finished_at': time.time(), 'value': value}, timeout=self.timeout)
+                    except Exception as e:
+                        logger.warning(f"Résultat single-flight non partagé: {str(e)}")
+                    return value
+                finally:
+                    try:
+                        if cache.get(lock_key) == token:
+                            cache.delete(lock_key)
+                    except Exception:
+                        pass
+
+            # Un autre worker calcule : attendre son résultat, ou reprendre la main s'il abandonne
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                try:
+                    result = cache.get(result_key)
+                    if result is not None and result['finished_at'] >= arrived_at:
+                        return result['value']
+                    if cache.get(lock_key) is None:
+                        break
+                except Exception:
+                    return fn()
+            else:
+                logger.warning(f"Attente single-flight expirée pour {key!r}, calcul local")
+                return fn()
+
+
+# Instance globale (une par processus)
+singleflight = SingleFlight()
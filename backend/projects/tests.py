@@ -0,0 +1,1009 @@
+"""
+Tests ciblés des chemins optimisés de l'API (inférence ML, cascades d'écriture,
+authentification et connexion, jobs d'analyse, alertes IA)
+"""
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import analysis_jobs
+from .authentication import JWTPrincipal
+from .evm import EV_AVANCEMENT, EV_TERMINEES, calculer_evm, evm_chantier, evm_projet
+from .feature_store import FEATURE_FIELDS, calculer_features
+from .loaders import charger_chantier, charger_lot, charger_projet, charger_tache
+from .ml_artifact import MODEL_KINDS, export_models, load_artifact
+from .ml_inference import CompiledForest, predict_rows
+from .ml_metrics import ml_metrics
+from .ml_service import ModelBundle, ProjectAggregates, compute_ml_features, ml_service
+from .ml_simulation import MAX_ITERATIONS, MIN_HISTORY, simulate_completion
+from .ml_training import ML_FEATURE_NAMES, load_training_data
+from .models import (
+    IA, Alerte, AnalysisJob, Chantier, Lot, Projet, ProjetFeatures, RiskSnapshot, Tache, TacheDependance,
+    Utilisateur,
+)
+from .scheduling import ProjectSchedule, _charger, compute_critical_path, schedule_cache
+
+
+def _charger_pickle():
+    with open(settings.ML_MODELS_PATH, 'rb') as f:
+        return pickle.load(f)
+
+
+def _lignes(models, kind: str, n: int, seed: int = 0):
+    """Lignes brutes (non normalisées) autour de la moyenne du scaler `kind`"""
+    scaler = models[f'scaler_{kind}']
+    rng = np.random.default_rng(seed)
+    return scaler.mean_ + rng.standard_normal((n, len(scaler.mean_))) * scaler.scale_ * 2
+
+
+@unittest.skipUnless(os.path.exists(settings.ML_MODELS_PATH), "buildflow_models.pkl absent")
+class ArtefactMLTests(TestCase):
+    """Artefact mmap (ml_artifact) : mêmes prédictions que le pickle, remplacement atomique"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.models = _charger_pickle()
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dossier, True)
+
+    def test_predictions_identiques_au_pickle(self):
+        export_models(self.models, self.dossier, version='v1')
+        charges, manifest = load_artifact(os.path.join(self.dossier, 'v1'))
+        self.assertEqual(manifest['version'], 'v1')
+        for kind in MODEL_KINDS:
+            for n in (1, 64):
+                lignes = _lignes(self.models, kind, n)
+                attendu = predict_rows(self.models, kind, lignes)
+                obtenu = predict_rows(charges, kind, lignes)
+                self.assertTrue(np.array_equal(attendu, obtenu), f"{kind}, {n} ligne(s)")
+
+    def test_reexport_remplace_la_version_sans_la_supprimer_avant(self):
+        export_models(self.models, self.dossier, version='v1')
+        anciens, _ = load_artifact(os.path.join(self.dossier, 'v1'))
+        lignes = _lignes(self.models, 'risk', 8)
+
+        export_models(self.models, self.dossier, version='v1')
+
+        # Ni répertoire temporaire ni copie de l'ancienne version ne restent
+        self.assertEqual(sorted(os.listdir(self.dossier)), ['current.json', 'v1'])
+        # Les tableaux mmap de l'ancienne version restent lisibles après le remplacement
+        attendu = predict_rows(self.models, 'risk', lignes)
+        self.assertTrue(np.array_equal(predict_rows(anciens, 'risk', lignes), attendu))
+        nouveaux, _ = load_artifact(os.path.join(self.dossier, 'v1'))
+        self.assertTrue(np.array_equal(predict_rows(nouveaux, 'risk', lignes), attendu))
+
+    def test_export_en_echec_laisse_la_version_en_place(self):
+        export_models(self.models, self.dossier, version='v1')
+        incomplets = dict(self.models)
+        del incomplets['risk_model']
+        with self.assertRaises(KeyError):
+            export_models(incomplets, self.dossier, version='v1')
+        self.assertEqual(sorted(os.listdir(self.dossier)), ['current.json', 'v1'])
+        charges, _ = load_artifact(os.path.join(self.dossier, 'v1'))
+        self.assertIn('risk_model', charges)
+
+
+@unittest.skipUnless(os.path.exists(settings.ML_MODELS_PATH), "buildflow_models.pkl absent")
+class CompiledForestTests(TestCase):
+    """Forêt compilée : parité exacte avec RandomForestClassifier.predict_proba"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.models = _charger_pickle()
+
+    def _parite(self, forest, model, X):
+        self.assertTrue(np.array_equal(forest.predict_proba(X), model.predict_proba(X)))
+        self.assertTrue(np.array_equal(forest.predict(X), model.predict(X)))
+
+    def test_parite_une_ligne_et_un_lot(self):
+        for kind in ('budget', 'risk'):
+            model = self.models[f'{kind}_model']
+            forest = CompiledForest.from_sklearn(model)
+            X = self.models[f'scaler_{kind}'].transform(_lignes(self.models, kind, 200, seed=1))
+            with self.subTest(kind=kind):
+                self._parite(forest, model, X[:1])
+                # Ligne seule en 1D : même résultat qu'un lot d'une ligne
+                self.assertTrue(np.array_equal(forest.predict_proba(X[0]), model.predict_proba(X[:1])))
+                self._parite(forest, model, X)
+
+    def test_lots_au_dela_du_seuil(self):
+        model = self.models['risk_model']
+        X = self.models['scaler_risk'].transform(_lignes(self.models, 'risk', 95, seed=2))
+
+        # Avec le modèle d'origine : lot confié à scikit-learn
+        delegue = CompiledForest.from_sklearn(model, batch_threshold=10)
+        self.assertIs(delegue.fallback, model)
+        self._parite(delegue, model, X)
+
+        # Sans modèle d'origine (artefact) : lot découpé en paquets
+        decoupe = CompiledForest.from_sklearn(model)
+        decoupe.batch_threshold = 10
+        self._parite(decoupe, model, X)
+
+
+def _mises_a_jour(queries, table: str) -> int:
+    return sum(1 for q in queries if q['sql'].startswith(f'UPDATE "{table}"'))
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class CascadeEcritureTests(TestCase):
+    """Cascade tâche -> lot -> chantier -> projet : un seul passage, valeurs à jour"""
+
+    def setUp(self):
+        jour = date(2026, 1, 1)
+        self.projet = Projet.objects.create(name='P', status='Planifié')
+        self.chantier = Chantier.objects.create(
+            projet=self.projet, name='C', status='En cours', priority='Haute',
+            start_date=jour, end_date=jour, location='Lyon', manager='M',
+        )
+        self.lots = [
+            Lot.objects.create(chantier=self.chantier, name=f'L{i}', status='En attente', start_date=jour, end_date=jour)
+            for i in range(2)
+        ]
+        self.taches = [Tache.objects.create(lot=lot, name=f'T{i}', status='En attente') for lot in self.lots for i in range(2)]
+        self.client = Client()
+
+    def _patch(self, tache, donnees):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(f'/api/taches/{tache.id}/', donnees, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        # Savepoints de l'unité de travail (la transaction de test l'englobe) exclus
+        return [q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+
+    def test_statut_tache_recalcule_la_hierarchie_une_fois(self):
+        queries = self._patch(self.taches[0], {'status': 'Terminé'})
+
+        lot = Lot.objects.get(pk=self.lots[0].pk)
+        self.assertEqual((lot.progress, lot.status), (50, 'En cours'))
+        chantier = Chantier.objects.get(pk=self.chantier.pk)
+        self.assertEqual((chantier.progress, chantier.status), (25, 'En cours'))
+        self.assertEqual(Projet.objects.get(pk=self.projet.pk).status, 'En cours')
+        # Chaque parent est enregistré au plus une fois
+        for table in ('projects_lot', 'projects_chantier', 'projects_projet'):
+            self.assertLessEqual(_mises_a_jour(queries, table), 1, table)
+        self.assertLessEqual(len(queries), 33)
+
+    def test_champ_sans_effet_ne_touche_pas_les_parents(self):
+        queries = self._patch(self.taches[0], {'description': 'Détail'})
+        for table in ('projects_lot', 'projects_chantier', 'projects_projet'):
+            self.assertEqual(_mises_a_jour(queries, table), 0, table)
+        self.assertLessEqual(len(queries), 6)
+
+    def test_echec_de_la_cascade_annule_l_ecriture(self):
+        client = Client(raise_request_exception=False)
+        with mock.patch.object(Lot, 'save', side_effect=RuntimeError('disque plein')):
+            response = client.patch(f'/api/taches/{self.taches[0].id}/', {'status': 'Terminé'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 500)
+        # La tâche n'est pas enregistrée sans son lot : la hiérarchie reste cohérente
+        self.assertEqual(Tache.objects.get(pk=self.taches[0].pk).status, 'En attente')
+        self.assertEqual(Lot.objects.get(pk=self.lots[0].pk).progress, 0)
+
+    def test_deplacement_de_tache_recalcule_les_deux_lots(self):
+        Tache.objects.filter(pk=self.taches[0].pk).update(status='Terminé')
+        self._patch(self.taches[0], {'lot': str(self.lots[1].id)})
+        self.assertEqual(Lot.objects.get(pk=self.lots[0].pk).taches.count(), 1)
+        self.assertEqual(Lot.objects.get(pk=self.lots[1].pk).progress, round(100 / 3))
+        self.assertEqual(Lot.objects.get(pk=self.lots[0].pk).progress, 0)
+
+
+def _vider_caches():
+    for alias in ('default', 'shared'):
+        caches[alias].clear()
+
+
+def _entete_jwt(utilisateur, **claims):
+    """En-tête Authorization d'un jeton d'accès portant les claims émis par login"""
+    token = AccessToken()
+    token['user_id'] = str(utilisateur.id)
+    token['email'] = utilisateur.email
+    token['role'] = utilisateur.role
+    token['is_approved'] = bool(utilisateur.is_approved)
+    for nom, valeur in claims.items():
+        token[nom] = valeur
+    return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+
+@override_settings(
+    ALLOWED_HOSTS=['*'],
+    LOGIN_THROTTLE_ACCOUNT_FAILURES=3,
+    LOGIN_THROTTLE_IP_FAILURES=20,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class LimitationConnexionTests(TestCase):
+    """Connexion : verrouillage après LOGIN_THROTTLE_ACCOUNT_FAILURES échecs, remise à zéro"""
+
+    def setUp(self):
+        _vider_caches()
+        self.addCleanup(_vider_caches)
+        self.utilisateur = Utilisateur.objects.create(
+            nom='Chef', email='chef@example.com', mot_de_passe='secret-1', role='CHEF_DE_PROJET', is_approved=True,
+        )
+        self.client = Client()
+
+    def _login(self, mot_de_passe, email='chef@example.com'):
+        return self.client.post(
+            '/api/auth/login/', {'email': email, 'mot_de_passe': mot_de_passe}, content_type='application/json'
+        )
+
+    def test_verrouillage_apres_trop_d_echecs(self):
+        for _ in range(3):
+            self.assertEqual(self._login('mauvais').status_code, 401)
+        response = self._login('secret-1')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        # Le compteur est par compte : un autre compte n'est pas bloqué
+        self.assertEqual(self._login('mauvais', email='autre@example.com').status_code, 401)
+
+    def test_connexion_reussie_remet_le_compteur_a_zero(self):
+        for _ in range(2):
+            self.assertEqual(self._login('mauvais').status_code, 401)
+        self.assertEqual(self._login('secret-1').status_code, 200)
+        for _ in range(2):
+            self.assertEqual(self._login('mauvais').status_code, 401)
+        self.assertEqual(self._login('secret-1').status_code, 200)
+
+    def test_fin_de_fenetre_remet_le_compteur_a_zero(self):
+        debut = (time.time() // 300) * 300 + 10
+        with mock.patch('projects.login_security.time') as horloge:
+            horloge.time.return_value = debut
+            for _ in range(3):
+                self._login('mauvais')
+            self.assertEqual(self._login('secret-1').status_code, 429)
+            # Fenêtre suivante : nouveaux compteurs
+            horloge.time.return_value = debut + 300
+            self.assertEqual(self._login('secret-1').status_code, 200)
+
+
+@override_settings(ALLOWED_HOSTS=['*'], PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ClaimsJWTTests(TestCase):
+    """Authentification par claims : aucune lecture de l'utilisateur en lecture seule"""
+
+    def setUp(self):
+        _vider_caches()
+        self.addCleanup(_vider_caches)
+        self.utilisateur = Utilisateur.objects.create(
+            nom='MO', email='mo@example.com', mot_de_passe='secret-1', role='MAITRE_OUVRAGE', is_approved=True,
+        )
+        Projet.objects.create(name='P', status='Planifié')
+        self.client = Client()
+        response = self.client.post(
+            '/api/auth/login/', {'email': 'mo@example.com', 'mot_de_passe': 'secret-1'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {response.json()['access']}"}
+
+    def test_lecture_sans_requete_utilisateur(self):
+        table = Utilisateur._meta.db_table
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/acteurs/maitre-ouvrage/controler-projets/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if table in q['sql']])
+
+    def test_role_lu_dans_les_claims(self):
+        response = self.client.get('/api/acteurs/chef-projet/suivre-avancement/'
+                                   f'{Projet.objects.get().id}/', **self.auth)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get('/api/acteurs/maitre-ouvrage/controler-projets/').status_code, 401)
+
+    def test_verifier_compte_voit_les_changements_du_compte(self):
+        def principal():
+            # Un principal par requête, construit depuis les mêmes claims (jeton inchangé)
+            return JWTPrincipal(id=str(self.utilisateur.id), email=self.utilisateur.email,
+                                role='MAITRE_OUVRAGE', is_approved=True)
+
+        self.assertEqual(principal().verifier_compte().pk, self.utilisateur.pk)
+        self.utilisateur.role = 'MEMBRE_TECHNIQUE'
+        self.utilisateur.save()
+        self.assertIsNone(principal().verifier_compte())
+        self.utilisateur.role = 'MAITRE_OUVRAGE'
+        self.utilisateur.is_active = False
+        self.utilisateur.save()
+        self.assertIsNone(principal().verifier_compte())
+
+
+@override_settings(ALLOWED_HOSTS=['*'], PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class PermissionsRolesTests(TestCase):
+    """Permissions par rôle des endpoints d'acteurs et chargeurs 404"""
+
+    # Rôle -> (méthode, endpoint réservé dont l'objet cible est chargé par charger_*)
+    ENDPOINTS = {
+        'ADMINISTRATEUR': ('post', '/api/acteurs/admin/valider-etape/{}/'),
+        'MAITRE_OUVRAGE': ('get', '/api/acteurs/maitre-ouvrage/consulter-rapport/{}/'),
+        'CHEF_DE_PROJET': ('get', '/api/acteurs/chef-projet/suivre-avancement/{}/'),
+        'MEMBRE_TECHNIQUE': ('post', '/api/acteurs/membre-technique/executer-tache/{}/'),
+    }
+
+    def setUp(self):
+        _vider_caches()
+        self.addCleanup(_vider_caches)
+        self.utilisateurs = {
+            role: Utilisateur.objects.create(nom=role, email=f'{role.lower()}@example.com',
+                                             mot_de_passe='x', role=role, is_approved=True)
+            for role in self.ENDPOINTS
+        }
+        self.projet, self.chantier, lot = _hierarchie()
+        self.tache = Tache.objects.create(lot=lot, name='T', status='En cours')
+        self.client = Client()
+
+    def _appeler(self, role, objet_id, **entete):
+        methode, url = self.ENDPOINTS[role]
+        return getattr(self.client, methode)(url.format(objet_id), **entete)
+
+    def test_acces_selon_role_validation_et_authentification(self):
+        for role in self.ENDPOINTS:
+            with self.subTest(role=role):
+                # Rôle attendu : la permission passe, l'objet absent donne 404
+                response = self._appeler(role, uuid.uuid4(), **_entete_jwt(self.utilisateurs[role]))
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('error', response.json())
+
+                autre = next(u for r, u in self.utilisateurs.items() if r != role)
+                response = self._appeler(role, uuid.uuid4(), **_entete_jwt(autre))
+                self.assertEqual(response.status_code, 403)
+                self.assertIn('error', response.json())
+
+                # Les administrateurs n'ont pas besoin de validation
+                non_valide = _entete_jwt(self.utilisateurs[role], is_approved=False)
+                self.assertEqual(self._appeler(role, uuid.uuid4(), **non_valide).status_code,
+                                 404 if role == 'ADMINISTRATEUR' else 403)
+
+                self.assertEqual(self._appeler(role, uuid.uuid4()).status_code, 401)
+
+    def test_objet_d_un_autre_type_introuvable(self):
+        # UUID existant mais d'un autre modèle : 404, pas d'erreur serveur
+        response = self._appeler('CHEF_DE_PROJET', self.chantier.id,
+                                 **_entete_jwt(self.utilisateurs['CHEF_DE_PROJET']))
+        self.assertEqual(response.status_code, 404)
+        response = self._appeler('MEMBRE_TECHNIQUE', self.projet.id,
+                                 **_entete_jwt(self.utilisateurs['MEMBRE_TECHNIQUE']))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self._appeler('CHEF_DE_PROJET', self.projet.id,
+                                       **_entete_jwt(self.utilisateurs['CHEF_DE_PROJET'])).status_code, 200)
+
+    def test_chargeurs(self):
+        self.assertEqual(charger_tache(self.tache.id).lot.chantier.projet, self.projet)
+        chargeurs = (charger_projet, charger_chantier, charger_lot, charger_tache)
+        for chargeur in chargeurs:
+            for identifiant in (uuid.uuid4(), 'pas-un-uuid', None):
+                with self.subTest(chargeur=chargeur.__name__, identifiant=identifiant):
+                    with self.assertRaises(NotFound):
+                        chargeur(identifiant)
+
+
+class JobAnalyseTests(TestCase):
+    """Jobs d'analyse : une demande identique reprend le job existant"""
+
+    def setUp(self):
+        self.ia = IA.objects.create(modele='default')
+        self.projet = Projet.objects.create(name='P', status='Planifié')
+
+    def test_demande_identique_reprend_le_job(self):
+        job, cree = analysis_jobs.soumettre(self.ia, self.projet)
+        self.assertTrue(cree)
+        meme, cree = analysis_jobs.soumettre(self.ia, self.projet)
+        self.assertFalse(cree)
+        self.assertEqual(meme.pk, job.pk)
+
+        # Job terminé avec succès : toujours repris ; autres paramètres : nouveau job
+        AnalysisJob.objects.filter(pk=job.pk).update(status='succeeded')
+        self.assertEqual(analysis_jobs.soumettre(self.ia, self.projet)[0].pk, job.pk)
+        autre, cree = analysis_jobs.soumettre(self.ia, self.projet, explain=True)
+        self.assertTrue(cree)
+        self.assertNotEqual(autre.pk, job.pk)
+
+    def test_modification_du_projet_donne_un_nouveau_job(self):
+        job, _ = analysis_jobs.soumettre(self.ia, self.projet)
+        self.projet.status = 'En cours'
+        self.projet.save()
+        nouveau, cree = analysis_jobs.soumettre(self.ia, self.projet)
+        self.assertTrue(cree)
+        self.assertNotEqual(nouveau.pk, job.pk)
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_option_async_lue_explicitement(self):
+        url = f'/api/ia/{self.ia.id}/full_analysis/'
+        # Formulaire : la chaîne "false" ne déclenche pas le mode asynchrone
+        response = self.client.post(url, {'projet_id': str(self.projet.id), 'async': 'false', 'explain': '0'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotIn('explanation', response.json()['delay_prediction'])
+        self.assertFalse(AnalysisJob.objects.exists())
+
+        response = self.client.post(url, {'projet_id': str(self.projet.id), 'async': 'true'})
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(AnalysisJob.objects.count(), 1)
+
+    def test_job_en_echec_non_repris(self):
+        job, _ = analysis_jobs.soumettre(self.ia, self.projet)
+        AnalysisJob.objects.filter(pk=job.pk).update(status='failed')
+        nouveau, cree = analysis_jobs.soumettre(self.ia, self.projet)
+        self.assertTrue(cree)
+        self.assertNotEqual(nouveau.pk, job.pk)
+
+
+class DeduplicationAlertesTests(TestCase):
+    """Alertes IA : une seule alerte ouverte par empreinte (projet, type, niveau)"""
+
+    def setUp(self):
+        self.projet = Projet.objects.create(name='P', status='En cours')
+        self.ias = [IA.objects.create(modele='default', seuil_confiance=0.5) for _ in range(2)]
+
+    def test_generer_alertes_ignore_une_alerte_ouverte(self):
+        with mock.patch.object(IA, 'predireRisques', return_value={'global_risk_score': 0.9}):
+            premiere = self.ias[0].genererAlertes(self.projet)
+            doublon = self.ias[0].genererAlertes(self.projet)
+            self.assertTrue(premiere['created'])
+            self.assertEqual(doublon, {'created': False, 'reason': 'duplicate', 'type': 'CRITICAL', 'risk_score': 0.9})
+            self.assertEqual(Alerte.objects.count(), 1)
+
+            # Alerte close : une nouvelle alerte peut être créée
+            self.assertTrue(Alerte.objects.get().resoudre())
+            self.assertTrue(self.ias[0].genererAlertes(self.projet)['created'])
+            self.assertEqual(Alerte.objects.count(), 2)
+
+    def test_generation_en_lot_deduplique(self):
+        def scores(projet_ids, service=None, include_risk=True):
+            # Le score global ne vient que des modèles de retard et de budget
+            self.assertFalse(include_risk)
+            return [{'projet_id': pk, 'delay_score': 0.9, 'budget_score': 0.9} for pk in projet_ids]
+
+        with mock.patch('projects.portfolio.score_projets', side_effect=scores):
+            rapport = IA.genererAlertesEnLot(projets=[self.projet], ias=self.ias)
+            # Deux IA, même empreinte : une seule alerte
+            self.assertEqual(rapport['created'], 1)
+            self.assertEqual(rapport['suppressed'], 1)
+
+            # Deuxième passage : l'alerte ouverte écarte aussi le premier candidat
+            rapport = IA.genererAlertesEnLot(projets=[self.projet], ias=self.ias)
+            self.assertEqual(rapport['created'], 0)
+            self.assertEqual(rapport['suppressed'], 2)
+        self.assertEqual(Alerte.objects.filter(projet=self.projet).count(), 1)
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_resolution_par_l_api(self):
+        membre = Utilisateur.objects.create(nom='M', email='m@example.com', mot_de_passe='x',
+                                            role='MEMBRE_TECHNIQUE', is_approved=True)
+        alerte = Alerte.objects.create(type='WARNING', description='d', projet=self.projet)
+        url = f'/api/alertes/{alerte.id}/resoudre/'
+        self.assertEqual(self.client.post(url).status_code, 401)
+
+        response = self.client.post(url, **_entete_jwt(membre))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['statut'], 'RESOLUE')
+        self.assertEqual(self.client.post(url, **_entete_jwt(membre)).status_code, 400)
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_generation_en_lot_reservee_aux_administrateurs(self):
+        admin = Utilisateur.objects.create(nom='A', email='a@example.com', mot_de_passe='x',
+                                           role='ADMINISTRATEUR', is_approved=True)
+        chef = Utilisateur.objects.create(nom='C', email='c@example.com', mot_de_passe='x',
+                                          role='CHEF_DE_PROJET', is_approved=True)
+        url = '/api/ia/generer_alertes/'
+        self.assertEqual(self.client.post(url).status_code, 401)
+        self.assertEqual(self.client.post(url, **_entete_jwt(chef)).status_code, 403)
+        with mock.patch.object(IA, 'genererAlertesEnLot', return_value={'created': 0}) as generer:
+            response = self.client.post(url, **_entete_jwt(admin))
+        self.assertEqual(response.status_code, 200, response.content)
+        generer.assert_called_once()
+
+
+class MetriquesMLTests(TestCase):
+    """Métriques d'inférence : une prédiction demandée = un compteur et une durée totale"""
+
+    def setUp(self):
+        ml_metrics.reset()
+        self.addCleanup(ml_metrics.reset)
+        self.projet = Projet.objects.create(name='P', status='En cours')
+
+    def test_fallback_de_predict_risk_compte_une_seule_prediction(self):
+        # Sans modèle : predict_risk combine predict_delay_risk et predict_budget_overrun
+        resultat = ml_service.predict_risk(self.projet, bundle=ModelBundle())
+        self.assertEqual(resultat['model_used'], 'statistical')
+
+        snapshot = ml_metrics.snapshot()
+        self.assertEqual(snapshot['predictions'], {
+            'risk': {'total': 1, 'outcomes': {'statistical': 1}, 'fallback_rate': 1.0},
+        })
+        self.assertEqual(snapshot['timings_ms']['total']['count'], 1)
+        self.assertEqual(snapshot['timings_ms']['snapshot']['count'], 1)
+
+    def test_appels_successifs_comptes_separement(self):
+        ml_service.predict_delay_risk(self.projet, bundle=ModelBundle())
+        ml_service.predict_risk(self.projet, bundle=ModelBundle())
+        snapshot = ml_metrics.snapshot()
+        self.assertEqual(snapshot['predictions']['delay']['total'], 1)
+        self.assertEqual(snapshot['predictions']['risk']['total'], 1)
+        self.assertEqual(snapshot['timings_ms']['total']['count'], 2)
+
+
+class ScorePortfolioTests(TestCase):
+    """Instantanés de risque : datés du jour du scoring uniquement"""
+
+    def test_date_passee_refusee(self):
+        Projet.objects.create(name='P', status='En cours')
+        hier = (date.today() - timedelta(days=1)).isoformat()
+        with self.assertRaises(CommandError):
+            call_command('score_portfolio', date=hier, workers=1)
+        self.assertFalse(RiskSnapshot.objects.exists())
+
+
+def _hierarchie(nom='P', jour=date(2026, 1, 1), **projet):
+    """Projet avec un chantier et un lot (dates `jour`)"""
+    projet = Projet.objects.create(name=nom, status='En cours', **projet)
+    chantier = Chantier.objects.create(
+        projet=projet, name=f'{nom}-C', status='En cours', priority='Haute',
+        start_date=jour, end_date=jour, location='Lyon', manager='M',
+    )
+    lot = Lot.objects.create(chantier=chantier, name=f'{nom}-L', status='En cours', start_date=jour, end_date=jour)
+    return projet, chantier, lot
+
+
+class SimulationAchevementTests(TestCase):
+    """Monte Carlo de la date d'achèvement : reproductibilité, loi ajustée, bornes"""
+
+    AUJOURD_HUI = date(2026, 3, 1)
+
+    def _terminees(self, lot, n, duree_reelle):
+        """n tâches terminées prévues sur 10 jours, terminées après `duree_reelle` jours"""
+        debut = date(2026, 1, 1)
+        for i in range(n):
+            tache = Tache.objects.create(lot=lot, name=f'Fait {i}', status='Terminé', progress=100,
+                                         start_date=debut, end_date=debut + timedelta(days=10))
+            fin = timezone.make_aware(datetime.combine(debut + timedelta(days=duree_reelle + i), datetime.min.time()))
+            Tache.objects.filter(pk=tache.pk).update(updated_at=fin)
+
+    def _restantes(self, lot, n):
+        for i in range(n):
+            Tache.objects.create(lot=lot, name=f'Reste {i}', status='En cours', progress=50,
+                                 start_date=self.AUJOURD_HUI, end_date=self.AUJOURD_HUI + timedelta(days=10 + i))
+
+    def _simuler(self, projet, **kwargs):
+        kwargs.setdefault('iterations', 2000)
+        return simulate_completion(projet, today=self.AUJOURD_HUI, **kwargs)
+
+    def test_meme_graine_meme_resultat(self):
+        projet, _, lot = _hierarchie(end_date=date(2026, 3, 15))
+        self._terminees(lot, MIN_HISTORY + 1, duree_reelle=12)
+        self._restantes(lot, 3)
+
+        premier = self._simuler(projet, seed=42)
+        second = self._simuler(projet, seed=42)
+        self.assertEqual(premier['percentiles'], second['percentiles'])
+        self.assertEqual(premier['histogram'], second['histogram'])
+        self.assertEqual(premier['distribution']['source'], 'projet')
+        self.assertEqual(premier['distribution']['n_samples'], MIN_HISTORY + 1)
+        self.assertEqual(premier['remaining_tasks'], 3)
+
+        p = premier['percentiles']
+        self.assertLessEqual(date.fromisoformat(p['p50']), date.fromisoformat(p['p80']))
+        self.assertLessEqual(date.fromisoformat(p['p80']), date.fromisoformat(p['p95']))
+        self.assertEqual(sum(premier['histogram']['counts']), 2000)
+        self.assertTrue(0 <= premier['probability_on_time'] <= 1)
+
+    def test_historique_du_portefeuille_puis_loi_par_defaut(self):
+        projet, _, lot = _hierarchie('Sans historique')
+        self._restantes(lot, 2)
+        self.assertEqual(self._simuler(projet, seed=1)['distribution']['source'], 'défaut')
+
+        # Moins de MIN_HISTORY tâches terminées dans le projet : historique du portefeuille
+        self._terminees(lot, 1, duree_reelle=15)
+        _, _, autre_lot = _hierarchie('Historique')
+        self._terminees(autre_lot, MIN_HISTORY, duree_reelle=12)
+        distribution = self._simuler(projet, seed=1)['distribution']
+        self.assertEqual(distribution['source'], 'portefeuille')
+        self.assertEqual(distribution['n_samples'], MIN_HISTORY + 1)
+        self.assertGreater(distribution['mu'], 0)
+
+    def test_bornes_des_parametres(self):
+        projet, _, _ = _hierarchie()
+        for kwargs in ({'iterations': 0}, {'iterations': MAX_ITERATIONS + 1}, {'bins': 0}, {'bins': 201},
+                       {'correlation': -0.1}, {'correlation': 1.1}):
+            with self.subTest(**kwargs), self.assertRaises(ValueError):
+                self._simuler(projet, **kwargs)
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class CheminCritiqueTests(TestCase):
+    """Chemin critique (CPM) : dates calculées à la main, cycles, recalcul incrémental"""
+
+    def setUp(self):
+        schedule_cache.invalider()
+        self.addCleanup(schedule_cache.invalider)
+        self.projet, _, lot = _hierarchie()
+        jour = date(2026, 1, 1)
+        # Durées : A 4 j, B 2 j, C 3 j, D 1 j ; liens A -> C, B -> C (+1 j), C -> D
+        self.taches = {
+            nom: Tache.objects.create(lot=lot, name=nom, status='En attente',
+                                      start_date=jour, end_date=jour + timedelta(days=duree))
+            for nom, duree in (('A', 4), ('B', 2), ('C', 3), ('D', 1))
+        }
+        for predecesseur, successeur, decalage in (('A', 'C', 0), ('B', 'C', 1), ('C', 'D', 0)):
+            TacheDependance.objects.create(predecesseur=self.taches[predecesseur],
+                                           successeur=self.taches[successeur], decalage=decalage)
+
+    def _par_nom(self, resultat):
+        return {tache['name']: tache for tache in resultat['tasks']}
+
+    def test_dates_et_marges_calculees_a_la_main(self):
+        response = self.client.get(f'/api/projets/{self.projet.id}/critical-path/')
+        self.assertEqual(response.status_code, 200, response.content)
+        resultat = response.json()
+        attendu = {
+            # nom: (début tôt, fin tôt, début tard, fin tard, marge)
+            'A': ('2026-01-01', '2026-01-05', '2026-01-01', '2026-01-05', 0),
+            'B': ('2026-01-01', '2026-01-03', '2026-01-02', '2026-01-04', 1),
+            'C': ('2026-01-05', '2026-01-08', '2026-01-05', '2026-01-08', 0),
+            'D': ('2026-01-08', '2026-01-09', '2026-01-08', '2026-01-09', 0),
+        }
+        for nom, tache in self._par_nom(resultat).items():
+            obtenu = (tache['early_start'], tache['early_finish'], tache['late_start'], tache['late_finish'], tache['slack'])
+            self.assertEqual(obtenu, attendu[nom], nom)
+        self.assertEqual(resultat['critical_path'], [str(self.taches[nom].id) for nom in 'ACD'])
+        self.assertEqual(resultat['finish_date'], '2026-01-09')
+        self.assertEqual(resultat['duration'], 8)
+        self.assertEqual(resultat['dependency_count'], 3)
+
+    def test_dependance_circulaire_refusee(self):
+        response = self.client.post('/api/dependances/', {
+            'predecesseur': str(self.taches['D'].id), 'successeur': str(self.taches['A'].id),
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('predecesseur', response.json())
+        self.assertEqual(TacheDependance.objects.count(), 3)
+
+    def test_cycle_en_base_signale(self):
+        # Cycle écrit sans passer par l'API : le calcul répond 409 avec les tâches en cause
+        TacheDependance.objects.create(predecesseur=self.taches['D'], successeur=self.taches['A'])
+        response = self.client.get(f'/api/projets/{self.projet.id}/critical-path/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(set(response.json()['task_ids']), {str(self.taches[nom].id) for nom in 'ACD'})
+
+    def _complet(self):
+        rows, edges = _charger(self.projet.pk)
+        return ProjectSchedule(rows, edges).resultat()
+
+    def _comparer_au_calcul_complet(self, resultat):
+        complet = self._complet()
+        for cle in ('tasks', 'critical_path', 'finish_date', 'duration'):
+            self.assertEqual(resultat[cle], complet[cle], cle)
+
+    def test_recalcul_incremental_identique_au_calcul_complet(self):
+        self.assertEqual(compute_critical_path(self.projet)['computation']['mode'], 'full')
+
+        # B s'allonge de 3 jours : il devient critique et décale C et D
+        tache = self.taches['B']
+        tache.end_date = tache.start_date + timedelta(days=5)
+        tache.save()
+        resultat = compute_critical_path(self.projet)
+        self.assertEqual(resultat['computation']['mode'], 'incremental')
+        self._comparer_au_calcul_complet(resultat)
+        self.assertEqual(resultat['critical_path'], [str(self.taches[nom].id) for nom in 'BCD'])
+
+        # A raccourcit sans changer la fin du projet : seule une partie est recalculée
+        tache = self.taches['A']
+        tache.end_date = tache.start_date + timedelta(days=2)
+        tache.save()
+        resultat = compute_critical_path(self.projet)
+        self.assertEqual(resultat['computation']['mode'], 'incremental')
+        self._comparer_au_calcul_complet(resultat)
+
+        # Nouvelle dépendance : graphe reconstruit
+        TacheDependance.objects.create(predecesseur=self.taches['A'], successeur=self.taches['B'])
+        resultat = compute_critical_path(self.projet)
+        self.assertEqual(resultat['computation']['mode'], 'full')
+        self._comparer_au_calcul_complet(resultat)
+        self.assertEqual(self._par_nom(resultat)['B']['early_start'], '2026-01-03')
+
+
+class SuiviModificationsTests(TestCase):
+    """SuiviModificationsMixin et recalcul en cascade limité aux champs utiles de la tâche"""
+
+    def setUp(self):
+        self.projet, self.chantier, self.lot = _hierarchie()
+        self.autre_lot = Lot.objects.create(chantier=self.chantier, name='L2', status='En cours',
+                                            start_date=date(2026, 1, 1), end_date=date(2026, 1, 1))
+        self.tache = Tache.objects.create(lot=self.lot, name='T', status='En attente', description='avant')
+
+    def test_instance_chargee_puis_enregistree(self):
+        tache = Tache(lot=self.lot, name='Nouvelle', status='En attente')
+        self.assertIn('status', tache.champs_modifies())
+
+        tache = Tache.objects.get(pk=self.tache.pk)
+        self.assertEqual(tache.champs_modifies(), set())
+        tache.description = 'après'
+        tache.progress = 0.0
+        self.assertEqual(tache.champs_modifies(), {'description'})
+
+        tache.save()
+        self.assertTrue(tache.a_change('description'))
+        self.assertFalse(tache.a_change('status', 'progress'))
+        self.assertEqual(tache.valeur_precedente('description'), 'avant')
+        self.assertEqual(tache.champs_modifies(), set())
+
+    def test_enregistrement_avec_update_fields(self):
+        tache = Tache.objects.get(pk=self.tache.pk)
+        tache.status = 'Terminé'
+        tache.description = 'non enregistrée'
+        tache.save(update_fields=['status', 'updated_at'])
+        self.assertEqual(tache.champs_enregistres, {'status'})
+        self.assertEqual(tache.valeur_precedente('status'), 'En attente')
+        # Le champ non enregistré reste modifié en mémoire
+        self.assertEqual(tache.champs_modifies(), {'description'})
+
+    def test_valeur_entiere_comparee_comme_en_base(self):
+        lot = Lot.objects.get(pk=self.lot.pk)
+        lot.progress = float(lot.progress)
+        self.assertEqual(lot.champs_modifies(), set())
+
+    def _enregistrer(self, **valeurs):
+        tache = Tache.objects.get(pk=self.tache.pk)
+        for champ, valeur in valeurs.items():
+            setattr(tache, champ, valeur)
+        with mock.patch('projects.models._mettre_a_jour_lot_et_hierarchie') as cascade:
+            tache.save()
+        return [appel.args[0].pk for appel in cascade.call_args_list]
+
+    def test_cascade_selon_les_champs_modifies(self):
+        self.assertEqual(self._enregistrer(description='x', assigned_to='bob'), [])
+        self.assertEqual(self._enregistrer(cost=Decimal('1200.00')), [self.lot.pk])
+        self.assertEqual(self._enregistrer(status='En cours'), [self.lot.pk])
+        # Tâche déplacée : nouveau lot puis ancien lot
+        self.assertEqual(self._enregistrer(lot=self.autre_lot), [self.autre_lot.pk, self.lot.pk])
+
+    def test_deplacement_recalcule_les_deux_lots(self):
+        Tache.objects.create(lot=self.lot, name='T2', status='En attente')
+        tache = Tache.objects.get(pk=self.tache.pk)
+        tache.status = 'Terminé'
+        tache.save()
+        self.assertEqual(Lot.objects.get(pk=self.lot.pk).progress, 50)
+
+        tache.lot = self.autre_lot
+        tache.save()
+        self.assertEqual(Lot.objects.get(pk=self.autre_lot.pk).progress, 100)
+        self.assertEqual(Lot.objects.get(pk=self.lot.pk).progress, 0)
+        # Le chantier suit ses deux lots
+        self.assertEqual(Chantier.objects.get(pk=self.chantier.pk).progress, 50)
+
+
+class FeatureStoreTests(TestCase):
+    """Ligne ProjetFeatures tenue par deltas : toujours égale à un recalcul complet"""
+
+    def setUp(self):
+        self.projet, self.chantier, self.lot = _hierarchie('A')
+        self.autre_projet, self.autre_chantier, self.autre_lot = _hierarchie('B')
+        self._verifier()
+
+    def _verifier(self):
+        attendu = calculer_features([self.projet.id, self.autre_projet.id])
+        stocke = {
+            ligne['projet_id']: ligne
+            for ligne in ProjetFeatures.objects.values('projet_id', *FEATURE_FIELDS)
+        }
+        for projet_id, valeurs in attendu.items():
+            for champ, valeur in valeurs.items():
+                self.assertEqual(stocke[projet_id][champ], valeur, f'{champ} du projet {projet_id}')
+
+    def _modifier(self, objet, **valeurs):
+        objet = type(objet).objects.get(pk=objet.pk)
+        for champ, valeur in valeurs.items():
+            setattr(objet, champ, valeur)
+        objet.save()
+        self._verifier()
+        return objet
+
+    def _chantier(self, nom, **valeurs):
+        return Chantier.objects.create(projet=self.projet, name=nom, status='En cours', priority='Basse',
+                                       start_date=date(2026, 1, 1), end_date=date(2026, 1, 1),
+                                       location='Lyon', manager='M', **valeurs)
+
+    def test_sequence_de_modifications(self):
+        hier = date.today() - timedelta(days=1)
+        tache = Tache.objects.create(lot=self.lot, name='T1', status='En cours', end_date=hier)
+        self._verifier()
+        Tache.objects.create(lot=self.lot, name='T2', status='Terminé', end_date=hier)
+        self._verifier()
+
+        # Tâches : statut, échéance, déplacement dans le projet puis vers l'autre projet
+        tache = self._modifier(tache, status='Terminé')
+        tache = self._modifier(tache, status='En cours', end_date=date.today() + timedelta(days=5))
+        lot_2 = Lot.objects.create(chantier=self.chantier, name='A-L2', status='En cours', progress=40,
+                                   start_date=date(2026, 1, 1), end_date=date(2026, 1, 1))
+        self._verifier()
+        tache = self._modifier(tache, lot=lot_2)
+        tache = self._modifier(tache, lot=self.autre_lot, end_date=hier)
+
+        # Lots : progress d'un lot sans tâche, déplacement dans le projet puis vers l'autre projet
+        lot_2 = self._modifier(lot_2, progress=80)
+        chantier_2 = self._chantier('A-C2', progress=20, budget_used=Decimal('500'))
+        self._verifier()
+        lot_2 = self._modifier(lot_2, chantier=chantier_2)
+        self._modifier(self.lot, chantier=self.autre_chantier)
+        self._modifier(self.lot, chantier=self.chantier)
+
+        # Chantiers : budget, progress d'un chantier sans lot, déplacement vers l'autre projet
+        chantier_3 = self._chantier('A-C3', progress=10)
+        self._verifier()
+        chantier_3 = self._modifier(chantier_3, progress=90, budget_used=Decimal('1200.50'))
+        self._modifier(chantier_2, projet=self.autre_projet)
+
+        # Suppressions : tâche, lot (avec ses tâches), chantier (avec ses lots)
+        Tache.objects.get(pk=tache.pk).delete()
+        self._verifier()
+        Lot.objects.get(pk=self.lot.pk).delete()
+        self._verifier()
+        Chantier.objects.get(pk=chantier_2.pk).delete()
+        self._verifier()
+        Chantier.objects.get(pk=chantier_3.pk).delete()
+        self._verifier()
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class ValeurAcquiseTests(TestCase):
+    """EVM calculée à la main au 11/03/2026, par chantier, par projet et pour le portefeuille"""
+
+    AUJOURD_HUI = date(2026, 3, 11)
+
+    def setUp(self):
+        self.projet, self.chantier, lot = _hierarchie('P', jour=date(2026, 3, 1))
+        lot.end_date = date(2026, 3, 21)
+        lot.save()
+        # PV : 1 (terminée le 5), 0.5 (10 jours sur 20, JoursEntre), 0 (pas commencée), 0.5 (dates du lot)
+        self._tache(lot, 'T1', 1000, 'Terminé', 100, date(2026, 3, 1), date(2026, 3, 5))
+        self._tache(lot, 'T2', 2000, 'En cours', 30, date(2026, 3, 1), date(2026, 3, 21))
+        self._tache(lot, 'T3', 500, 'En attente', 0, date(2026, 3, 20), date(2026, 3, 30))
+        self._tache(lot, 'T4', 1000, 'En cours', 50, None, None)
+
+        # Tâches sans coût : budget du chantier (1200) réparti entre les 3 tâches
+        self.chantier_budget = Chantier.objects.create(
+            projet=self.projet, name='P-C2', status='En cours', priority='Basse', budget=Decimal('1200'),
+            start_date=date(2026, 3, 1), end_date=date(2026, 3, 31), location='Lyon', manager='M',
+        )
+        lot_budget = Lot.objects.create(chantier=self.chantier_budget, name='P-L2', status='En cours',
+                                        start_date=date(2026, 3, 1), end_date=date(2026, 3, 31))
+        self._tache(lot_budget, 'U1', 0, 'Terminé', 100, date(2026, 3, 1), date(2026, 3, 5))
+        self._tache(lot_budget, 'U2', 0, 'En cours', 40, date(2026, 3, 9), date(2026, 3, 13))
+        self._tache(lot_budget, 'U3', 0, 'En attente', 0, date(2026, 3, 15), date(2026, 3, 25))
+
+        self.autre_projet, autre_chantier, autre_lot = _hierarchie('Q', jour=date(2026, 3, 1))
+        self._tache(autre_lot, 'V1', 800, 'Terminé', 100, date(2026, 3, 1), date(2026, 3, 5))
+
+        # AC saisi sur les chantiers
+        for chantier, consomme in ((self.chantier, 600), (self.chantier_budget, 300), (autre_chantier, 1000)):
+            Chantier.objects.filter(pk=chantier.pk).update(budget_used=Decimal(consomme))
+
+    def _tache(self, lot, nom, cout, statut, avancement, debut, fin):
+        Tache.objects.create(lot=lot, name=nom, cost=Decimal(cout), status=statut, progress=avancement,
+                             start_date=debut, end_date=fin)
+
+    def _verifier(self, resultat, attendu):
+        for champ, valeur in attendu.items():
+            self.assertEqual(resultat[champ], valeur, champ)
+
+    def _chantiers(self, projet):
+        return {entree['name']: entree for entree in projet['chantiers']}
+
+    def test_regle_0_100(self):
+        resultat = calculer_evm(today=self.AUJOURD_HUI)
+        projets = {projet['name']: projet for projet in resultat['projects']}
+        chantiers = self._chantiers(projets['P'])
+
+        self._verifier(chantiers['P-C'], {
+            'basis': 'task_cost', 'task_count': 4, 'bac': 4500, 'pv': 2500, 'ev': 1000, 'ac': 600,
+            'spi': 0.4, 'cpi': 1.6667, 'eac': 2700, 'vac': 1800,
+        })
+        self._verifier(chantiers['P-C2'], {
+            'basis': 'chantier_budget', 'task_count': 3, 'bac': 1200, 'pv': 600, 'ev': 400, 'ac': 300,
+            'spi': 0.6667, 'cpi': 1.3333, 'eac': 900, 'vac': 300,
+        })
+        self._verifier(projets['P'], {
+            'bac': 5700, 'pv': 3100, 'ev': 1400, 'ac': 900,
+            'spi': 0.4516, 'cpi': 1.5556, 'eac': 3664.29, 'vac': 2035.71,
+        })
+        self._verifier(resultat['portfolio'], {
+            'project_count': 2, 'bac': 6500, 'pv': 3900, 'ev': 2200, 'ac': 1900,
+            'spi': 0.5641, 'cpi': 1.1579, 'eac': 5613.64, 'vac': 886.36,
+        })
+
+    def test_avancement_declare(self):
+        resultat = evm_projet(self.projet, today=self.AUJOURD_HUI, ev_method=EV_AVANCEMENT)
+        chantiers = self._chantiers(resultat)
+        # EV : 1000 + 30 % de 2000 + 0 + 50 % de 1000
+        self._verifier(chantiers['P-C'], {
+            'ev': 2100, 'spi': 0.84, 'cpi': 3.5, 'eac': 1285.71, 'vac': 3214.29,
+        })
+        # EV : (1 + 0.4 + 0) / 3 du budget
+        self._verifier(chantiers['P-C2'], {
+            'ev': 560, 'spi': 0.9333, 'cpi': 1.8667, 'eac': 642.86, 'vac': 557.14,
+        })
+        self._verifier(resultat, {
+            'ev_method': EV_AVANCEMENT, 'bac': 5700, 'pv': 3100, 'ev': 2660, 'ac': 900,
+            'spi': 0.8581, 'cpi': 2.9556, 'eac': 1928.57, 'vac': 3771.43,
+        })
+        self._verifier(evm_chantier(self.chantier_budget, today=self.AUJOURD_HUI, ev_method=EV_AVANCEMENT),
+                       {'ev': 560, 'projet_id': str(self.projet.id)})
+
+    def test_endpoints(self):
+        client = Client()
+        response = client.get('/api/projets/evm/', {'date': '2026-03-11', 'ev_method': EV_AVANCEMENT})
+        self.assertEqual(response.status_code, 200)
+        self._verifier(response.json()['portfolio'], {'ev': 3460, 'pv': 3900})
+        response = client.get(f'/api/chantiers/{self.chantier.id}/evm/', {'date': '2026-03-11'})
+        self.assertEqual(response.status_code, 200)
+        self._verifier(response.json(), {'pv': 2500, 'ev': 1000, 'ev_method': EV_TERMINEES})
+        self.assertEqual(client.get('/api/projets/evm/', {'date': '11/03/2026'}).status_code, 400)
+        self.assertEqual(client.get('/api/projets/evm/', {'ev_method': 'earned'}).status_code, 400)
+
+
+class DonneesEntrainementTests(TestCase):
+    """Entraînement sur l'instantané pris en cours de projet, cibles issues du résultat réel"""
+
+    AGREGATS = {'nb_chantiers': 1, 'nb_taches': 10, 'nb_taches_terminees': 4, 'nb_taches_en_retard': 2,
+                'budget_utilise': 400.0, 'avancement': 40.0}
+
+    def _termine(self, nom, budget, fin_reelle, consomme):
+        projet = Projet.objects.create(name=nom, status='Terminé', budget=Decimal(budget), priority='Haute',
+                                       start_date=date(2025, 1, 1), end_date=date(2025, 6, 30),
+                                       date_fin_reelle=fin_reelle)
+        Chantier.objects.create(projet=projet, name=f'{nom}-C', status='Terminé', priority='Haute',
+                                budget_used=Decimal(consomme), start_date=date(2025, 1, 1),
+                                end_date=date(2025, 6, 30), location='Lyon', manager='M')
+        return projet
+
+    def _instantane(self, projet, jour, **agregats):
+        RiskSnapshot.objects.create(projet=projet, date=jour, delay_score=0, budget_score=0, risk_score=0,
+                                    risk_level='low', features=dict(self.AGREGATS, **agregats))
+
+    def _ligne(self, projet, jour, agregats):
+        features = compute_ml_features(projet, ProjectAggregates(**agregats), today=jour)
+        return tuple(features[nom] for nom in ML_FEATURE_NAMES)
+
+    def test_instantane_en_cours_et_resultat_reel(self):
+        # En retard de 20 jours et en dépassement : l'instantané postérieur à la fin est écarté
+        en_retard = self._termine('Retard', 1000, date(2025, 7, 20), 1500)
+        self._instantane(en_retard, date(2025, 3, 1), avancement=20.0)
+        self._instantane(en_retard, date(2025, 5, 1))
+        self._instantane(en_retard, date(2025, 7, 25), avancement=100.0, nb_taches_terminees=10)
+        # Terminé en avance et sous le budget
+        a_l_heure = self._termine('Heure', 5000, date(2025, 6, 20), 1000)
+        self._instantane(a_l_heure, date(2025, 4, 1), nb_taches_en_retard=0)
+        # Seul instantané pris après la fin réelle : ignoré
+        sans_en_cours = self._termine('Apres', 1000, date(2025, 6, 30), 2000)
+        self._instantane(sans_en_cours, date(2025, 7, 1))
+        # Projet en cours : hors entraînement
+        self._instantane(Projet.objects.create(name='En cours', status='En cours'), date(2025, 5, 1))
+
+        with self.assertLogs('projects.ml_training', 'INFO') as logs:
+            data = load_training_data(chunk_size=2)
+        self.assertIn('1 projets terminés sans instantané', logs.output[0])
+        self.assertEqual(data.size, 2)
+        lignes = {
+            tuple(x): (delai, depassement, risque)
+            for x, delai, depassement, risque in zip(data.X.tolist(), data.days_delay, data.budget_overrun, data.risk)
+        }
+        self.assertEqual(lignes, {
+            self._ligne(en_retard, date(2025, 5, 1), self.AGREGATS): (20, 1, 2),
+            self._ligne(a_l_heure, date(2025, 4, 1), dict(self.AGREGATS, nb_taches_en_retard=0)): (0, 0, 1),
+        })
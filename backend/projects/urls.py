@@ -5,6 +5,7 @@ from .views import (
     ChantierViewSet,
     LotViewSet,
     TacheViewSet,
+    TacheDependanceViewSet,
     UtilisateurViewSet,
     IAViewSet,
     AlerteViewSet,
@@ -46,6 +47,7 @@ router.register(r'projets', ProjetViewSet, basename='projet')
 router.register(r'chantiers', ChantierViewSet, basename='chantier')
 router.register(r'lots', LotViewSet, basename='lot')
 router.register(r'taches', TacheViewSet, basename='tache')
+router.register(r'dependances', TacheDependanceViewSet, basename='tachedependance')
 router.register(r'utilisateurs', UtilisateurViewSet, basename='utilisateur')
 router.register(r'ia', IAViewSet, basename='ia')
 router.register(r'alertes', AlerteViewSet, basename='alerte')
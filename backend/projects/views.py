@@ -1,12 +1,13 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db.models import Q
+from django.db.models import Q, OuterRef, Subquery
 from django.conf import settings
+import hmac
 import logging
-from django.contrib.auth import authenticate, get_user_model
 
 logger = logging.getLogger(__name__)
 DEBUG = getattr(settings, 'DEBUG', False)
@@ -15,6 +16,7 @@ from .models import (
     Chantier,
     Lot,
     Tache,
+    TacheDependance,
     Utilisateur,
     IA,
     Alerte,
@@ -25,12 +27,16 @@ from .models import (
     RessourceMaterielle,
     Fournisseur,
     ContactMessage,
+    RiskSnapshot,
+    CHAMPS_CASCADE_CHANTIER,
+    CHAMPS_CASCADE_LOT,
 )
 from .serializers import (
     ProjetSerializer,
     ChantierSerializer,
     LotSerializer,
     TacheSerializer,
+    TacheDependanceSerializer,
     UtilisateurSerializer,
     RegisterSerializer,
     LoginSerializer,
@@ -44,7 +50,20 @@ from .serializers import (
     RessourceMaterielleSerializer,
     FournisseurSerializer,
     ContactMessageSerializer,
+    RiskSnapshotSerializer,
+    AnalysisJobSerializer,
 )
+from .ml_deadline import parse_latency_budget, predict_within
+from .ml_simulation import DEFAULT_BINS, DEFAULT_CORRELATION, DEFAULT_ITERATIONS, simulate_completion
+from .ml_whatif import parse_axis, what_if
+from . import login_security
+from .authentication import JWTPrincipal
+from .permissions import EstAdministrateur
+from .analysis_jobs import analyse_complete, lire as lire_job, soumettre as soumettre_job
+from .identity_map import unite_de_travail
+from .evm import METHODES_EV, calculer_evm, evm_chantier, evm_projet, parse_date, parse_ev_method
+from .scheduling import CycleError, compute_critical_path
+from .singleflight import singleflight
 
 
 class BaseViewSet(viewsets.ModelViewSet):
@@ -52,29 +71,39 @@ class BaseViewSet(viewsets.ModelViewSet):
 
 
 def get_user_from_request(request):
-    """Extrait l'utilisateur depuis le token JWT"""
-    try:
-        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-        if not auth_header.startswith('Bearer '):
-            return None
-        
-        from rest_framework_simplejwt.tokens import UntypedToken
-        from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-        from django.conf import settings
-        
-        token = auth_header.split(' ')[1]
-        try:
-            validated_token = UntypedToken(token)
-            user_id = validated_token.get('user_id')
-            if user_id:
-                return Utilisateur.objects.get(id=user_id)
-        except (InvalidToken, TokenError, Utilisateur.DoesNotExist):
-            pass
-    except Exception:
-        pass
+    """
+    Utilisateur authentifié (JWTPrincipal construit depuis les claims du jeton par
+    JWTPrincipalAuthentication, sans requête en base), ou None
+    """
+    user = getattr(request, 'user', None)
+    if isinstance(user, JWTPrincipal):
+        return user
     return None
 
 
+def parse_flag(value) -> bool:
+    """Option booléenne d'une requête (JSON, formulaire ou query string) : "false", "0" ou "" valent False"""
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _synchroniser_projet(carte, projet) -> None:
+    """Statut du projet recalculé depuis ses chantiers (instances de la carte d'identité)"""
+    if projet:
+        carte.enfants(projet, 'chantiers')
+        projet.status = projet.synchroniser_statut()
+        carte.marquer(projet, 'status')
+
+
+def _synchroniser_chantier(carte, chantier) -> None:
+    """Avancement et statut du chantier depuis ses lots, puis statut du projet"""
+    if chantier:
+        carte.enfants(chantier, 'lots')
+        chantier.progress = chantier.calculer_avancement()
+        chantier.status = chantier.synchroniser_statut()
+        carte.marquer(chantier, 'progress', 'status')
+        _synchroniser_projet(carte, carte.parent(chantier, 'projet'))
+
+
 class ProjetViewSet(BaseViewSet):
     serializer_class = ProjetSerializer
     
@@ -134,13 +163,104 @@ class ProjetViewSet(BaseViewSet):
             # Si pas de chantiers, statut par défaut selon l'état initial
             if not projet.status or projet.status == 'En cours':
                 projet.status = 'Planifié'
-                projet.save()
+                projet.save(update_fields=['status', 'updated_at'])
 
     def perform_update(self, serializer):
-        projet = serializer.save()
-        # Synchronise le statut lors de la mise à jour
-        projet.status = projet.synchroniser_statut()
-        projet.save()
+        with unite_de_travail() as carte:
+            projet = carte.ajouter(serializer.save(), remplacer=True)
+            # Le statut d'un projet suit ses chantiers : resynchronisé seulement s'il a été modifié
+            if projet.a_change('status'):
+                _synchroniser_projet(carte, projet)
+
+    @action(detail=True, methods=['get'], url_path='risk-history')
+    def risk_history(self, request, pk=None):
+        """Historique des instantanés de risque d'un projet (sans appel au modèle)"""
+        projet = self.get_object()
+        snapshots = RiskSnapshot.objects.filter(projet=projet).order_by('date')
+        try:
+            days = int(request.query_params.get('days', 0))
+        except ValueError:
+            return Response({'error': 'days doit être un entier'}, status=status.HTTP_400_BAD_REQUEST)
+        if days > 0:
+            from datetime import date, timedelta
+            snapshots = snapshots.filter(date__gte=date.today() - timedelta(days=days))
+        history = list(snapshots.values(
+            'date', 'delay_score', 'days_delay', 'budget_score', 'risk_score', 'risk_level', 'model_version'
+        ))
+        return Response({
+            'projet_id': str(projet.id),
+            'projet_name': projet.name,
+            'history': history,
+            'count': len(history),
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='critical-path')
+    def critical_path(self, request, pk=None):
+        """Dates au plus tôt / au plus tard, marges et chemin critique des tâches du projet"""
+        projet = self.get_object()
+        critical_only = parse_flag(request.query_params.get('critical_only'))
+        try:
+            return Response(compute_critical_path(projet, critical_only=critical_only), status=status.HTTP_200_OK)
+        except CycleError as e:
+            return Response({
+                'error': str(e),
+                'task_ids': [str(task_id) for task_id in e.task_ids],
+            }, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            import traceback
+            logger.error(f"Erreur lors du calcul du chemin critique: {str(e)}")
+            logger.error(traceback.format_exc())
+            return Response({
+                'error': 'Erreur lors du calcul du chemin critique',
+                'detail': str(e) if DEBUG else None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=True, methods=['get'], url_path='evm')
+    def evm(self, request, pk=None):
+        """Indicateurs de la valeur acquise (PV, EV, AC, SPI, CPI, EAC, VAC) du projet et de ses chantiers"""
+        projet = self.get_object()
+        try:
+            today = parse_date(request.query_params.get('date'))
+        except ValueError:
+            return Response({'error': 'date doit être au format AAAA-MM-JJ'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ev_method = parse_ev_method(request.query_params.get('ev_method'))
+        except ValueError:
+            return Response({'error': f"ev_method doit valoir {' ou '.join(METHODES_EV)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(evm_projet(projet, today=today, ev_method=ev_method), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='evm')
+    def portfolio_evm(self, request):
+        """Indicateurs de la valeur acquise de tous les projets, avec le cumul du portefeuille"""
+        try:
+            today = parse_date(request.query_params.get('date'))
+        except ValueError:
+            return Response({'error': 'date doit être au format AAAA-MM-JJ'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ev_method = parse_ev_method(request.query_params.get('ev_method'))
+        except ValueError:
+            return Response({'error': f"ev_method doit valoir {' ou '.join(METHODES_EV)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        projet_ids = None
+        status_filter = request.query_params.get('status')
+        if status_filter:
+            projet_ids = Projet.objects.filter(status=status_filter).values_list('id', flat=True)
+        return Response(calculer_evm(projet_ids=projet_ids, today=today, ev_method=ev_method), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='latest-risk')
+    def latest_risk(self, request):
+        """Dernier instantané de risque de chaque projet du portefeuille (sans appel au modèle)"""
+        latest_ids = RiskSnapshot.objects.filter(projet=OuterRef('projet')).order_by('-date').values('id')[:1]
+        snapshots = (
+            RiskSnapshot.objects.filter(id=Subquery(latest_ids))
+            .select_related('projet')
+            .order_by('-risk_score')
+        )
+        risk_level = request.query_params.get('risk_level')
+        if risk_level:
+            snapshots = snapshots.filter(risk_level=risk_level)
+        return Response(RiskSnapshotSerializer(snapshots, many=True).data, status=status.HTTP_200_OK)
 
 
 class ChantierViewSet(BaseViewSet):
@@ -200,24 +320,23 @@ class ChantierViewSet(BaseViewSet):
 
     def perform_create(self, serializer):
         try:
-            chantier = serializer.save()
-            # Recalculer l'avancement du chantier après création
-            try:
-                chantier.progress = chantier.calculer_avancement()
-                chantier.save()
-            except Exception:
-                # Si le calcul échoue, garder le progress par défaut
-                pass
-            
-            # Synchronise le statut du projet après création d'un chantier
-            if chantier.projet:
+            with unite_de_travail() as carte:
+                chantier = carte.ajouter(serializer.save(), remplacer=True)
+                # Recalculer l'avancement du chantier après création
                 try:
-                    projet = chantier.projet
-                    projet.status = projet.synchroniser_statut()
-                    projet.save()
+                    chantier.progress = chantier.calculer_avancement()
+                    carte.marquer(chantier, 'progress')
                 except Exception:
-                    # Si la synchronisation échoue, continuer quand même
+                    # Si le calcul échoue, garder le progress par défaut
                     pass
+                
+                # Synchronise le statut du projet après création d'un chantier
+                if chantier.projet_id:
+                    try:
+                        _synchroniser_projet(carte, carte.parent(chantier, 'projet'))
+                    except Exception:
+                        # Si la synchronisation échoue, continuer quand même
+                        pass
         except Exception as e:
             logger.error(f'Error in ChantierViewSet.perform_create: {str(e)}')
             import traceback
@@ -225,20 +344,35 @@ class ChantierViewSet(BaseViewSet):
             raise
 
     def perform_update(self, serializer):
-        chantier = serializer.save()
-        # Synchronise le statut du projet après mise à jour
-        if chantier.projet:
-            projet = chantier.projet
-            projet.status = projet.synchroniser_statut()
-            projet.save()
+        with unite_de_travail() as carte:
+            chantier = carte.ajouter(serializer.save(), remplacer=True)
+            # Synchronise le statut du projet (et de l'ancien projet) si le chantier le concerne
+            if chantier.a_change(*CHAMPS_CASCADE_CHANTIER):
+                _synchroniser_projet(carte, carte.parent(chantier, 'projet'))
+                if chantier.a_change('projet'):
+                    _synchroniser_projet(carte, carte.get(Projet, chantier.valeur_precedente('projet')))
 
     def perform_destroy(self, instance):
-        projet = instance.projet
-        instance.delete()
-        # Synchronise le statut du projet après suppression
-        if projet:
-            projet.status = projet.synchroniser_statut()
-            projet.save()
+        with unite_de_travail() as carte:
+            projet = carte.parent(instance, 'projet')
+            instance.delete()
+            # Synchronise le statut du projet après suppression
+            _synchroniser_projet(carte, projet)
+
+    @action(detail=True, methods=['get'], url_path='evm')
+    def evm(self, request, pk=None):
+        """Indicateurs de la valeur acquise du chantier"""
+        chantier = self.get_object()
+        try:
+            today = parse_date(request.query_params.get('date'))
+        except ValueError:
+            return Response({'error': 'date doit être au format AAAA-MM-JJ'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ev_method = parse_ev_method(request.query_params.get('ev_method'))
+        except ValueError:
+            return Response({'error': f"ev_method doit valoir {' ou '.join(METHODES_EV)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(evm_chantier(chantier, today=today, ev_method=ev_method), status=status.HTTP_200_OK)
 
 
 class LotViewSet(BaseViewSet):
@@ -252,45 +386,26 @@ class LotViewSet(BaseViewSet):
         return qs
 
     def perform_create(self, serializer):
-        lot = serializer.save()
-        # Recalcule l'avancement et synchronise le statut du chantier
-        if lot.chantier:
-            chantier = lot.chantier
-            chantier.progress = chantier.calculer_avancement()
-            chantier.status = chantier.synchroniser_statut()
-            chantier.save()
-            # Synchronise le statut du projet
-            if chantier.projet:
-                projet = chantier.projet
-                projet.status = projet.synchroniser_statut()
-                projet.save()
+        with unite_de_travail() as carte:
+            lot = carte.ajouter(serializer.save(), remplacer=True)
+            # Recalcule l'avancement et synchronise le statut du chantier et du projet
+            _synchroniser_chantier(carte, carte.parent(lot, 'chantier'))
 
     def perform_update(self, serializer):
-        lot = serializer.save()
-        # Recalcule l'avancement et synchronise le statut du chantier
-        if lot.chantier:
-            chantier = lot.chantier
-            chantier.progress = chantier.calculer_avancement()
-            chantier.status = chantier.synchroniser_statut()
-            chantier.save()
-            # Synchronise le statut du projet
-            if chantier.projet:
-                projet = chantier.projet
-                projet.status = projet.synchroniser_statut()
-                projet.save()
+        with unite_de_travail() as carte:
+            lot = carte.ajouter(serializer.save(), remplacer=True)
+            # Recalcule le chantier et le projet (et l'ancien chantier) si le lot les concerne
+            if lot.a_change(*CHAMPS_CASCADE_LOT):
+                _synchroniser_chantier(carte, carte.parent(lot, 'chantier'))
+                if lot.a_change('chantier'):
+                    _synchroniser_chantier(carte, carte.get(Chantier, lot.valeur_precedente('chantier')))
 
     def perform_destroy(self, instance):
-        chantier = instance.chantier
-        projet = chantier.projet if chantier else None
-        instance.delete()
-        # Recalcule l'avancement et synchronise le statut après suppression
-        if chantier:
-            chantier.progress = chantier.calculer_avancement()
-            chantier.status = chantier.synchroniser_statut()
-            chantier.save()
-            if projet:
-                projet.status = projet.synchroniser_statut()
-                projet.save()
+        with unite_de_travail() as carte:
+            chantier = carte.parent(instance, 'chantier')
+            instance.delete()
+            # Recalcule l'avancement et synchronise le statut après suppression
+            _synchroniser_chantier(carte, chantier)
 
 
 class TacheViewSet(BaseViewSet):
@@ -303,63 +418,35 @@ class TacheViewSet(BaseViewSet):
             qs = qs.filter(lot_id=lot_id)
         return qs
 
+    # Le lot, le chantier et le projet sont recalculés par les signaux de la tâche
+    # (tache_post_save / tache_post_delete), seulement si un champ utile a changé ;
+    # l'unité de travail les enregistre une seule fois, à la fin de l'opération
+
     def perform_create(self, serializer):
-        tache = serializer.save()
-        # Recalcule l'avancement et synchronise le statut du lot
-        if tache.lot:
-            lot = tache.lot
-            lot.progress = lot.calculer_avancement()
-            lot.status = lot.synchroniser_statut()
-            lot.save()
-            # Recalcule l'avancement et synchronise le statut du chantier parent
-            if lot.chantier:
-                chantier = lot.chantier
-                chantier.progress = chantier.calculer_avancement()
-                chantier.status = chantier.synchroniser_statut()
-                chantier.save()
-                # Synchronise le statut du projet
-                if chantier.projet:
-                    projet = chantier.projet
-                    projet.status = projet.synchroniser_statut()
-                    projet.save()
+        with unite_de_travail():
+            serializer.save()
 
     def perform_update(self, serializer):
-        tache = serializer.save()
-        # Recalcule l'avancement et synchronise le statut du lot
-        if tache.lot:
-            lot = tache.lot
-            lot.progress = lot.calculer_avancement()
-            lot.status = lot.synchroniser_statut()
-            lot.save()
-            # Recalcule l'avancement et synchronise le statut du chantier parent
-            if lot.chantier:
-                chantier = lot.chantier
-                chantier.progress = chantier.calculer_avancement()
-                chantier.status = chantier.synchroniser_statut()
-                chantier.save()
-                # Synchronise le statut du projet
-                if chantier.projet:
-                    projet = chantier.projet
-                    projet.status = projet.synchroniser_statut()
-                    projet.save()
+        with unite_de_travail():
+            serializer.save()
 
     def perform_destroy(self, instance):
-        lot = instance.lot
-        chantier = lot.chantier if lot else None
-        projet = chantier.projet if chantier else None
-        instance.delete()
-        # Recalcule l'avancement et synchronise le statut après suppression
-        if lot:
-            lot.progress = lot.calculer_avancement()
-            lot.status = lot.synchroniser_statut()
-            lot.save()
-            if chantier:
-                chantier.progress = chantier.calculer_avancement()
-                chantier.status = chantier.synchroniser_statut()
-                chantier.save()
-                if projet:
-                    projet.status = projet.synchroniser_statut()
-                    projet.save()
+        with unite_de_travail():
+            instance.delete()
+
+
+class TacheDependanceViewSet(BaseViewSet):
+    serializer_class = TacheDependanceSerializer
+
+    def get_queryset(self):
+        qs = TacheDependance.objects.select_related('predecesseur', 'successeur').order_by('created_at')
+        projet_id = self.request.query_params.get('projet_id')
+        if projet_id:
+            qs = qs.filter(projet_id=projet_id)
+        tache_id = self.request.query_params.get('tache_id')
+        if tache_id:
+            qs = qs.filter(Q(predecesseur_id=tache_id) | Q(successeur_id=tache_id))
+        return qs
 
 
 @api_view(['POST'])
@@ -396,34 +483,28 @@ def login(request):
         email = serializer.validated_data['email']
         mot_de_passe = serializer.validated_data['mot_de_passe']
         
-        utilisateur = None
-        # 1) Tentative avec notre modèle Utilisateur
-        try:
-            utilisateur = Utilisateur.objects.get(email=email)
-            if not utilisateur.check_password(mot_de_passe):
-                utilisateur = None  # mot de passe invalide -> fallback django auth
-        except Utilisateur.DoesNotExist:
-            utilisateur = None
+        # Limitation des échecs par IP et par compte, avant tout hachage de mot de passe
+        retry_after = login_security.attente(request, email)
+        if retry_after:
+            response = Response({
+                'error': 'Trop de tentatives de connexion. Veuillez réessayer plus tard.',
+                'retry_after': retry_after
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(retry_after)
+            return response
         
-        # 2) Fallback: accepter les identifiants du superuser/staff Django (auth.User)
-        if utilisateur is None:
-            django_user = authenticate(request, username=email, password=mot_de_passe) or authenticate(request, username=email.split('@')[0], password=mot_de_passe)
-            if django_user and (getattr(django_user, 'is_staff', False) or getattr(django_user, 'is_superuser', False)):
-                # Auto-provisionner un Utilisateur correspondant s'il n'existe pas
-                try:
-                    utilisateur = Utilisateur.objects.get(email=django_user.email or email)
-                except Utilisateur.DoesNotExist:
-                    utilisateur = Utilisateur(
-                        nom=getattr(django_user, 'username', 'Admin'),
-                        email=django_user.email or email,
-                        mot_de_passe=mot_de_passe,
-                        role='ADMINISTRATEUR',
-                        is_active=True,
-                        is_approved=True,
-                    )
-                    utilisateur.save()
-            else:
-                return Response({'error': 'Email ou mot de passe incorrect'}, status=status.HTTP_401_UNAUTHORIZED)
+        # Un seul hachage : Utilisateur, sinon superuser/staff Django (auth.User), sinon hash factice
+        compte = login_security.verifier_identifiants(email, mot_de_passe)
+        if compte is None:
+            login_security.enregistrer_echec(request, email)
+            return Response({'error': 'Email ou mot de passe incorrect'}, status=status.HTTP_401_UNAUTHORIZED)
+        login_security.reinitialiser(request, email)
+        
+        if isinstance(compte, Utilisateur):
+            utilisateur = compte
+        else:
+            # Auto-provisionner un Utilisateur correspondant au compte staff s'il n'existe pas
+            utilisateur = login_security.provisionner_admin(compte, email, mot_de_passe)
         
         # Vérifier si le compte est actif/validé côté app
         if not utilisateur.is_active:
@@ -441,10 +522,12 @@ def login(request):
                 refresh['email'] = str(utilisateur.email)
                 refresh['role'] = str(utilisateur.role)
                 refresh['user_id'] = str(utilisateur.id)
+                refresh['is_approved'] = bool(utilisateur.is_approved)
                 access_token = refresh.access_token
                 access_token['email'] = str(utilisateur.email)
                 access_token['role'] = str(utilisateur.role)
                 access_token['user_id'] = str(utilisateur.id)
+                access_token['is_approved'] = bool(utilisateur.is_approved)
             except Exception as token_error:
                 logger.warning(f"RefreshToken.for_user() a échoué, création manuelle: {str(token_error)}")
                 from rest_framework_simplejwt.tokens import RefreshToken as RT
@@ -453,10 +536,12 @@ def login(request):
                 refresh['user_id'] = user_id
                 refresh['email'] = str(utilisateur.email)
                 refresh['role'] = str(utilisateur.role)
+                refresh['is_approved'] = bool(utilisateur.is_approved)
                 access_token = refresh.access_token
                 access_token['user_id'] = user_id
                 access_token['email'] = str(utilisateur.email)
                 access_token['role'] = str(utilisateur.role)
+                access_token['is_approved'] = bool(utilisateur.is_approved)
         
             # Sérialiser l'utilisateur
             user_data = UtilisateurListSerializer(utilisateur).data
@@ -544,7 +629,8 @@ class UtilisateurViewSet(BaseViewSet):
     def approve(self, request, pk=None):
         """Approuver un utilisateur (seulement pour les admins)"""
         current_user = get_user_from_request(request)
-        if not current_user or current_user.role != 'ADMINISTRATEUR':
+        # Écriture : le rôle du jeton est revérifié sur le compte
+        if not current_user or current_user.role != 'ADMINISTRATEUR' or current_user.verifier_compte() is None:
             return Response({'error': 'Accès refusé. Seuls les administrateurs peuvent approuver des utilisateurs.'}, 
                           status=status.HTTP_403_FORBIDDEN)
         
@@ -560,7 +646,8 @@ class UtilisateurViewSet(BaseViewSet):
     def reject(self, request, pk=None):
         """Rejeter un utilisateur (seulement pour les admins)"""
         current_user = get_user_from_request(request)
-        if not current_user or current_user.role != 'ADMINISTRATEUR':
+        # Écriture : le rôle du jeton est revérifié sur le compte
+        if not current_user or current_user.role != 'ADMINISTRATEUR' or current_user.verifier_compte() is None:
             return Response({'error': 'Accès refusé. Seuls les administrateurs peuvent rejeter des utilisateurs.'}, 
                           status=status.HTTP_403_FORBIDDEN)
         
@@ -647,7 +734,19 @@ class IAViewSet(BaseViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            prediction = ia.predict_delay_risk(projet)
+            try:
+                latency_budget_ms = parse_latency_budget(request.data.get('latency_budget_ms'))
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'latency_budget_ms doit être un nombre positif'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            explain = parse_flag(request.data.get('explain'))
+            prediction = singleflight.do(
+                ('predict_delay', str(ia.id), str(projet.id), latency_budget_ms, explain),
+                lambda: predict_within(ia, projet, ['delay'], latency_budget_ms, explain)['delay']
+            )
             return Response(prediction, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -680,7 +779,19 @@ class IAViewSet(BaseViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            prediction = ia.predict_budget_overrun(projet)
+            try:
+                latency_budget_ms = parse_latency_budget(request.data.get('latency_budget_ms'))
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'latency_budget_ms doit être un nombre positif'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            explain = parse_flag(request.data.get('explain'))
+            prediction = singleflight.do(
+                ('predict_budget', str(ia.id), str(projet.id), latency_budget_ms, explain),
+                lambda: predict_within(ia, projet, ['budget'], latency_budget_ms, explain)['budget']
+            )
             return Response(prediction, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -713,17 +824,33 @@ class IAViewSet(BaseViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            delay_prediction = None
-            budget_prediction = None
+            include_predictions = parse_flag(request.data.get('include_predictions'))
+            try:
+                latency_budget_ms = parse_latency_budget(request.data.get('latency_budget_ms'))
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'latency_budget_ms doit être un nombre positif'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
-            if request.data.get('include_predictions', False):
-                delay_prediction = ia.predict_delay_risk(projet)
-                budget_prediction = ia.predict_budget_overrun(projet)
+            def calculer():
+                delay_prediction = None
+                budget_prediction = None
+                
+                if include_predictions:
+                    predictions = predict_within(ia, projet, ['delay', 'budget'], latency_budget_ms)
+                    delay_prediction = predictions['delay']
+                    budget_prediction = predictions['budget']
+                
+                return ia.generate_recommendations(
+                    projet, 
+                    delay_prediction=delay_prediction,
+                    budget_prediction=budget_prediction
+                )
             
-            recommendations = ia.generate_recommendations(
-                projet, 
-                delay_prediction=delay_prediction,
-                budget_prediction=budget_prediction
+            # Requêtes identiques simultanées : un seul calcul partagé
+            recommendations = singleflight.do(
+                ('get_recommendations', str(ia.id), str(projet.id), include_predictions, latency_budget_ms), calculer
             )
             
             return Response({
@@ -761,28 +888,30 @@ class IAViewSet(BaseViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Calculer toutes les prédictions
-            delay_prediction = ia.predict_delay_risk(projet)
-            budget_prediction = ia.predict_budget_overrun(projet)
-            recommendations = ia.generate_recommendations(
-                projet,
-                delay_prediction=delay_prediction,
-                budget_prediction=budget_prediction
-            )
+            try:
+                latency_budget_ms = parse_latency_budget(request.data.get('latency_budget_ms'))
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'latency_budget_ms doit être un nombre positif'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
-            return Response({
-                'projet_id': str(projet.id),
-                'projet_name': projet.name,
-                'delay_prediction': delay_prediction,
-                'budget_prediction': budget_prediction,
-                'recommendations': recommendations,
-                'summary': {
-                    'delay_risk_level': delay_prediction.get('risk_level', 'moyen'),
-                    'budget_risk_level': budget_prediction.get('risk_level', 'moyen'),
-                    'total_recommendations': len(recommendations),
-                    'high_priority_recommendations': len([r for r in recommendations if r.get('priority') == 'high'])
-                }
-            }, status=status.HTTP_200_OK)
+            explain = parse_flag(request.data.get('explain'))
+            
+            if parse_flag(request.data.get('async')):
+                # Mode asynchrone : le calcul est fait en arrière-plan, le résultat est lu sur ia/jobs/<id>/
+                job, cree = soumettre_job(ia, projet, latency_budget_ms, explain)
+                data = AnalysisJobSerializer(job).data
+                data['reused'] = not cree
+                data['status_url'] = reverse('ia-job', kwargs={'job_id': str(job.id)}, request=request)
+                return Response(data, status=status.HTTP_202_ACCEPTED)
+            
+            # Page d'analyse partagée : les requêtes simultanées attendent le même calcul
+            analyse = singleflight.do(
+                ('full_analysis', str(ia.id), str(projet.id), latency_budget_ms, explain),
+                lambda: analyse_complete(ia, projet, latency_budget_ms, explain)
+            )
+            return Response(analyse, status=status.HTTP_200_OK)
             
         except Exception as e:
             import traceback
@@ -794,6 +923,171 @@ class IAViewSet(BaseViewSet):
             )
 
 
+    @action(detail=True, methods=['post'], permission_classes=[AllowAny])
+    def what_if(self, request, pk=None):
+        """
+        Simule le risque d'un projet sur une grille de scénarios avant de modifier son budget
+        ou son échéance : budget_changes (variations en %) x duration_changes (décalages en jours)
+        """
+        try:
+            ia = self.get_object()
+            projet_id = request.data.get('projet_id')
+            
+            if not projet_id:
+                return Response(
+                    {'error': 'projet_id est requis'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            try:
+                projet = Projet.objects.get(id=projet_id)
+            except Projet.DoesNotExist:
+                return Response(
+                    {'error': 'Projet non trouvé'}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            
+            try:
+                budget_changes = parse_axis(request.data.get('budget_changes'), float)
+                duration_changes = parse_axis(request.data.get('duration_changes'), int)
+                simulation = what_if(ia.get_ml_service(), projet, budget_changes, duration_changes)
+            except (TypeError, ValueError) as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except RuntimeError as e:
+                return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            
+            return Response(simulation, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            import traceback
+            logger.error(f'Error in what_if: {str(e)}')
+            logger.error(traceback.format_exc())
+            return Response(
+                {'error': 'Erreur lors de la simulation', 'detail': str(e) if DEBUG else None},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=True, methods=['post'], permission_classes=[AllowAny])
+    def simulate_completion(self, request, pk=None):
+        """
+        Simulation Monte Carlo de la date d'achèvement d'un projet (P50 / P80 / P95 et histogramme).
+        Paramètres : projet_id, iterations (défaut 10000), seed, bins, correlation.
+        """
+        try:
+            self.get_object()
+            projet_id = request.data.get('projet_id')
+            
+            if not projet_id:
+                return Response(
+                    {'error': 'projet_id est requis'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            try:
+                projet = Projet.objects.get(id=projet_id)
+            except Projet.DoesNotExist:
+                return Response(
+                    {'error': 'Projet non trouvé'}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            
+            try:
+                seed = request.data.get('seed')
+                simulation = simulate_completion(
+                    projet,
+                    iterations=int(request.data.get('iterations', DEFAULT_ITERATIONS)),
+                    seed=int(seed) if seed not in (None, '') else None,
+                    bins=int(request.data.get('bins', DEFAULT_BINS)),
+                    correlation=float(request.data.get('correlation', DEFAULT_CORRELATION)),
+                )
+            except (TypeError, ValueError) as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            return Response(simulation, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            import traceback
+            logger.error(f'Error in simulate_completion: {str(e)}')
+            logger.error(traceback.format_exc())
+            return Response(
+                {'error': 'Erreur lors de la simulation', 'detail': str(e) if DEBUG else None},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['post'], permission_classes=[EstAdministrateur])
+    def generer_alertes(self, request):
+        """
+        Génère en lot les alertes IA du portefeuille (dédupliquées contre les alertes ouvertes).
+        Écriture sur tout le portefeuille : réservée aux administrateurs, compte revérifié.
+        """
+        if request.user.verifier_compte() is None:
+            return Response({'error': 'Accès refusé. Compte introuvable, désactivé ou modifié : reconnectez-vous.'},
+                            status=status.HTTP_403_FORBIDDEN)
+        try:
+            projet_ids = request.data.get('projet_ids')
+            ia_ids = request.data.get('ia_ids')
+            projets = list(Projet.objects.filter(id__in=projet_ids)) if projet_ids else None
+            ias = list(IA.objects.filter(id__in=ia_ids)) if ia_ids else None
+            rapport = IA.genererAlertesEnLot(projets=projets, ias=ias)
+            return Response(rapport, status=status.HTTP_200_OK)
+        except Exception as e:
+            import traceback
+            logger.error(f'Error in generer_alertes: {str(e)}')
+            logger.error(traceback.format_exc())
+            return Response(
+                {'error': 'Erreur lors de la génération des alertes', 'detail': str(e) if DEBUG else None},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[^/.]+)', url_name='job',
+            permission_classes=[AllowAny])
+    def job(self, request, job_id=None):
+        """Statut et résultat d'une analyse asynchrone (full_analysis avec async)"""
+        try:
+            job = lire_job(job_id)
+            if job is None:
+                return Response({'error': 'Job non trouvé ou expiré'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(AnalysisJobSerializer(job).data, status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error(f'Error in job: {str(e)}')
+            return Response(
+                {'error': 'Erreur lors de la lecture du job', 'detail': str(e) if DEBUG else None},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def metrics(self, request):
+        """
+        Métriques internes d'inférence du worker (durées par étape, résultats par modèle,
+        dérive des features). Protégé par l'en-tête X-Metrics-Token (settings.ML_METRICS_TOKEN),
+        accessible sans jeton uniquement en DEBUG.
+        """
+        token = getattr(settings, 'ML_METRICS_TOKEN', '')
+        if token:
+            if not hmac.compare_digest(request.headers.get('X-Metrics-Token', ''), token):
+                return Response({'error': 'Accès refusé'}, status=status.HTTP_403_FORBIDDEN)
+        elif not DEBUG:
+            return Response({'error': 'Accès refusé'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            from .ml_metrics import ml_metrics
+            from .ml_registry import registry
+            from .ml_service import ml_service
+            data = ml_metrics.snapshot()
+            data['models'] = {
+                'version': ml_service.model_version,
+                'loaded': ml_service.models_loaded,
+                'variants': registry.loaded(),
+            }
+            return Response(data, status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error(f'Error in metrics: {str(e)}')
+            return Response(
+                {'error': 'Erreur lors de la lecture des métriques', 'detail': str(e) if DEBUG else None},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
 class AlerteViewSet(BaseViewSet):
     serializer_class = AlerteSerializer
 
@@ -843,6 +1137,17 @@ class AlerteViewSet(BaseViewSet):
                 logger.error(f'Error in AlerteViewSet.list fallback: {str(e)}')
                 return Response([], status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def resoudre(self, request, pk=None):
+        """Clôt une alerte : une nouvelle alerte IA de même empreinte peut ensuite être créée"""
+        current_user = get_user_from_request(request)
+        if current_user is None or current_user.verifier_compte() is None:
+            return Response({'error': 'Accès refusé'}, status=status.HTTP_403_FORBIDDEN)
+        alerte = self.get_object()
+        if not alerte.resoudre():
+            return Response({'error': 'Alerte déjà résolue'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(alerte).data, status=status.HTTP_200_OK)
+
 
 class BudgetViewSet(BaseViewSet):
     serializer_class = BudgetSerializer